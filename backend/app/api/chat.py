@@ -1,20 +1,46 @@
 """聊天API路由模块。"""
 
+import asyncio
 import json
+import time
 import uuid
-from typing import Annotated, AsyncGenerator, Dict, List
+from typing import Annotated, Any, AsyncGenerator, Dict, List, Optional
 
-from fastapi import APIRouter, Body, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import StreamingResponse
 from loguru import logger
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, ValidationError
 
+from app.config.configuration import get_setting
 from app.core.agent import ChatAgent
+from app.core.idempotency import get_turn_registry
+from app.core.lifecycle import lifecycle
+from app.services.usage import get_usage_meter, seconds_until_next_day
+from app.services.blob_store import Attachment, get_blob_store
+from app.utils.logging import truncate
+from app.utils.sse import sse_event, sse_response
+from app.utils.telemetry import (
+    AGENT_CREATE_SECONDS,
+    DUPLICATE_SUBMISSIONS,
+    SSE_BYTES_PER_TURN,
+    SSE_BYTES_SENT,
+    generator_span,
+    tracer,
+)
 
 
 class MessagePart(BaseModel):
+    """消息片段，支持 text、file 与 data-* 类型，其他类型忽略。"""
+
+    model_config = ConfigDict(extra="allow")
+
     type: str
-    text: str
+    text: Optional[str] = None
+    mediaType: Optional[str] = None
+    filename: Optional[str] = None
+    url: Optional[str] = None
+    data: Any = None
 
 
 class RequestMessage(BaseModel):
@@ -24,13 +50,109 @@ class RequestMessage(BaseModel):
 
 
 class RequestBody(BaseModel):
+    """完整请求体：客户端每轮上传全部历史消息（兼容旧协议）。"""
+
     id: str
     messages: List[RequestMessage]
     trigger: str
+    model: Optional[str] = None
+
+
+class DeltaRequestBody(BaseModel):
+    """增量请求体：只携带新消息，对话历史以服务端为准。
+
+    lastMessageId 为客户端在新消息之前最后一条消息的ID，
+    服务端据此对齐历史（例如重新生成或编辑消息时截断）。
+    model 为该对话指定的模型，是 LLM_OVERRIDE_MODELS 中的模型时对后续轮次生效且不做模型路由；
+    其他值（包括 LLM_MODEL 与未配置的模型名）视为不指定，使用默认的模型路由。
+    """
+
+    id: str
+    message: RequestMessage
+    lastMessageId: Optional[str] = None
+    trigger: str = "submit-message"
+    model: Optional[str] = None
 
 
-# 定义SSE事件前缀
-DATA_PREFIX = "data: "
+def parse_request_body(raw: bytes) -> DeltaRequestBody:
+    """宽松解析聊天请求体。
+
+    增量协议只校验新消息，解析开销与对话长度无关；
+    完整协议只校验最后一条消息，其余历史由服务端维护，不再逐条校验。
+
+    Args:
+        raw: 原始请求体
+
+    Returns:
+        统一的增量请求体
+
+    Raises:
+        RequestValidationError: 请求体不是合法JSON或缺少必要字段
+    """
+    try:
+        data: Any = json.loads(raw)
+        if isinstance(data, dict) and "message" in data:
+            return DeltaRequestBody.model_validate(data)
+
+        messages = data["messages"]
+        return DeltaRequestBody(
+            id=data["id"],
+            message=RequestMessage.model_validate(messages[-1]),
+            lastMessageId=messages[-2].get("id") if len(messages) > 1 else None,
+            trigger=data.get("trigger", "submit-message"),
+            model=data.get("model"),
+        )
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(), body=raw)
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+        raise RequestValidationError(
+            [{"type": "invalid_body", "loc": ("body",), "msg": f"无效的请求体: {e}"}],
+            body=raw,
+        )
+
+
+async def get_request_body(request: Request) -> DeltaRequestBody:
+    """读取并解析请求体（依赖注入）。
+
+    Args:
+        request: FastAPI请求对象
+
+    Returns:
+        统一的增量请求体
+    """
+    return parse_request_body(await request.body())
+
+
+async def read_message_content(
+    message: RequestMessage,
+) -> tuple[str, List[Attachment]]:
+    """提取消息中的文本与附件。
+
+    文件part写入附件存储或按引用保留，data-* part 以JSON文本传给模型。
+
+    Args:
+        message: 请求消息
+
+    Returns:
+        文本内容与附件引用列表
+    """
+    texts: List[str] = []
+    attachments: List[Attachment] = []
+    for part in message.parts:
+        if part.type == "text" and part.text:
+            texts.append(part.text)
+        elif part.type == "file" and part.url:
+            attachments.append(
+                await get_blob_store().ingest_url(
+                    part.url,
+                    part.mediaType or "application/octet-stream",
+                    part.filename,
+                )
+            )
+        elif part.type.startswith("data-") and part.data is not None:
+            texts.append(json.dumps(part.data, ensure_ascii=False))
+    return "\n".join(texts), attachments
+
 
 system_prompt = """你是一个AI助手
 """
@@ -42,35 +164,118 @@ class AgentManager:
     def __init__(self):
         """初始化AgentManager。"""
         self.agents: Dict[str, ChatAgent] = {}
+        # 预先连接好MCP服务的备用Agent，新对话直接领取
+        self.spares: List[ChatAgent] = []
+        self.spare_target: int = 0
+        # 正在创建中的备用Agent数，避免并发补充时重复创建
+        self._spares_creating: int = 0
+        self._replenish_tasks: set[asyncio.Task] = set()
 
-    async def get_agent(self, user_id: str, chat_id: str) -> ChatAgent:
-        """获取或创建用户的ChatAgent实例。
+    async def create_agent(self, user_id: str, chat_id: str) -> ChatAgent:
+        """创建并连接ChatAgent。
 
         Args:
             user_id: 用户ID
             chat_id: 对话id
+
         Returns:
             ChatAgent实例
         """
-        if chat_id not in self.agents:
-            logger.debug(f"对话: {chat_id} 不存在Agent。")
+        start = time.perf_counter()
+        with tracer.start_as_current_span(
+            "agent.create", attributes={"chat.id": chat_id}
+        ):
             agent = ChatAgent(
                 user_id=user_id,
                 chat_id=chat_id,
                 system_prompt=system_prompt,
             )
             await agent.connect()
+        AGENT_CREATE_SECONDS.observe(time.perf_counter() - start)
+        return agent
+
+    async def prewarm(self, count: int) -> None:
+        """预先创建备用Agent，直到数量达到 count。
+
+        Args:
+            count: 备用Agent数量
+        """
+        self.spare_target = count
+        missing = count - len(self.spares) - self._spares_creating
+        if missing <= 0:
+            return
+        self._spares_creating += missing
+        try:
+            results = await asyncio.gather(
+                *(
+                    self.create_agent(
+                        user_id="", chat_id=f"spare-{uuid.uuid4().hex[:8]}"
+                    )
+                    for _ in range(missing)
+                ),
+                return_exceptions=True,
+            )
+        finally:
+            self._spares_creating -= missing
+        surplus = []
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"预热Agent失败: {result}")
+            elif len(self.spares) < self.spare_target:
+                self.spares.append(result)
+            else:
+                # 创建期间目标数已满足（如目标下调），关闭多余的Agent及其MCP子进程
+                surplus.append(result)
+        if surplus:
+            await asyncio.gather(*(agent.close() for agent in surplus))
+        logger.info(f"已预热 {len(self.spares)} 个备用Agent")
+
+    async def get_agent(self, user_id: str, chat_id: str) -> ChatAgent:
+        """获取或创建用户的ChatAgent实例。
+
+        Args:
+            user_id: 用户ID
+            chat_id: 对话id
+        Returns:
+            ChatAgent实例
+        """
+        if chat_id not in self.agents:
+            logger.debug(f"对话: {chat_id} 不存在Agent。")
+            if self.spares:
+                # 领取备用Agent，并在后台补充
+                agent = self.spares.pop()
+                agent.user_id = user_id
+                agent.chat_id = chat_id
+                task = asyncio.create_task(self.prewarm(self.spare_target))
+                self._replenish_tasks.add(task)
+                task.add_done_callback(self._replenish_tasks.discard)
+            else:
+                agent = await self.create_agent(user_id, chat_id)
             self.agents[chat_id] = agent
             logger.debug(f"对话: {chat_id} Agent已创建。")
         return self.agents[chat_id]
 
+    def all_agents(self) -> List[ChatAgent]:
+        """返回所有Agent，包括备用Agent。"""
+        return [*self.agents.values(), *self.spares]
+
+    async def close_all(self) -> None:
+        """关闭所有Agent（包括备用Agent），释放MCP连接与子进程。"""
+        for task in list(self._replenish_tasks):
+            task.cancel()
+        agents = self.all_agents()
+        self.agents = {}
+        self.spares = []
+        await asyncio.gather(*(agent.close() for agent in agents))
+        logger.info(f"已关闭 {len(agents)} 个Agent")
+
 
 # 创建单例管理器
 manager = AgentManager()
 
 
 async def get_agent(
-    body: Annotated[RequestBody, Body(title="消息体")],
+    body: Annotated[DeltaRequestBody, Depends(get_request_body)],
     user_id: Annotated[str, Query(title="用户拆")],
 ) -> ChatAgent:
     """根据user_id返回ChatAgent实例（依赖注入）。
@@ -81,8 +286,32 @@ async def get_agent(
 
     Returns:
         ChatAgent实例
+
+    Raises:
+        HTTPException: 服务正在关闭时返回503，用户超出每日token配额时返回429
     """
-    return await manager.get_agent(user_id, body.id)
+    if not lifecycle.accepting:
+        raise HTTPException(
+            status_code=503, detail="服务正在关闭", headers={"Retry-After": "1"}
+        )
+    # 在创建Agent与调用LLM之前拒绝超出配额的用户
+    if not get_usage_meter().within_quota(user_id):
+        raise HTTPException(
+            status_code=429,
+            detail="今日token用量已超出配额",
+            headers={"Retry-After": str(seconds_until_next_day())},
+        )
+    setting = get_setting()
+    agent = await manager.get_agent(user_id, body.id)
+    if body.model is not None:
+        # 前端的模型选择不一定与服务端配置对应，未配置的模型不拒绝请求，按未指定处理
+        if body.model in setting.LLM_OVERRIDE_MODELS:
+            agent.model_override = body.model
+        else:
+            if body.model != setting.LLM_MODEL:
+                logger.debug(f"模型 {body.model} 不在 LLM_OVERRIDE_MODELS 中，使用默认模型")
+            agent.model_override = None
+    return agent
 
 
 # 创建路由器
@@ -90,13 +319,18 @@ router = APIRouter(prefix="/chat")
 
 
 async def event_generator(
-    agent: ChatAgent, user_message: str
+    agent: ChatAgent,
+    user_message: str,
+    message_id: Optional[str] = None,
+    attachments: Optional[List[Attachment]] = None,
 ) -> AsyncGenerator[str, None]:
     """生成SSE事件流。
 
     Args:
         agent: ChatAgent实例
         user_message: 用户消息
+        message_id: 用户消息ID
+        attachments: 用户消息的附件
 
     Yields:
         SSE格式的事件数据
@@ -104,32 +338,44 @@ async def event_generator(
     # answer = await agent.ask(user_message)
     # async for item in answer:
     #     yield item
-    try:
-        # 获取回复
-        answer = await agent.ask(user_message)
-        async for item in answer:
-            yield item
-    except Exception as e:
-        # 生成消息ID
-        message_id = str(uuid.uuid4())
-        # 发送开始事件
-        yield f"{DATA_PREFIX}{json.dumps({'id': message_id, 'type': 'text-start'})}\n\n"
-        logger.error(f"生成回复时出错: {e}")
-        error_message = {
-            "id": message_id,
-            "type": "text-delta",
-            "delta": f"处理您的请求时出现错误: {str(e)}",
-        }
-        yield f"{DATA_PREFIX}{json.dumps(error_message)}\n\n"
-        # 发送结束事件
-        yield f"{DATA_PREFIX}{json.dumps({'id': message_id, 'type': 'text-end'})}\n\n"
+    sent_bytes = 0
+    answer: AsyncGenerator[str, Any] | None = None
+    with generator_span("chat.turn", attributes={"chat.id": agent.chat_id}) as span:
+        try:
+            # 获取回复
+            answer = await agent.ask(user_message, message_id, attachments)
+            async for item in answer:
+                sent_bytes += len(item.encode("utf-8"))
+                yield item
+        except Exception as e:
+            # 生成消息ID
+            message_id = str(uuid.uuid4())
+            # 发送开始事件
+            yield sse_event({"id": message_id, "type": "text-start"})
+            logger.error(f"生成回复时出错: {e}")
+            error_message = {
+                "id": message_id,
+                "type": "text-delta",
+                "delta": f"处理您的请求时出现错误: {str(e)}",
+            }
+            yield sse_event(error_message)
+            # 发送结束事件
+            yield sse_event({"id": message_id, "type": "text-end"})
+        finally:
+            # 连接断开时立即关闭本轮的流，取消进行中的LLM调用与预取
+            if answer is not None:
+                await answer.aclose()
+            SSE_BYTES_SENT.inc(sent_bytes)
+            SSE_BYTES_PER_TURN.observe(sent_bytes)
+            span.set_attribute("sse.bytes_sent", sent_bytes)
 
 
 @router.post("/")
 async def chat(
-    body: RequestBody,
+    body: Annotated[DeltaRequestBody, Depends(get_request_body)],
     agent: Annotated[ChatAgent, Depends(get_agent)],
     user_id: Annotated[str, Query(title="用户id")],
+    request: Request,
 ) -> StreamingResponse:
     """处理聊天请求。
 
@@ -137,32 +383,59 @@ async def chat(
         body: FastAPI请求对象
         user_id
         agent: ChatAgent实例（通过依赖注入）
+        request: 原始请求，用于协商SSE压缩
 
     Returns:
         流式响应
     """
+    accept_encoding = request.headers.get("accept-encoding", "")
+    # 同一条消息的重复提交（客户端重试）复用已有的轮次，不再调用LLM与工具
+    registry = get_turn_registry()
+    key = registry.key(
+        user_id, body.id, body.lastMessageId, body.message.id, body.trigger
+    )
+    turn = None
+    if key is not None:
+        turn, created = registry.claim(key)
+        if not created:
+            state = "finished" if turn.done else "running"
+            DUPLICATE_SUBMISSIONS.labels(state).inc()
+            logger.info(f"对话 {body.id} 的消息 {body.message.id} 重复提交，复用{state}的轮次")
+            return sse_response(turn.subscribe(), accept_encoding)
+
+    def respond(generator: AsyncGenerator[str, None]) -> StreamingResponse:
+        # 可幂等的提交在后台任务中生成并广播，连接只订阅输出；
+        # 生成任务计入进行中的流，订阅随生成结束或取消而结束
+        if turn is not None:
+            turn.start(generator)
+            return sse_response(turn.subscribe(), accept_encoding)
+        return sse_response(generator, accept_encoding, wrap=lifecycle.track)
+
     try:
-        logger.debug(body.model_dump_json())
-        user_content = body.messages[-1].parts[0].text
+        logger.opt(lazy=True).debug(
+            "请求体: {}", lambda: truncate(body.model_dump_json())
+        )
+        # 以客户端最后已知的消息对齐服务端历史
+        agent.sync_history(body.lastMessageId)
+        user_content, attachments = await read_message_content(body.message)
         # 获取最后一条消息
-        if not user_content:
-            return StreamingResponse(
-                event_generator(agent, "请提供消息内容"),
-                media_type="text/event-stream",
-            )
+        if not user_content and not attachments:
+            return respond(event_generator(agent, "请提供消息内容", body.message.id))
 
         # 返回流式响应
-        return StreamingResponse(
-            event_generator(agent, user_content), media_type="text/event-stream"
+        return respond(
+            event_generator(agent, user_content, body.message.id, attachments)
         )
     except Exception as e:
         logger.error(f"处理聊天请求时出错: {str(e)}")
+        if key is not None:
+            registry.discard(key)
 
         # 返回错误响应
         async def error_generator():
             message_id = str(uuid.uuid4())
-            yield f"{DATA_PREFIX}{json.dumps({'id': message_id, 'type': 'text-start'})}\n\n"
-            yield f"{DATA_PREFIX}{json.dumps({'id': message_id, 'type': 'text-delta', 'delta': '处理请求时出错'})}\n\n"
-            yield f"{DATA_PREFIX}{json.dumps({'id': message_id, 'type': 'text-end'})}\n\n"
+            yield sse_event({"id": message_id, "type": "text-start"})
+            yield sse_event({"id": message_id, "type": "text-delta", "delta": "处理请求时出错"})
+            yield sse_event({"id": message_id, "type": "text-end"})
 
-        return StreamingResponse(error_generator(), media_type="text/event-stream")
+        return sse_response(error_generator(), accept_encoding)
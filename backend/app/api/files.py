@@ -0,0 +1,92 @@
+"""附件上传与下载路由模块。"""
+
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+from loguru import logger
+
+from app.core.exception import BlobTooLargeException
+from app.services.blob_store import get_blob_store
+
+# 创建路由器
+router = APIRouter(prefix="/files")
+
+# 可以在浏览器中直接打开的媒体类型，其余类型（如 text/html、image/svg+xml）一律作为下载返回，
+# 避免上传的内容在API源下执行脚本
+INLINE_MEDIA_TYPES = frozenset(
+    {
+        "image/png",
+        "image/jpeg",
+        "image/gif",
+        "image/webp",
+        "text/plain",
+        "application/pdf",
+    }
+)
+
+
+@router.post("/")
+async def upload_file(
+    request: Request,
+    filename: Annotated[Optional[str], Query(title="文件名")] = None,
+) -> dict:
+    """上传附件，请求体为文件原始内容。
+
+    请求体按块流式写入存储，不在内存中缓存完整文件；相同内容只保存一份。
+
+    Args:
+        request: FastAPI请求对象，Content-Type 为文件的媒体类型
+        filename: 原始文件名
+
+    Returns:
+        附件信息，url 可直接作为前端文件part的url
+    """
+    media_type = request.headers.get("content-type", "application/octet-stream")
+    try:
+        attachment = await get_blob_store().put_stream(
+            request.stream(), media_type, filename
+        )
+    except BlobTooLargeException as e:
+        logger.warning(f"上传附件失败: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+
+    logger.info(f"附件已上传: {attachment.blob_id}, 大小: {attachment.size}")
+    return {
+        "id": attachment.blob_id,
+        "url": f"{request.scope.get('root_path', '')}/api/files/{attachment.blob_id}",
+        "mediaType": attachment.media_type,
+        "filename": attachment.filename,
+        "size": attachment.size,
+    }
+
+
+@router.get("/{blob_id}")
+async def download_file(blob_id: str) -> FileResponse:
+    """下载附件。
+
+    媒体类型由上传方提供，只有 ``INLINE_MEDIA_TYPES`` 中的类型内联返回，其余作为下载；
+    同时禁止浏览器嗅探内容类型，并以沙箱CSP返回，内容中的脚本不会执行。
+
+    Args:
+        blob_id: 附件ID
+
+    Returns:
+        附件内容
+    """
+    blob_store = get_blob_store()
+    if not blob_store.exists(blob_id):
+        raise HTTPException(status_code=404, detail="附件不存在")
+    media_type = blob_store.media_type(blob_id)
+    essence = media_type.split(";", 1)[0].strip().lower()
+    return FileResponse(
+        blob_store.path(blob_id),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": "inline"
+            if essence in INLINE_MEDIA_TYPES
+            else "attachment",
+            "X-Content-Type-Options": "nosniff",
+            "Content-Security-Policy": "default-src 'none'; sandbox",
+        },
+    )
@@ -0,0 +1,56 @@
+"""就绪与深度健康检查路由模块。
+
+只读取后台探测缓存的结果，不访问任何外部依赖，可以被高频轮询。
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.api.chat import manager
+from app.core.health import health_monitor
+from app.core.lifecycle import lifecycle
+from app.utils.loop_monitor import loop_monitor
+
+# 创建路由器
+router = APIRouter()
+
+
+@router.get("/ready")
+async def readiness() -> JSONResponse:
+    """就绪检查，负载均衡据此决定是否转发流量。
+
+    服务正在关闭、依赖尚未完成首次探测或有依赖探测失败时返回503；
+    依赖暂时受限（degraded，如LLM限流）时仍然就绪。
+    """
+    failures = health_monitor.failures()
+    ready = lifecycle.accepting and health_monitor.probed and not failures
+    if not lifecycle.accepting:
+        reason = "服务正在关闭"
+    elif not health_monitor.probed:
+        reason = "依赖尚未完成探测"
+    else:
+        reason = f"依赖不可用: {', '.join(failures)}" if failures else None
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "reason": reason},
+    )
+
+
+@router.get("/health/deep")
+async def deep_health() -> dict:
+    """深度健康检查，返回各依赖最近一次的探测结果。"""
+    failures = health_monitor.failures()
+    return {
+        "status": "degraded"
+        if failures or health_monitor.degraded() or not lifecycle.accepting
+        else "ok",
+        "accepting": lifecycle.accepting,
+        "checks": {
+            "llm": health_monitor.llm,
+            "mem0": health_monitor.mem0,
+            "mcp": health_monitor.mcp,
+        },
+        "agents": {"active": len(manager.agents), "spares": len(manager.spares)},
+        "streams": lifecycle.active_streams,
+        "event_loop": loop_monitor.snapshot(),
+    }
@@ -1,7 +1,9 @@
 import json
 import os
+from functools import lru_cache
 from pathlib import Path
-import yaml
+from typing import Any, Literal
+
 from loguru import logger
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -14,6 +16,119 @@ class Setting(BaseSettings):
     LLM_MODEL: str
     MEM0_API_KEY: str
 
+    # OpenTelemetry OTLP/HTTP采集器地址，未设置时不导出链路
+    OTEL_EXPORTER_OTLP_ENDPOINT: str | None = None
+    OTEL_SERVICE_NAME: str = "wiley-ai-backend"
+
+    # 启动后在后台线程预热重量级依赖（openai、mcp、mem0）
+    PREWARM_IMPORTS: bool = True
+    # 启动时预先创建的备用Agent数（已连接MCP服务），新对话直接领取
+    PREWARM_AGENTS: int = 1
+    # 启动时预先建立的LLM连接数
+    PREWARM_LLM_CONNECTIONS: int = 2
+    # 关闭时等待进行中的对话流结束的最长时间（秒），超时后取消
+    SHUTDOWN_DRAIN_TIMEOUT: float = 30.0
+
+    # 依赖健康探测的间隔与单次超时（秒），LLM探测会产生实际调用，间隔单独设置
+    HEALTH_PROBE_INTERVAL: float = 15.0
+    HEALTH_LLM_PROBE_INTERVAL: float = 60.0
+    HEALTH_PROBE_TIMEOUT: float = 5.0
+
+    # 事件循环延迟采样间隔与阻塞阈值（秒），阻塞超过阈值时记录调用栈
+    LOOP_MONITOR_INTERVAL: float = 0.25
+    LOOP_BLOCK_THRESHOLD: float = 0.1
+    # 调试模式：开启asyncio调试并标记循环线程上的同步I/O，开销较大，仅用于排查
+    LOOP_DEBUG: bool = False
+
+    # 负载（字节数）达到阈值的CPU密集任务卸载到线程池或进程池执行
+    OFFLOAD_THRESHOLD: int = 1024 * 1024
+    OFFLOAD_THREAD_WORKERS: int = 4
+    # 进程池大小，为0时进程任务改用线程池
+    OFFLOAD_PROCESS_WORKERS: int = 2
+
+    # token用量统计的本地存储与批量写入间隔（秒）
+    USAGE_DB_PATH: str = "data/usage.db"
+    USAGE_FLUSH_INTERVAL: float = 10.0
+    # 每个用户每日（UTC）的token配额（输入+输出），不设置时不限制
+    USER_DAILY_TOKEN_QUOTA: int | None = None
+
+    # 对话历史压缩：历史估算token数超过阈值时，在后台将较早的轮次合并进摘要
+    COMPACTION_ENABLED: bool = True
+    # 生成摘要使用的模型，不设置时使用 LLM_MODEL
+    COMPACTION_MODEL: str | None = None
+    COMPACTION_TRIGGER_TOKENS: int = 4000
+    # 压缩后保留原文的最近消息条数
+    COMPACTION_KEEP_MESSAGES: int = 6
+
+    # 工具规划使用的小模型：每轮先由它选择工具，需要给出最终回答时改用 LLM_MODEL；不设置时不做路由
+    LLM_TOOL_MODEL: str | None = None
+    # 除 LLM_MODEL 外允许客户端按对话指定的模型（请求体的 model 字段），指定后该对话不做路由；
+    # 其他模型名（如前端自带的 openai/gpt-4o）视为未指定，不拒绝请求
+    LLM_OVERRIDE_MODELS: list[str] = []
+
+    # LLM服务商的速率限制（每分钟请求数/token数），所有Agent共享，不设置时不限制
+    LLM_RPM_LIMIT: int | None = None
+    LLM_TPM_LIMIT: int | None = None
+    # 按模型覆盖速率限制，如 {"gpt-4o": {"rpm": 500, "tpm": 30000}}
+    LLM_MODEL_RATE_LIMITS: dict[str, dict[str, int]] = {}
+    # 估算TPM时为每次调用预留的输出token数，调用结束后按实际用量校正
+    LLM_COMPLETION_TOKENS_ESTIMATE: int = 512
+    # 服务商返回429时的最大重试次数
+    LLM_RATE_LIMIT_RETRIES: int = 5
+
+    # 回答缓存：没有历史与个人记忆的首轮提问，重复时回放缓存的回答，不调用LLM
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_TTL: float = 3600.0
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    # 回放缓存回答时每个SSE事件之间的间隔（秒），为0时一次发送
+    ANSWER_CACHE_REPLAY_DELAY: float = 0.01
+    # 语义匹配使用的嵌入模型，不设置时只做精确匹配
+    ANSWER_CACHE_EMBEDDING_MODEL: str | None = None
+    ANSWER_CACHE_SIMILARITY: float = 0.95
+    # 结果不随时间与用户变化、可以随回答一起缓存的工具；本轮调用了其他工具的回答不写入缓存
+    ANSWER_CACHE_TOOLS: list[str] = []
+
+    # MCP服务配置文件（JSON或YAML），修改后自动生效
+    MCP_CONFIG_PATH: str = "servers_config.json"
+    # 检查配置文件变更的间隔（秒）
+    MCP_CONFIG_WATCH_INTERVAL: float = 2.0
+    # 工具执行进度事件的最小发送间隔（秒），间隔内只发送最新的一条
+    TOOL_PROGRESS_INTERVAL: float = 0.25
+    # 同一轮的多个工具调用在服务端声明了批量调用扩展时合并为一次请求，否则在会话内并发发送
+    MCP_TOOL_BATCHING: bool = True
+    # 工具预取：用户消息匹配规则时，与记忆查询、首次调用LLM并行地预先执行工具，模型发起匹配的调用时直接使用结果，
+    # 未使用的预取在本轮结束时取消。规则如 {"tool": "web_search", "pattern": "新闻|最新", "arguments": {"query": "{message}"}}，
+    # arguments 中的 {message} 与正则命名分组会被替换；可选的 match 为判断命中时需要相同的参数（默认全部，[] 表示任意调用）。
+    # 只应为只读工具配置规则，为空时不预取
+    TOOL_PREFETCH_RULES: list[dict[str, Any]] = []
+    # 移除MCP服务时等待进行中工具调用完成的最长时间（秒）
+    MCP_DRAIN_TIMEOUT: float = 30.0
+
+    # 重复提交同一条消息时复用已有轮次：轮次结束后保留输出的时间（秒）与最多保留的轮次数
+    IDEMPOTENCY_TTL: float = 600.0
+    IDEMPOTENCY_MAX_TURNS: int = 1000
+    # 进行中的轮次所有连接都断开后，等待客户端重新连接的时间（秒），超时后取消生成
+    IDEMPOTENCY_ABANDON_GRACE: float = 5.0
+
+    # SSE压缩：按顺序选择客户端接受的算法（br 需要安装 brotli），为空时不压缩；压缩级别
+    SSE_COMPRESSION: list[str] = ["br", "gzip"]
+    SSE_COMPRESSION_LEVEL: int = 6
+    # SSE刷新策略：frame 每个事件立即发送；interval 合并 SSE_FLUSH_INTERVAL 秒内的事件后发送
+    SSE_FLUSH_POLICY: Literal["frame", "interval"] = "frame"
+    SSE_FLUSH_INTERVAL: float = 0.05
+    # 空闲多久后发送心跳注释（秒），避免代理断开空闲连接；为0时不发送
+    SSE_HEARTBEAT_INTERVAL: float = 15.0
+
+    # 附件存储目录与单个附件的最大字节数
+    BLOB_STORE_DIR: str = "data/blobs"
+    BLOB_MAX_SIZE: int = 20 * 1024 * 1024
+    # LLM可访问的后端公开地址，设置后图片按URL传递而不是编码为base64
+    BLOB_PUBLIC_BASE_URL: str | None = None
+    # 每次调用LLM时只发送对话中最近的若干张图片，更早的替换为文字说明，避免每轮重复读取与编码历史图片
+    BLOB_HISTORY_IMAGES: int = 4
+    # 编码为base64内联发送的单张图片最大字节数，超过时替换为文字说明（配置公开地址时按URL发送，不受限制）
+    BLOB_INLINE_IMAGE_MAX_SIZE: int = 5 * 1024 * 1024
+
 
 class MCPConfiguration:
     """MCP Server config"""
@@ -32,6 +147,9 @@ class MCPConfiguration:
             FileNotFoundError: 如果配置文件不存在
             ValueError: 如果配置文件格式不支持或无效
         """
+        # YAML解析器仅在加载配置时导入
+        import yaml
+
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"配置文件不存在: {file_path}")
 
@@ -42,6 +160,8 @@ class MCPConfiguration:
             with open(file_path, "r", encoding="utf-8") as f:
                 if suffix == ".json":
                     return json.load(f)
+                elif suffix in (".yaml", ".yml"):
+                    return yaml.safe_load(f) or {}
                 else:
                     raise ValueError(f"不支持的配置文件格式: {suffix}")
         except json.JSONDecodeError as e:
@@ -55,4 +175,18 @@ class MCPConfiguration:
             raise
 
 
-setting = Setting()
+@lru_cache(maxsize=1)
+def get_setting() -> Setting:
+    """返回全局配置，首次调用时才读取环境变量与 .env 文件。
+
+    Returns:
+        配置实例
+    """
+    return Setting()
+
+
+def __getattr__(name: str) -> Any:
+    # 兼容 ``from app.config.configuration import setting``，访问时才实例化
+    if name == "setting":
+        return get_setting()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,168 @@
+"""MCP服务配置监听模块。
+
+配置文件只解析一次并缓存，后台按间隔检查文件变更，
+变更后计算差异并通知订阅者（各ChatAgent）增量更新。
+"""
+
+import asyncio
+import os
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+
+from app.config.configuration import MCPConfiguration, get_setting
+
+
+class MCPConfigDiff(BaseModel):
+    """两次MCP配置之间的差异。"""
+
+    added: Dict[str, Dict[str, Any]] = {}  # 新增的服务
+    removed: List[str] = []  # 移除的服务
+    changed: Dict[str, Dict[str, Any]] = {}  # 配置变化的服务，需要重建
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+def diff_servers(
+    old: Dict[str, Dict[str, Any]], new: Dict[str, Dict[str, Any]]
+) -> MCPConfigDiff:
+    """比较两次配置中的 mcpServers。
+
+    Args:
+        old: 旧的服务配置
+        new: 新的服务配置
+
+    Returns:
+        配置差异，未变化的服务不出现在结果中
+    """
+    return MCPConfigDiff(
+        added={name: config for name, config in new.items() if name not in old},
+        removed=[name for name in old if name not in new],
+        changed={
+            name: config
+            for name, config in new.items()
+            if name in old and old[name] != config
+        },
+    )
+
+
+ConfigListener = Callable[[MCPConfigDiff], Awaitable[None]]
+
+
+class MCPConfigWatcher:
+    """缓存并监听MCP服务配置文件。"""
+
+    def __init__(self, path: str, interval: float):
+        """初始化MCPConfigWatcher。
+
+        Args:
+            path: 配置文件路径，支持JSON与YAML
+            interval: 检查文件变更的间隔（秒）
+        """
+        self.path = path
+        self.interval = interval
+        self._servers: Optional[Dict[str, Dict[str, Any]]] = None
+        self._stamp: Optional[tuple[int, int]] = None
+        self._listeners: List[ConfigListener] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def _file_stamp(self) -> tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        config = MCPConfiguration.load_config_file(self.path)
+        return dict(config.get("mcpServers") or {})
+
+    @property
+    def servers(self) -> Dict[str, Dict[str, Any]]:
+        """当前的服务配置，首次访问时解析配置文件。
+
+        Raises:
+            FileNotFoundError: 如果配置文件不存在
+            ValueError: 如果配置文件格式不支持或无效
+        """
+        if self._servers is None:
+            self._stamp = self._file_stamp()
+            self._servers = self._load()
+        return self._servers
+
+    def subscribe(self, listener: ConfigListener) -> None:
+        """订阅配置变更。
+
+        Args:
+            listener: 接收配置差异的异步回调
+        """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: ConfigListener) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    async def check(self) -> MCPConfigDiff:
+        """检查配置文件是否变更，变更时通知所有订阅者。
+
+        配置无效时保留当前配置，等待下一次修改。
+
+        Returns:
+            本次检查得到的配置差异
+        """
+        try:
+            stamp = await asyncio.to_thread(self._file_stamp)
+            if stamp == self._stamp:
+                return MCPConfigDiff()
+            servers = await asyncio.to_thread(self._load)
+        except Exception as e:
+            logger.error(f"重新加载MCP配置失败，继续使用当前配置: {e}")
+            return MCPConfigDiff()
+
+        old = self._servers or {}
+        self._stamp = stamp
+        self._servers = servers
+        diff = diff_servers(old, servers)
+        if not diff:
+            return diff
+
+        logger.info(
+            f"MCP配置已变更，新增: {list(diff.added)}, 移除: {diff.removed}, "
+            f"变更: {list(diff.changed)}"
+        )
+        results = await asyncio.gather(
+            *(listener(diff) for listener in list(self._listeners)),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"应用MCP配置变更失败: {result}")
+        return diff
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    def start(self) -> None:
+        """启动后台监听任务。"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+            logger.info(f"开始监听MCP配置: {self.path}")
+
+    async def stop(self) -> None:
+        """停止后台监听任务。"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+@lru_cache(maxsize=1)
+def get_mcp_config_watcher() -> MCPConfigWatcher:
+    """返回单例监听器，首次调用时根据配置创建。"""
+    setting = get_setting()
+    return MCPConfigWatcher(setting.MCP_CONFIG_PATH, setting.MCP_CONFIG_WATCH_INTERVAL)
@@ -1,22 +1,39 @@
 """ChatAgent模块负责管理用户对话和与MCP服务的交互。"""
 
 import asyncio
-import copy
+import itertools
 import json
 import os
+import time
 import uuid
-from typing import Any, AsyncGenerator, Dict, List
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Dict, List
 
 from loguru import logger
-from mem0 import AsyncMemoryClient
-from openai.types.chat import ParsedFunctionToolCall, ParsedFunction
-from app.config.configuration import MCPConfiguration
-from app.services.llm_client import LLMClient
-from app.services.mcp_client import Client
+from app.config.configuration import get_setting
+from app.config.watcher import MCPConfigDiff, get_mcp_config_watcher
+from app.services.answer_cache import CachedAnswer, get_answer_cache
+from app.services.blob_store import Attachment, get_blob_store
+from app.services.llm_client import LLMClient, StreamToolCall
+from app.services.mcp_client import Client, NotificationCallback
+from app.services.prefetch import TurnPrefetcher, get_prefetch_rules
+from app.services.rate_limiter import estimate_request_tokens
+from app.services.usage import get_usage_meter
+from app.core.compaction import summarize
 from app.core.exception import ToolExecutionException
-
-# 定义SSE事件前缀
-DATA_PREFIX = "data: "
+from app.utils.logging import truncate
+from app.utils.offload import dumps, get_executor
+from app.utils.sse import DATA_PREFIX, sse_event
+from app.utils.telemetry import (
+    HISTORY_COMPACTIONS,
+    MEMORY_SEARCH_SECONDS,
+    TOOL_ROUNDS_PER_TURN,
+    generator_span,
+    tracer,
+)
+
+if TYPE_CHECKING:
+    from mcp.types import CallToolResult
+    from mem0 import AsyncMemoryClient
 
 
 class ChatAgent:
@@ -42,28 +59,33 @@ class ChatAgent:
         self.user_id = user_id  # 用户id
         self.chat_id = chat_id  # 当前对话id
         self.system_prompt: str = system_prompt
-        self.full_messages: List[Dict[str, str]] = []  # 完整对话历史，可用于回溯
-        self.user_messages: List[Dict[str, str]] = []  # 用户对话历史
+        self.full_messages: List[Dict[str, Any]] = []  # 完整对话历史，可用于回溯
+        self.user_messages: List[Dict[str, Any]] = []  # 用户对话历史
+        self.message_ids: List[str] = []  # 与 user_messages 一一对应的消息ID
+        self.summary: str = ""  # 已折叠的较早轮次的滚动摘要
+        self.model_override: str | None = None  # 对话指定的模型，不做模型路由
+        self._compaction: asyncio.Task | None = None
         self.servers: List[Client] = []
         self.max_history = max_history
         self.llm_client: LLMClient | None = None
-        self.mem0_client: AsyncMemoryClient | None = None
-        self.config_path = os.getenv("MCP_CONFIG_PATH", "servers_config.json")
+        self.mem0_client: "AsyncMemoryClient | None" = None
+        self.config_path = get_mcp_config_watcher().path
+        self._reload_lock = asyncio.Lock()
 
     async def init_mcp_client(self) -> None:
         """初始化MCP客户端。
 
+        使用监听器缓存的配置，不重复解析配置文件；并订阅后续的配置变更。
+
         Raises:
             FileNotFoundError: 如果配置文件不存在
             RuntimeError: 如果初始化服务器失败
         """
         try:
             # 读取mcp配置
-            config = MCPConfiguration()
-            server_config = config.load_config_file(self.config_path)
+            server_config = get_mcp_config_watcher().servers
             self.servers = [
-                Client(name, srv_config)
-                for name, srv_config in server_config["mcpServers"].items()
+                Client(name, srv_config) for name, srv_config in server_config.items()
             ]
 
             if not self.servers:
@@ -82,16 +104,56 @@ class ChatAgent:
                     for s in initialized_servers:
                         await s.cleanup()
                     raise RuntimeError(f"初始化服务器 {server.name} 失败: {str(e)}")
+            get_mcp_config_watcher().subscribe(self.apply_config_diff)
             logger.info(f"用户 {self.chat_id} 的ChatAgent初始化成功")
         except Exception as e:
             logger.error(f"初始化MCP客户端失败: {e}")
             raise
 
+    async def apply_config_diff(self, diff: MCPConfigDiff) -> None:
+        """增量应用MCP配置变更。
+
+        只启动新增或变更的服务，未变化的服务保持连接；
+        移除的服务先从工具列表中摘除，再等待进行中的工具调用完成后关闭。
+
+        Args:
+            diff: 配置差异
+        """
+        async with self._reload_lock:
+            replaced = {*diff.removed, *diff.changed}
+            started = []
+            for name, srv_config in {**diff.added, **diff.changed}.items():
+                server = Client(name, srv_config)
+                try:
+                    await server.initialize()
+                    started.append(server)
+                except Exception as e:
+                    logger.error(f"启动服务器 {name} 失败: {e}")
+
+            retired = [s for s in self.servers if s.name in replaced]
+            # 整体替换列表，进行中的工具调用仍持有旧服务的引用
+            self.servers = [
+                s for s in self.servers if s.name not in replaced
+            ] + started
+            if self.llm_client is not None:
+                await self.llm_client.refresh_tools(self.servers)
+
+            await asyncio.gather(
+                *(s.drain(get_setting().MCP_DRAIN_TIMEOUT) for s in retired)
+            )
+            logger.info(
+                f"对话 {self.chat_id} 已应用MCP配置变更，当前服务: "
+                f"{[s.name for s in self.servers]}"
+            )
+
     async def init_llm_client(self) -> None:
         # 创建LLM客户端话
         self.llm_client = await LLMClient.create(self.servers)
 
     async def init_mem0_client(self) -> None:
+        # mem0 包会连带导入向量库等重量级依赖，首次使用时才导入
+        from mem0 import AsyncMemoryClient
+
         self.mem0_client = AsyncMemoryClient(
             api_key=os.getenv("MEM0_API_KEY", "123456")
         )
@@ -105,98 +167,414 @@ class ChatAgent:
             except Exception as e:
                 logger.warning(f"清理服务器 {server.name} 时出现警告: {e}")
 
-    async def run_tool(self, tool_call: ParsedFunctionToolCall) -> dict[str, str | Any]:
-        """执行工具调用。
+    def record_usage(self, model: str, usage: dict[str, Any]) -> None:
+        """记录一次LLM调用的token用量。
 
         Args:
-            tool_call: 工具列表
-
-        Returns:
-            处理后的响应字典
+            model: 模型名称
+            usage: OpenAI格式的usage字段
         """
-        tool_call_id: str = tool_call.id
-        tool_call_function: ParsedFunction = tool_call.function
-        tool_call_name = tool_call_function.name
-        tool_call_args = tool_call_function.arguments
-
-        logger.info(f"执行工具: {tool_call_name}, 参数: {tool_call_args}")
+        get_usage_meter().record(self.user_id, self.chat_id, model, usage)
 
-        # 查找可以处理该工具的服务器
-        target_server = None
+    async def find_server(self, tool_name: str) -> Client | None:
+        """查找可以处理该工具的服务器，跳过正在排空的服务器。"""
         for server in self.servers:
+            if server.draining:
+                continue
             try:
                 tools = await server.list_tools()
-                if any(tool.name == tool_call_name for tool in tools):
-                    target_server = server
-                    break
+                if any(tool.name == tool_name for tool in tools):
+                    return server
             except Exception as e:
                 logger.error(f"获取服务器 {server.name} 工具列表失败: {e}")
+        return None
+
+    @staticmethod
+    def tool_result(
+        tool_call: StreamToolCall, response: "CallToolResult"
+    ) -> dict[str, str | Any]:
+        """将MCP工具调用结果转换为结果字典，只保留文本内容。"""
+        logger.opt(lazy=True).debug("工具执行结果: {}", lambda: truncate(response))
+        result = ""
+        for content in response.content:
+            if content.type == "text":
+                result += content.text
+            else:
+                logger.error(
+                    f"工具{tool_call.function.name},返回的结果type为{content.type}, 原始结果为{response}"
+                )
+        return {
+            "tool_call_id": tool_call.id,
+            "tool_call_name": tool_call.function.name,
+            "tool_call_args": tool_call.function.arguments,
+            "tool_call_result": result,
+        }
+
+    async def run_tools(
+        self,
+        tool_calls: list[StreamToolCall],
+        on_notification: Dict[str, NotificationCallback] | None = None,
+        prefetch: TurnPrefetcher | None = None,
+    ) -> list[dict[str, str | Any] | BaseException]:
+        """并发执行一组工具调用，按调用顺序返回结果。
 
-        # 如果找到了可以处理该工具的服务器，执行工具调用
-        if target_server:
-            try:
-                # 解析工具参数
-                try:
-                    args = json.loads(tool_call_args)
-                except json.JSONDecodeError as e:
-                    logger.error(f"解析工具参数失败: {e}")
-                    raise ToolExecutionException(
-                        f"The tool argument cannot be parsed by json.loads()."
-                    )
-
-                # 执行工具调用
-                response = await target_server.execute_tool(tool_call_name, args)
+        同一服务器上的调用一起交给 ``Client.execute_tools``，
+        服务端支持时合并为一次批量请求，否则在同一会话上流水线发送；
+        与本轮预取匹配的调用直接使用预取结果，预取失败时重新调用。
 
-                # 此处工具执行进度的展示 ，需要在服务端 使用 如下代码
-                if isinstance(response, dict) and "progress" in response:
-                    progress: int = response["progress"]
-                    total: int = response["total"]
-                    percentage: float = (progress / total) * 100
-                    logger.info(
-                        f"Tool Run Progress: {progress}/{total} ({percentage:.1f}%)"
-                    )
+        Args:
+            tool_calls: 工具调用列表
+            on_notification: 工具调用ID -> 接收执行期间进度与日志通知的回调
+            prefetch: 本轮的预取调用
 
-                logger.info(f"工具执行结果: {response}")
-                result = ""
-                for content in response.content:
-                    if content.type == "text":
-                        result += content.text
-                    else:
-                        logger.error(
-                            f"工具{tool_call_name},返回的结果type为{content.type}, 原始结果为{response}"
-                        )
-                return {
-                    "tool_call_id": tool_call_id,
-                    "tool_call_name": tool_call_name,
-                    "tool_call_args": tool_call_args,
-                    "tool_call_result": result,
-                }
-            except ToolExecutionException as e:
-                error_msg = f"执行工具 {tool_call_name} 时出错: {str(e)}"
+        Returns:
+            每个调用的结果字典，执行失败时为异常
+        """
+        on_notification = on_notification or {}
+        results: list[dict[str, str | Any] | BaseException | None] = [None] * len(
+            tool_calls
+        )
+        # 服务器 -> [(调用序号, 工具名称, 参数)]
+        groups: dict[Client, list[tuple[int, str, dict[str, Any]]]] = {}
+        # 调用序号 -> 匹配的预取任务
+        prefetched: dict[int, asyncio.Task] = {}
+        for index, tool_call in enumerate(tool_calls):
+            tool_call_name = tool_call.function.name
+            tool_call_args = tool_call.function.arguments
+            logger.opt(lazy=True).info(
+                "执行工具: {}, 参数: {}",
+                lambda: tool_call_name,
+                lambda: truncate(tool_call_args),
+            )
+            try:
+                args = json.loads(tool_call_args)
+            except json.JSONDecodeError as e:
+                logger.error(f"解析工具参数失败: {e}")
+                results[index] = ToolExecutionException(
+                    "Execution tool finds an error : "
+                    "The tool argument cannot be parsed by json.loads()."
+                )
+                continue
+            task = prefetch.take(tool_call_name, args) if prefetch else None
+            if task is not None:
+                prefetched[index] = task
+                continue
+            server = await self.find_server(tool_call_name)
+            if server is None:
+                error_msg = f"找不到可以处理工具 {tool_call_name} 的服务器"
                 logger.error(error_msg)
-                raise ToolExecutionException(
-                    f"Execution tool finds an error : {str(e)}"
+                results[index] = Exception(error_msg)
+                continue
+            groups.setdefault(server, []).append((index, tool_call_name, args))
+
+        async def run_group(
+            server: Client, calls: list[tuple[int, str, dict[str, Any]]]
+        ) -> None:
+            responses = await server.execute_tools(
+                [(name, args) for _, name, args in calls],
+                [on_notification.get(tool_calls[index].id) for index, _, _ in calls],
+            )
+            for (index, _, _), response in zip(calls, responses):
+                results[index] = (
+                    response
+                    if isinstance(response, BaseException)
+                    else self.tool_result(tool_calls[index], response)
                 )
-        else:
-            error_msg = f"找不到可以处理工具 {tool_call_name} 的服务器"
-            logger.error(error_msg)
-            raise Exception(error_msg)
+
+        async def run_prefetched(index: int, task: asyncio.Task) -> None:
+            tool_call = tool_calls[index]
+            try:
+                results[index] = self.tool_result(tool_call, await task)
+                return
+            except Exception as e:
+                logger.warning(f"工具 {tool_call.function.name} 的预取失败，重新调用: {e}")
+            callback = on_notification.get(tool_call.id) if on_notification else None
+            callbacks = {tool_call.id: callback} if callback else None
+            (results[index],) = await self.run_tools([tool_call], callbacks)
+
+        await asyncio.gather(
+            *(run_group(server, calls) for server, calls in groups.items()),
+            *(run_prefetched(index, task) for index, task in prefetched.items()),
+        )
+        return results
+
+    async def run_tool(
+        self,
+        tool_call: StreamToolCall,
+        on_notification: NotificationCallback | None = None,
+    ) -> dict[str, str | Any]:
+        """执行工具调用。
+
+        Args:
+            tool_call: 工具调用
+            on_notification: 接收工具执行期间进度与日志通知的回调
+
+        Returns:
+            处理后的响应字典
+
+        Raises:
+            Exception: 工具执行失败
+        """
+        callbacks = {tool_call.id: on_notification} if on_notification else None
+        (result,) = await self.run_tools([tool_call], callbacks)
+        if isinstance(result, BaseException):
+            raise result
+        return result
 
     async def run_all_tools(
-        self, tool_calls: list[ParsedFunctionToolCall]
+        self, tool_calls: list[StreamToolCall]
     ) -> AsyncGenerator[dict[str, str | Any], None]:
-        """ """
-        for coro in asyncio.gather(
-            *(self.run_tool(tc) for tc in tool_calls), return_exceptions=True
-        ):
-            result = await coro
+        """并发执行工具调用，按调用顺序返回结果。
+
+        Args:
+            tool_calls: 工具调用列表
+
+        Yields:
+            工具执行结果，执行失败时结果为错误信息，便于模型继续处理
+        """
+        results = await self.run_tools(tool_calls)
+        for tool_call, result in zip(tool_calls, results):
+            if isinstance(result, BaseException):
+                result = self.tool_failure(tool_call, result)
             yield result
 
-    async def ask(self, user_message: str) -> AsyncGenerator[str, Any]:
+    @staticmethod
+    def tool_failure(
+        tool_call: StreamToolCall, error: BaseException
+    ) -> dict[str, str | Any]:
+        """工具执行失败时的结果，错误信息交给模型继续处理。"""
+        logger.error(f"工具 {tool_call.function.name} 执行失败: {error}")
+        return {
+            "tool_call_id": tool_call.id,
+            "tool_call_name": tool_call.function.name,
+            "tool_call_args": tool_call.function.arguments,
+            "tool_call_result": f"工具执行失败: {error}",
+        }
+
+    async def stream_tools(
+        self,
+        tool_calls: list[StreamToolCall],
+        prefetch: TurnPrefetcher | None = None,
+    ) -> AsyncGenerator[str | dict[str, str | Any], None]:
+        """并发执行一组工具调用，执行期间产出进度事件。
+
+        MCP服务端的进度与日志通知以 ``data-tool-progress`` 事件发送给客户端，
+        同一工具调用的事件使用相同的id，客户端原地更新；
+        每个调用在每个间隔内只发送最新的一条，避免通知过于频繁时挤占对话流。
+
+        Args:
+            tool_calls: 工具调用列表
+            prefetch: 本轮的预取调用
+
+        Yields:
+            SSE格式的进度事件，最后按调用顺序产出工具执行结果（执行失败时为错误信息）
+        """
+        interval = get_setting().TOOL_PROGRESS_INTERVAL
+        updates: asyncio.Queue[tuple[str, dict[str, Any]]] = asyncio.Queue()
+
+        def notifier(tool_call_id: str) -> NotificationCallback:
+            async def on_notification(update: dict[str, Any]) -> None:
+                updates.put_nowait((tool_call_id, update))
+
+            return on_notification
+
+        def progress_event(tool_call_id: str, update: dict[str, Any]) -> str:
+            chunk = {
+                "type": "data-tool-progress",
+                "id": f"progress-{tool_call_id}",
+                "data": {"toolCallId": tool_call_id, **update},
+            }
+            return sse_event(chunk)
+
+        loop = asyncio.get_running_loop()
+        task = asyncio.create_task(
+            self.run_tools(
+                tool_calls,
+                {tool_call.id: notifier(tool_call.id) for tool_call in tool_calls},
+                prefetch,
+            )
+        )
+        # 工具调用ID -> 尚未发送的最新通知 / 上次发送时间
+        pending: dict[str, dict[str, Any]] = {}
+        sent_at: dict[str, float] = {}
+        try:
+            while not task.done():
+                timeout = (
+                    max(
+                        0.0,
+                        min(sent_at.get(id_, 0.0) for id_ in pending)
+                        + interval
+                        - loop.time(),
+                    )
+                    if pending
+                    else None
+                )
+                getter = asyncio.ensure_future(updates.get())
+                done, _ = await asyncio.wait(
+                    {task, getter},
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if getter in done:
+                    tool_call_id, update = getter.result()
+                    pending[tool_call_id] = update
+                else:
+                    getter.cancel()
+                now = loop.time()
+                for tool_call_id in [
+                    id_ for id_ in pending if now - sent_at.get(id_, 0.0) >= interval
+                ]:
+                    yield progress_event(tool_call_id, pending.pop(tool_call_id))
+                    sent_at[tool_call_id] = now
+            # 工具结束前到达、尚未发送的最后一条通知
+            while not updates.empty():
+                tool_call_id, update = updates.get_nowait()
+                pending[tool_call_id] = update
+            for tool_call_id, update in pending.items():
+                yield progress_event(tool_call_id, update)
+        finally:
+            if not task.done():
+                task.cancel()
+        for tool_call, result in zip(tool_calls, task.result()):
+            if isinstance(result, BaseException):
+                result = self.tool_failure(tool_call, result)
+            yield result
+
+    def history_snapshot(self) -> List[Dict[str, Any]]:
+        """截断对话历史并返回本次请求使用的副本。
+
+        Returns:
+            对话历史副本
+        """
+        # 本次任务对话历史, 从用户对话中提取，先检查长度；
+        # 正在压缩时暂不截断，待摘要完成后由压缩移除较早的轮次
+        if (
+            len(self.user_messages) > self.max_history * 2 and not self.compacting
+        ):  # 因为每次对话有用户和助手两条消息
+            self.user_messages = self.user_messages[-self.max_history * 2 :]
+            self.message_ids = self.message_ids[-self.max_history * 2 :]
+        # 本轮只会追加消息、不修改历史中的消息，逐条浅拷贝即可
+        return [dict(message) for message in self.user_messages]
+
+    def sync_history(self, last_message_id: str | None) -> None:
+        """按客户端最后已知的消息ID对齐服务端历史。
+
+        服务端是对话历史的唯一来源，客户端只上传新消息。
+        客户端重新生成或编辑消息时，丢弃该消息之后的历史。
+
+        Args:
+            last_message_id: 客户端在新消息之前的最后一条消息ID，为None表示新对话
+        """
+        if last_message_id is None:
+            self.user_messages = []
+            self.message_ids = []
+            self.summary = ""
+            return
+        try:
+            index = self.message_ids.index(last_message_id)
+        except ValueError:
+            # 服务端历史已丢失（例如重启）或已被截断，沿用现有历史
+            logger.warning(
+                f"对话 {self.chat_id} 未找到消息 {last_message_id}，沿用服务端现有历史"
+            )
+            return
+        del self.user_messages[index + 1 :]
+        del self.message_ids[index + 1 :]
+
+    def record_turn(
+        self,
+        user_message: str | List[Dict[str, Any]],
+        message_id: str,
+        answer: str,
+        answer_id: str,
+    ) -> None:
+        """将一轮对话写入服务端历史。
+
+        Args:
+            user_message: 用户消息，带附件时为内容块列表，附件只保存引用
+            message_id: 用户消息ID
+            answer: 助手回答
+            answer_id: 助手消息ID
+        """
+        self.user_messages.append({"role": "user", "content": user_message})
+        self.user_messages.append({"role": "assistant", "content": answer})
+        self.message_ids.append(message_id)
+        self.message_ids.append(answer_id)
+
+    @property
+    def compacting(self) -> bool:
+        """是否有正在进行的历史压缩。"""
+        return self._compaction is not None and not self._compaction.done()
+
+    def maybe_compact(self) -> None:
+        """历史超过token阈值或即将被截断时，在后台压缩较早的轮次。"""
+        setting = get_setting()
+        if not setting.COMPACTION_ENABLED or self.compacting:
+            return
+        if len(self.user_messages) <= setting.COMPACTION_KEEP_MESSAGES:
+            return
+        # 与限流器预留TPM使用同一估算，压缩阈值与实际发送的请求大小一致
+        if (
+            estimate_request_tokens(self.user_messages)
+            > setting.COMPACTION_TRIGGER_TOKENS
+            or len(self.user_messages) > self.max_history * 2
+        ):
+            self._compaction = asyncio.create_task(self.compact_history())
+
+    async def compact_history(self) -> None:
+        """将最近若干条消息之前的轮次合并进摘要。
+
+        摘要期间历史可能继续追加或被改写（重新生成、编辑消息），
+        只有被折叠的消息仍保持不变时才替换，否则丢弃本次结果。
+        """
+        setting = get_setting()
+        count = len(self.user_messages) - setting.COMPACTION_KEEP_MESSAGES
+        # 按整轮（用户与助手各一条）折叠
+        count -= count % 2
+        if count <= 0:
+            return
+        folded = self.user_messages[:count]
+        folded_ids = self.message_ids[:count]
+        try:
+            with tracer.start_as_current_span(
+                "agent.compact", attributes={"chat.id": self.chat_id}
+            ):
+                summary = await summarize(
+                    self.llm_client,
+                    self.summary,
+                    folded,
+                    setting.COMPACTION_MODEL,
+                    self.record_usage,
+                    self.user_id,
+                )
+        except Exception as e:
+            HISTORY_COMPACTIONS.labels("error").inc()
+            logger.error(f"对话 {self.chat_id} 压缩历史失败: {e}")
+            return
+        if self.message_ids[:count] != folded_ids:
+            HISTORY_COMPACTIONS.labels("discarded").inc()
+            logger.info(f"对话 {self.chat_id} 的历史在压缩期间被改写，丢弃本次摘要")
+            return
+        del self.user_messages[:count]
+        del self.message_ids[:count]
+        self.summary = summary
+        HISTORY_COMPACTIONS.labels("ok").inc()
+        logger.info(
+            f"对话 {self.chat_id} 已将 {count} 条消息压缩为摘要（{len(summary)} 字）"
+        )
+
+    async def ask(
+        self,
+        user_message: str,
+        message_id: str | None = None,
+        attachments: List[Attachment] | None = None,
+    ) -> AsyncGenerator[str, Any]:
         """处理用户输入并返回响应。
 
         Args:
             user_message: 用户消息
+            message_id: 用户消息ID，未提供时自动生成
+            attachments: 用户消息的附件
 
         Returns:
             助手响应
@@ -204,30 +582,133 @@ class ChatAgent:
         Raises:
             RuntimeError: 如果MCP客户端未初始化或处理过程中出错
         """
-        # 本次任务对话历史, 从用户对话中提取，先检查长度
-        if (
-            len(self.user_messages) > self.max_history * 2
-        ):  # 因为每次对话有用户和助手两条消息
-            self.user_messages = self.user_messages[-self.max_history * 2 :]
-        messages = copy.deepcopy(self.user_messages)
-        messages_len = len(messages)
-        # 查询用户记忆
-        search_memory = await self.mem0_client.search(
-            user_message,
-            version="v2",
-            filters={"AND": [{"user_id": self.user_id}]},
+        # 在迭代时才开始，从未被迭代的流不会发出预取
+        return self.stream_turn(user_message, message_id, attachments)
+
+    async def stream_turn(
+        self,
+        user_message: str,
+        message_id: str | None,
+        attachments: List[Attachment] | None,
+    ) -> AsyncGenerator[str, Any]:
+        """开始预取并逐个返回本轮的事件，流结束或被关闭时取消未使用的预取。
+
+        Args:
+            user_message: 用户消息
+            message_id: 用户消息ID
+            attachments: 用户消息的附件
+
+        Yields:
+            SSE格式的事件数据
+        """
+        # 按规则预取本轮可能调用的工具，与记忆查询和首次调用LLM并行执行
+        prefetch = TurnPrefetcher(get_prefetch_rules())
+        if user_message:
+            prefetch.start(user_message, self.find_server)
+        try:
+            stream = await self.prepare_turn(
+                prefetch, user_message, message_id, attachments
+            )
+            try:
+                async for msg in stream:
+                    yield msg
+            finally:
+                await stream.aclose()
+        finally:
+            prefetch.finish()
+
+    async def prepare_turn(
+        self,
+        prefetch: TurnPrefetcher,
+        user_message: str,
+        message_id: str | None,
+        attachments: List[Attachment] | None,
+    ) -> AsyncGenerator[str, Any]:
+        """准备本轮对话并返回响应流，预取由调用方 ``stream_turn`` 负责清理。
+
+        Args:
+            prefetch: 本轮已开始的工具预取
+            user_message: 用户消息
+            message_id: 用户消息ID
+            attachments: 用户消息的附件
+
+        Returns:
+            助手响应
+        """
+        messages = self.history_snapshot()
+        # 查询用户记忆，只有附件没有文本时跳过
+        search_memory = []
+        if user_message:
+            start = time.perf_counter()
+            with tracer.start_as_current_span("memory.search"):
+                search_memory = await self.mem0_client.search(
+                    user_message,
+                    version="v2",
+                    filters={"AND": [{"user_id": self.user_id}]},
+                )
+            MEMORY_SEARCH_SECONDS.observe(time.perf_counter() - start)
+        # 没有历史、摘要、附件与个人记忆的提问，回答只取决于问题本身，可以使用回答缓存
+        setting = get_setting()
+        cache = get_answer_cache()
+        cacheable = (
+            setting.ANSWER_CACHE_ENABLED
+            and bool(user_message)
+            and not messages
+            and not self.summary
+            and not attachments
+            and not search_memory
+            and not self.model_override
         )
+        cache_namespace = cache_vector = None
+        if cacheable:
+            cache_namespace = cache.namespace(
+                self.system_prompt, self.llm_client.tools_version
+            )
+            cached, cache_vector = await cache.lookup(
+                user_message, cache_namespace, self.record_usage, self.user_id
+            )
+            if cached is not None:
+                return self.replay_answer(
+                    user_message, message_id, cached, setting.ANSWER_CACHE_REPLAY_DELAY
+                )
         memory = "之前对话中的相关信息：\n"
         for m in search_memory:
             memory += f"- {m.get('memory', '')} \n"
+        # 附件在历史中只保存引用
+        attachment_parts = [
+            {"type": "attachment", "attachment": a.model_dump(exclude_none=True)}
+            for a in attachments or ()
+        ]
         # 添加到完整对话历史
         messages.append(
             # {"role": "user", "content": "/no_think \n" + memory + user_message}
-            {"role": "user", "content": memory + user_message}
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": memory + user_message},
+                    *attachment_parts,
+                ]
+                if attachment_parts
+                else memory + user_message,
+            }
         )
-        # 添加系统提示
-        if self.system_prompt:
-            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        # 添加系统提示，已压缩的较早轮次以摘要形式附在系统提示后
+        system_prompt = self.system_prompt
+        if self.summary:
+            system_prompt = f"{system_prompt}\n\n以下是此前对话的摘要：\n{self.summary}"
+        if system_prompt:
+            messages.insert(0, {"role": "system", "content": system_prompt})
+        # 附件在发送前才解析，本轮内的多次LLM调用复用解析结果
+        messages = await get_blob_store().resolve_messages(messages)
+
+        # 本轮对话的工具调用轮数与调用过的工具
+        tool_rounds = 0
+        called_tools: set[str] = set()
+        # 本轮助手回答，结束后写入服务端历史
+        answer: list[str] = []
+        answer_id = f"msg-{uuid.uuid4().hex}"
+        # 片段ID只需在本条助手消息内唯一，使用短ID减少每个增量事件的字节数
+        part_ids = itertools.count()
 
         async def run(
             tool_call_count: int = 0, max_tools: int = 5
@@ -241,6 +722,7 @@ class ChatAgent:
             Returns:
                 更新后的消息历史
             """
+            nonlocal tool_rounds
             # 检查工具调用次数是否超过限制
             if tool_call_count >= max_tools:
                 yield f"已达到最大工具调用次数限制({max_tools}次)"
@@ -250,42 +732,68 @@ class ChatAgent:
                 "reasoning": None,  # 当前 reasoning message_id
                 "text": None,  # 当前 text message_id
             }
-            async for message_chunk in self.llm_client.get_response(messages):
+            async for message_chunk in self.llm_client.route_response(
+                messages,
+                self.model_override,
+                on_usage=self.record_usage,
+                user_id=self.user_id,
+            ):
                 match message_chunk.type:
                     case "reasoning":
                         if message_status["reasoning"] is None:
-                            message_status["reasoning"] = f"reasoning-{uuid.uuid4()}"
-                            yield f"{DATA_PREFIX}{json.dumps({'id': message_status['reasoning'], 'type': 'reasoning-start'}, ensure_ascii=False)}\n\n"
+                            message_status["reasoning"] = f"r{next(part_ids)}"
+                            yield sse_event({"id": message_status["reasoning"], "type": "reasoning-start"})
 
                         # reasoning delta
-                        yield f"{DATA_PREFIX}{json.dumps({'id': message_status['reasoning'], 'type': 'reasoning-delta', 'delta': message_chunk.data}, ensure_ascii=False)}\n\n"
+                        yield sse_event({"id": message_status["reasoning"], "type": "reasoning-delta", "delta": message_chunk.data})
 
                     case "message":
                         # 如果reasoning 关闭
                         if message_status["reasoning"]:
-                            yield f"{DATA_PREFIX}{json.dumps({'id': message_status['reasoning'], 'type': 'reasoning-end'})}\n\n"
+                            yield sse_event({"id": message_status["reasoning"], "type": "reasoning-end"})
                             message_status["reasoning"] = None
                         if message_status["text"] is None:
-                            message_status["text"] = f"text-{uuid.uuid4()}"
-                            yield f"{DATA_PREFIX}{json.dumps({'id': message_status['text'], 'type': 'text-start'}, ensure_ascii=False)}\n\n"
+                            message_status["text"] = f"t{next(part_ids)}"
+                            yield sse_event({"id": message_status["text"], "type": "text-start"})
 
+                        answer.append(message_chunk.data)
                         # text delta
-                        yield f"{DATA_PREFIX}{json.dumps({'id': message_status['text'], 'type': 'text-delta', 'delta': message_chunk.data}, ensure_ascii=False)}\n\n"
+                        yield sse_event({"id": message_status["text"], "type": "text-delta", "delta": message_chunk.data})
 
                     case "tool_call":
                         # 关闭
                         if message_status["reasoning"]:
-                            yield f"{DATA_PREFIX}{json.dumps({'id': message_status['reasoning'], 'type': 'reasoning-end'})}\n\n"
+                            yield sse_event({"id": message_status["reasoning"], "type": "reasoning-end"})
                             message_status["reasoning"] = None
 
                         if message_status["text"]:
-                            yield f"{DATA_PREFIX}{json.dumps({'id': message_status['text'], 'type': 'text-end'})}\n\n"
+                            yield sse_event({"id": message_status["text"], "type": "text-end"})
                             message_status["text"] = None
 
+                        # 工具结果之前需要有带 tool_calls 的助手消息
+                        messages.append(
+                            {
+                                "role": "assistant",
+                                "content": None,
+                                "tool_calls": [
+                                    {
+                                        "id": tool_call.id,
+                                        "type": "function",
+                                        "function": {
+                                            "name": tool_call.function.name,
+                                            "arguments": tool_call.function.arguments,
+                                        },
+                                    }
+                                    for tool_call in message_chunk.data
+                                ],
+                            }
+                        )
+
                         # 模型正在生成工具调用输入
                         for tool_call in message_chunk.data:
                             tool_id = tool_call.id
                             tool_name = tool_call.function.name
+                            called_tools.add(tool_name)
 
                             # 开始事件
                             chunk = {
@@ -294,7 +802,7 @@ class ChatAgent:
                                 "toolName": tool_name,
                             }
 
-                            yield f"{DATA_PREFIX}{json.dumps(chunk, ensure_ascii=False)}\n\n"
+                            yield sse_event(chunk)
 
                             # 如果有增量输入 (比如模型逐字输出参数)
                             # if hasattr(tool_call.function, "arguments_stream"):
@@ -313,25 +821,39 @@ class ChatAgent:
                                 "input": tool_call.function.arguments,
                             }
 
-                            yield f"{DATA_PREFIX}{json.dumps(chunk, ensure_ascii=False)}\n\n"
+                            yield sse_event(chunk)
 
-                            # 执行工具逻辑
-                            async for result in self.run_all_tools([tool_call]):
-                                chunk = {
-                                    "type": "tool-output-available",
-                                    "toolCallId": result["tool_call_id"],
-                                    "output": result["tool_call_result"],
+                        # 本轮的工具调用并发执行，执行期间转发进度事件
+                        async for result in self.stream_tools(
+                            message_chunk.data, prefetch
+                        ):
+                            if isinstance(result, str):
+                                yield result
+                                continue
+                            output = result["tool_call_result"]
+                            chunk = {
+                                "type": "tool-output-available",
+                                "toolCallId": result["tool_call_id"],
+                                "output": output,
+                            }
+                            messages.append(
+                                {
+                                    "role": "tool",
+                                    "tool_call_id": result["tool_call_id"],
+                                    "content": output,
                                 }
-                                messages.append(
-                                    {
-                                        "role": "tool",
-                                        "tool_call_id": result["tool_call_id"],
-                                        "content": result["tool_call_result"],
-                                    }
-                                )
-                                yield f"{DATA_PREFIX}{json.dumps(chunk, ensure_ascii=False)}\n\n"
+                            )
+                            # 超大的工具结果在进程池中序列化，不阻塞其他对话流
+                            payload = await get_executor().run(
+                                len(output) if isinstance(output, str) else 0,
+                                dumps,
+                                chunk,
+                                process=True,
+                            )
+                            yield f"{DATA_PREFIX}{payload}\n\n"
 
                         # 工具调用完成，递归继续主流程
+                        tool_rounds += 1
                         tool_call_count += 1
                         if tool_call_count < max_tools:
                             await asyncio.sleep(0.05)
@@ -339,12 +861,82 @@ class ChatAgent:
                                 yield msg
             # 补 所有的结束
             if message_status["reasoning"]:
-                yield f"{DATA_PREFIX}{json.dumps({'id': message_status['reasoning'], 'type': 'reasoning-end'})}\n\n"
+                yield sse_event({"id": message_status["reasoning"], "type": "reasoning-end"})
 
             if message_status["text"]:
-                yield f"{DATA_PREFIX}{json.dumps({'id': message_status['text'], 'type': 'text-end'})}\n\n"
+                yield sse_event({"id": message_status["text"], "type": "text-end"})
+
+        async def traced_run() -> AsyncGenerator[str, Any]:
+            with generator_span("agent.ask") as span:
+                # 可缓存的提问记录本轮发送的事件，完整结束后写入回答缓存
+                frames: list[str] | None = [] if cacheable else None
+                try:
+                    # 告知客户端助手消息ID，下一轮的 lastMessageId 与服务端历史一致
+                    yield sse_event({"type": "start", "messageId": answer_id})
+                    async for msg in run():
+                        if frames is not None:
+                            frames.append(msg)
+                        yield msg
+                    # 调用过工具的回答可能包含时效性结果（搜索、新闻等），
+                    # 只有全部工具都在 ANSWER_CACHE_TOOLS 中时才缓存
+                    if (
+                        frames is not None
+                        and answer
+                        and called_tools.issubset(setting.ANSWER_CACHE_TOOLS)
+                    ):
+                        cache.store(
+                            user_message,
+                            cache_namespace,
+                            frames,
+                            "".join(answer),
+                            cache_vector,
+                        )
+                finally:
+                    self.record_turn(
+                        [{"type": "text", "text": user_message}, *attachment_parts]
+                        if attachment_parts
+                        else user_message,
+                        message_id or f"msg-{uuid.uuid4().hex}",
+                        "".join(answer),
+                        answer_id,
+                    )
+                    TOOL_ROUNDS_PER_TURN.observe(tool_rounds)
+                    span.set_attribute("agent.tool_rounds", tool_rounds)
+                    self.maybe_compact()
+
+        return traced_run()
 
-        return run()
+    async def replay_answer(
+        self,
+        user_message: str,
+        message_id: str | None,
+        cached: CachedAnswer,
+        interval: float,
+    ) -> AsyncGenerator[str, Any]:
+        """回放缓存的回答，事件序列与实时回答相同，不调用LLM与工具。
+
+        Args:
+            user_message: 用户消息
+            message_id: 用户消息ID，未提供时自动生成
+            cached: 缓存的回答
+            interval: 事件之间的间隔（秒）
+        """
+        answer_id = f"msg-{uuid.uuid4().hex}"
+        with generator_span(
+            "agent.ask", attributes={"agent.answer_cache": "hit"}
+        ):
+            try:
+                yield sse_event({"type": "start", "messageId": answer_id})
+                async for frame in get_answer_cache().replay(cached, interval):
+                    yield frame
+            finally:
+                self.record_turn(
+                    user_message,
+                    message_id or f"msg-{uuid.uuid4().hex}",
+                    cached.answer,
+                    answer_id,
+                )
+                TOOL_ROUNDS_PER_TURN.observe(0)
 
     async def connect(self) -> None:
         """连接到MCP服务。"""
@@ -355,6 +947,9 @@ class ChatAgent:
     async def close(self) -> None:
         """关闭连接并清理资源。"""
         try:
+            if self.compacting:
+                self._compaction.cancel()
+            get_mcp_config_watcher().unsubscribe(self.apply_config_diff)
             await self.cleanup_servers()
             logger.info(f"用户 {self.chat_id} 的ChatAgent资源已清理")
         except Exception as e:
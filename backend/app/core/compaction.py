@@ -0,0 +1,71 @@
+"""对话历史压缩模块。
+
+对话较长时，把较早的轮次折叠进一段滚动摘要，摘要替代这些轮次进入提示词。
+每次只把新折叠的轮次与已有摘要合并，不重新摘要全部历史。
+"""
+
+from typing import Any, Dict, List
+
+from app.services.llm_client import LLMClient, UsageCallback
+
+SUMMARY_INSTRUCTION = """你负责维护一段对话摘要，供助手在后续对话中参考。
+请将【已有摘要】与【新增对话】合并为一段新的摘要：
+- 保留所有事实、数字、名称、用户的偏好与约束、已做出的决定和未完成的事项；
+- 删除寒暄与重复内容，不要编造对话中没有的信息；
+- 使用与对话相同的语言，直接输出摘要正文。"""
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """提取消息中的文本，附件只保留文件名。"""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    texts = []
+    for part in content or ():
+        if part.get("type") == "text":
+            texts.append(part.get("text", ""))
+        elif part.get("type") == "attachment":
+            attachment = part.get("attachment") or {}
+            texts.append(f"[附件: {attachment.get('filename') or attachment.get('media_type')}]")
+    return "\n".join(texts)
+
+
+def render_turns(messages: List[Dict[str, Any]]) -> str:
+    roles = {"user": "用户", "assistant": "助手"}
+    return "\n\n".join(
+        f"{roles.get(message['role'], message['role'])}: {message_text(message)}"
+        for message in messages
+    )
+
+
+async def summarize(
+    llm_client: LLMClient,
+    summary: str,
+    messages: List[Dict[str, Any]],
+    model: str | None = None,
+    on_usage: UsageCallback | None = None,
+    user_id: str = "",
+) -> str:
+    """将新折叠的轮次合并进已有摘要。
+
+    Args:
+        llm_client: LLM客户端
+        summary: 已有摘要，首次压缩时为空
+        messages: 需要折叠的消息
+        model: 摘要使用的模型，默认使用对话模型
+        on_usage: 接收本次调用token用量的回调
+        user_id: 用户ID，用于限流时的公平调度
+
+    Returns:
+        新的摘要
+    """
+    prompt = f"【已有摘要】\n{summary or '（无）'}\n\n【新增对话】\n{render_turns(messages)}"
+    return await llm_client.complete(
+        [
+            {"role": "system", "content": SUMMARY_INSTRUCTION},
+            {"role": "user", "content": prompt},
+        ],
+        model=model,
+        on_usage=on_usage,
+        user_id=user_id,
+    )
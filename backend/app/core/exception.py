@@ -2,3 +2,9 @@ class ToolExecutionException(Exception):
     """工具执行异常"""
 
     pass
+
+
+class BlobTooLargeException(Exception):
+    """附件超过大小限制"""
+
+    pass
@@ -0,0 +1,262 @@
+"""依赖健康探测模块。
+
+后台按间隔探测MCP服务、LLM接口与mem0，结果缓存在内存中，
+健康检查接口只读取缓存，不在请求路径上访问任何外部依赖。
+"""
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Literal, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+
+from app.config.configuration import get_setting
+from app.config.watcher import get_mcp_config_watcher
+from app.services.mcp_client import Client
+from app.utils.telemetry import HEALTH_PROBE_SECONDS, HEALTH_PROBE_UP
+
+if TYPE_CHECKING:
+    from app.core.agent import ChatAgent
+
+# degraded：依赖可达但暂时受限（如服务商限流），不影响就绪状态
+ProbeStatus = Literal["ok", "degraded", "error", "unknown"]
+
+
+class ProbeResult(BaseModel):
+    """单个依赖的探测结果。"""
+
+    status: ProbeStatus
+    latency: Optional[float] = None  # 探测耗时（秒）
+    detail: Optional[str] = None
+    checked_at: float  # 探测完成时间（unix时间戳）
+
+
+def probe_result(
+    status: ProbeStatus,
+    latency: Optional[float] = None,
+    detail: Optional[str] = None,
+) -> ProbeResult:
+    return ProbeResult(
+        status=status, latency=latency, detail=detail, checked_at=time.time()
+    )
+
+
+class HealthMonitor:
+    """周期性探测依赖并缓存结果。"""
+
+    def __init__(self) -> None:
+        self.llm: Optional[ProbeResult] = None
+        self.mem0: Optional[ProbeResult] = None
+        self.mcp: Dict[str, ProbeResult] = {}
+        self._agents: Callable[[], List["ChatAgent"]] = list
+        self._tasks: List[asyncio.Task] = []
+        self._timeout: float = 5.0
+
+    @property
+    def probed(self) -> bool:
+        """所有依赖是否都已完成至少一次探测。"""
+        return (
+            self.llm is not None
+            and self.mem0 is not None
+            and bool(self.mcp or not get_mcp_config_watcher().servers)
+        )
+
+    def degraded(self) -> List[str]:
+        """返回可达但暂时受限的依赖名称。"""
+        return [
+            name
+            for name, result in (("llm", self.llm), ("mem0", self.mem0))
+            if result is not None and result.status == "degraded"
+        ]
+
+    def failures(self) -> List[str]:
+        """返回探测失败的依赖名称。"""
+        failed = [
+            name
+            for name, result in (("llm", self.llm), ("mem0", self.mem0))
+            if result is not None and result.status == "error"
+        ]
+        failed += [
+            f"mcp.{name}" for name, result in self.mcp.items() if result.status == "error"
+        ]
+        return failed
+
+    def _record(self, probe: str, result: ProbeResult) -> ProbeResult:
+        HEALTH_PROBE_UP.labels(probe).set(
+            1 if result.status in ("ok", "degraded") else 0
+        )
+        if result.latency is not None:
+            HEALTH_PROBE_SECONDS.labels(probe).set(result.latency)
+        if result.status == "error":
+            logger.warning(f"依赖探测失败 {probe}: {result.detail}")
+        elif result.status == "degraded":
+            logger.info(f"依赖暂时受限 {probe}: {result.detail}")
+        return result
+
+    async def probe_llm(self) -> None:
+        """发送只生成一个token的流式请求，测量首token耗时。
+
+        探测与对话共享限流器并使用后台优先级，不挤占对话的配额；超时内没有排到配额时跳过本次探测。
+        服务商限流（429）说明接口可达、只是配额用尽，记为 degraded 而不是失败，
+        否则流量接近配额时所有worker会同时变为未就绪。
+        """
+        from openai import RateLimitError
+
+        from app.services.llm_client import get_openai_client
+        from app.services.rate_limiter import estimate_request_tokens, get_rate_limiter
+
+        model = get_setting().LLM_MODEL
+        messages = [{"role": "user", "content": "ping"}]
+        limiter = get_rate_limiter()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                limiter.acquire(
+                    model, estimate_request_tokens(messages) + 1, priority="background"
+                ),
+                self._timeout,
+            )
+        except asyncio.TimeoutError:
+            self.llm = self._record(
+                "llm",
+                probe_result(
+                    "degraded", time.perf_counter() - start, "限流排队超时，跳过本次探测"
+                ),
+            )
+            return
+        start = time.perf_counter()
+        try:
+            client = get_openai_client().with_options(
+                timeout=self._timeout, max_retries=0
+            )
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=1,
+                stream=True,
+            )
+            async for _ in stream:
+                break
+            ttft = time.perf_counter() - start
+            await stream.close()
+            self.llm = self._record("llm", probe_result("ok", ttft))
+        except RateLimitError as e:
+            # 同步暂停该模型的请求，与对话收到429时的处理一致
+            limiter.rate_limited(model, e.response.headers, 1)
+            self.llm = self._record(
+                "llm", probe_result("degraded", time.perf_counter() - start, str(e))
+            )
+        except Exception as e:
+            self.llm = self._record(
+                "llm", probe_result("error", time.perf_counter() - start, str(e))
+            )
+
+    async def probe_mem0(self) -> None:
+        """复用已有Agent的mem0客户端连接访问ping接口。"""
+        clients = [
+            agent.mem0_client
+            for agent in self._agents()
+            if getattr(agent, "mem0_client", None) is not None
+        ]
+        http_client = getattr(clients[0], "async_client", None) if clients else None
+        if http_client is None:
+            self.mem0 = self._record(
+                "mem0", probe_result("unknown", detail="暂无mem0客户端")
+            )
+            return
+
+        start = time.perf_counter()
+        try:
+            response = await http_client.get("/v1/ping/", timeout=self._timeout)
+            response.raise_for_status()
+            self.mem0 = self._record(
+                "mem0", probe_result("ok", time.perf_counter() - start)
+            )
+        except Exception as e:
+            self.mem0 = self._record(
+                "mem0", probe_result("error", time.perf_counter() - start, str(e))
+            )
+
+    async def _ping_server(self, name: str, config: dict) -> ProbeResult:
+        """探测单个MCP服务：优先复用已建立的会话，没有时临时建立连接。"""
+        clients = [
+            server
+            for agent in self._agents()
+            for server in agent.servers
+            if server.name == name
+        ]
+        live = [c for c in clients if c.session is not None and not c.draining]
+        start = time.perf_counter()
+        try:
+            if live:
+                await asyncio.wait_for(live[0].session.send_ping(), self._timeout)
+                detail = f"{len(live)}/{len(clients)} 个会话可用"
+            else:
+                client = Client(name, config)
+                try:
+                    await asyncio.wait_for(client.initialize(), self._timeout)
+                    await asyncio.wait_for(client.session.send_ping(), self._timeout)
+                finally:
+                    await client.cleanup()
+                detail = "无活跃会话，临时连接成功"
+            return probe_result("ok", time.perf_counter() - start, detail)
+        except Exception as e:
+            return probe_result(
+                "error", time.perf_counter() - start, f"{type(e).__name__}: {e}"
+            )
+
+    async def probe_mcp(self) -> None:
+        """并发探测配置中的所有MCP服务。"""
+        servers = dict(get_mcp_config_watcher().servers)
+        results = await asyncio.gather(
+            *(self._ping_server(name, config) for name, config in servers.items())
+        )
+        self.mcp = {
+            name: self._record(f"mcp.{name}", result)
+            for name, result in zip(servers, results)
+        }
+
+    async def _every(self, interval: float, probe: Callable[[], Awaitable[None]]) -> None:
+        while True:
+            try:
+                await probe()
+            except Exception as e:
+                logger.error(f"依赖探测出错: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self, agents: Callable[[], List["ChatAgent"]]) -> None:
+        """启动后台探测任务。
+
+        Args:
+            agents: 返回当前所有Agent的函数，用于复用其MCP会话与mem0客户端
+        """
+        if self._tasks:
+            return
+        setting = get_setting()
+        self._agents = agents
+        self._timeout = setting.HEALTH_PROBE_TIMEOUT
+
+        async def probe_dependencies() -> None:
+            await asyncio.gather(self.probe_mcp(), self.probe_mem0())
+
+        self._tasks = [
+            asyncio.create_task(
+                self._every(setting.HEALTH_PROBE_INTERVAL, probe_dependencies)
+            ),
+            # LLM探测会产生实际调用，单独使用更长的间隔
+            asyncio.create_task(
+                self._every(setting.HEALTH_LLM_PROBE_INTERVAL, self.probe_llm)
+            ),
+        ]
+
+    async def stop(self) -> None:
+        """停止后台探测任务。"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+# 创建单例
+health_monitor = HealthMonitor()
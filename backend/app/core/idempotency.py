@@ -0,0 +1,210 @@
+"""对话提交的幂等处理模块。
+
+前端在网络抖动时会重试同一条消息的提交。以用户消息ID为键记录每一轮的输出：
+轮次仍在进行时，重复提交订阅同一个广播，从头收到已发送与后续的事件；
+轮次已结束时直接回放记录的输出。重复提交不会再次调用LLM或工具，也不会重复写入历史。
+
+每一轮的生成在独立任务中进行，与发起请求的连接解耦，原连接断开后重试仍可接上；
+所有订阅者都断开（客户端中止或停止生成）且宽限期内没有重新订阅时取消生成，不再继续消耗token与调用工具。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import AsyncGenerator, List, Optional, Tuple
+
+from loguru import logger
+
+from app.config.configuration import get_setting
+from app.core.lifecycle import lifecycle
+
+# 幂等键：(用户, 对话, 客户端最后已知的消息, 用户消息)
+TurnKey = Tuple[str, str, Optional[str], str]
+
+
+class TurnBroadcast:
+    """记录一轮对话的SSE事件，并分发给所有订阅者。"""
+
+    def __init__(self, abandon_grace: float = 5.0) -> None:
+        """初始化TurnBroadcast。
+
+        Args:
+            abandon_grace: 没有订阅者后等待重新订阅的时间（秒），超时后取消生成
+        """
+        self.frames: List[str] = []
+        self.done: bool = False
+        self.finished_at: Optional[float] = None
+        # 没有订阅者而被取消的轮次，重复提交时重新生成
+        self.abandoned: bool = False
+        self.subscribers: int = 0
+        self.abandon_grace = abandon_grace
+        self._changed: asyncio.Event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+
+    def _notify(self) -> None:
+        # 唤醒当前的等待者，之后的等待者使用新的事件
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def start(self, source: AsyncGenerator[str, None]) -> None:
+        """在后台任务中运行生成器并广播其输出。
+
+        Args:
+            source: 本轮对话的SSE事件生成器
+        """
+        self._task = asyncio.create_task(self._pump(source))
+        if not self.subscribers:
+            self._schedule_abandon()
+
+    async def _pump(self, source: AsyncGenerator[str, None]) -> None:
+        try:
+            # 生成任务同样计入进行中的流，关闭时排空或取消
+            async for frame in lifecycle.track(source):
+                self.frames.append(frame)
+                self._notify()
+        except Exception as e:
+            logger.error(f"对话生成任务出错: {e}")
+        finally:
+            self.finish()
+
+    def _schedule_abandon(self) -> None:
+        if self._abandon_timer is None and not self.done:
+            self._abandon_timer = asyncio.get_running_loop().call_later(
+                self.abandon_grace, self._abandon
+            )
+
+    def _abandon(self) -> None:
+        self._abandon_timer = None
+        if self.subscribers or self.done:
+            return
+        logger.info("对话轮次已没有订阅者，取消生成")
+        self.abandoned = True
+        self.cancel()
+
+    def finish(self) -> None:
+        """标记本轮结束，订阅者收完已记录的事件后退出。"""
+        if not self.done:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._notify()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """从头订阅本轮的事件，直到本轮结束。
+
+        最后一个订阅者提前断开时开始计时，宽限期内没有新的订阅则取消生成。
+        """
+        self.subscribers += 1
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+        try:
+            index = 0
+            while True:
+                changed = self._changed
+                while index < len(self.frames):
+                    yield self.frames[index]
+                    index += 1
+                if self.done:
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers:
+                self._schedule_abandon()
+
+    def cancel(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+class TurnRegistry:
+    """按幂等键保存进行中与最近结束的轮次。"""
+
+    def __init__(self, ttl: float, max_turns: int, abandon_grace: float = 5.0):
+        """初始化TurnRegistry。
+
+        Args:
+            ttl: 轮次结束后保留输出的时间（秒）
+            max_turns: 最多保留的轮次数，超出时按登记顺序淘汰已结束的轮次
+            abandon_grace: 轮次没有订阅者后等待重新订阅的时间（秒），超时后取消生成
+        """
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.abandon_grace = abandon_grace
+        self._turns: "OrderedDict[TurnKey, TurnBroadcast]" = OrderedDict()
+
+    @staticmethod
+    def key(
+        user_id: str,
+        chat_id: str,
+        last_message_id: Optional[str],
+        message_id: str,
+        trigger: str,
+    ) -> Optional[TurnKey]:
+        """返回提交的幂等键，重新生成回答不做幂等处理，返回None。"""
+        if trigger != "submit-message":
+            return None
+        return user_id, chat_id, last_message_id, message_id
+
+    def get(self, key: TurnKey) -> Optional[TurnBroadcast]:
+        turn = self._turns.get(key)
+        # 被取消的轮次输出不完整，重复提交时重新生成
+        if turn is not None and turn.done and (
+            turn.abandoned or time.monotonic() - turn.finished_at > self.ttl
+        ):
+            del self._turns[key]
+            return None
+        return turn
+
+    def claim(self, key: TurnKey) -> Tuple[TurnBroadcast, bool]:
+        """获取或登记一个轮次。
+
+        Args:
+            key: 幂等键
+
+        Returns:
+            轮次的广播，以及是否为本次新登记（为False时是重复提交）
+        """
+        turn = self.get(key)
+        if turn is not None:
+            return turn, False
+        self._evict()
+        turn = self._turns[key] = TurnBroadcast(self.abandon_grace)
+        return turn, True
+
+    def discard(self, key: TurnKey) -> None:
+        """移除未能开始生成的轮次，并让已订阅的重复提交结束。"""
+        turn = self._turns.pop(key, None)
+        if turn is not None:
+            turn.finish()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key, turn in list(self._turns.items()):
+            if turn.done and now - turn.finished_at > self.ttl:
+                del self._turns[key]
+        if len(self._turns) < self.max_turns:
+            return
+        # 进行中的轮次不淘汰
+        finished = [key for key, turn in self._turns.items() if turn.done]
+        for key in finished[: len(self._turns) - self.max_turns + 1]:
+            del self._turns[key]
+
+    def close(self) -> None:
+        """取消所有进行中的生成任务。"""
+        for turn in self._turns.values():
+            turn.cancel()
+        self._turns.clear()
+
+
+@lru_cache(maxsize=1)
+def get_turn_registry() -> TurnRegistry:
+    """返回单例轮次登记表，首次调用时根据配置创建。"""
+    setting = get_setting()
+    return TurnRegistry(
+        setting.IDEMPOTENCY_TTL,
+        setting.IDEMPOTENCY_MAX_TURNS,
+        setting.IDEMPOTENCY_ABANDON_GRACE,
+    )
@@ -0,0 +1,117 @@
+"""服务生命周期模块：跟踪进行中的SSE流，关闭时停止接收新请求并在期限内排空。"""
+
+import asyncio
+import signal
+import threading
+from typing import AsyncGenerator, Optional, Set, TypeVar
+
+from loguru import logger
+
+T = TypeVar("T")
+
+
+class Lifecycle:
+    """跟踪进行中的流式响应，支持优雅关闭。
+
+    uvicorn 收到退出信号后会先等待所有连接结束，再执行 lifespan 的关闭逻辑，
+    因此这里在信号到达时就停止接收新对话，并在期限到达后取消仍未结束的流。
+    """
+
+    def __init__(self) -> None:
+        self.accepting: bool = True
+        self._streams: Set[asyncio.Task] = set()
+        self._idle: asyncio.Event = asyncio.Event()
+        self._idle.set()
+        self._deadline: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def active_streams(self) -> int:
+        return len(self._streams)
+
+    async def track(self, generator: AsyncGenerator[T, None]) -> AsyncGenerator[T, None]:
+        """包装流式生成器，记录其所在的请求任务。
+
+        Args:
+            generator: 原始生成器
+
+        Yields:
+            原始生成器的输出
+        """
+        task = asyncio.current_task()
+        self._streams.add(task)
+        self._idle.clear()
+        try:
+            async for item in generator:
+                yield item
+        finally:
+            self._streams.discard(task)
+            if not self._streams:
+                self._idle.set()
+
+    def begin_drain(self, timeout: float) -> None:
+        """停止接收新请求，期限到达后取消仍在进行的流。
+
+        Args:
+            timeout: 等待进行中的流结束的最长时间（秒）
+        """
+        if not self.accepting:
+            return
+        self.accepting = False
+        logger.info(
+            f"开始排空，停止接收新请求，等待 {self.active_streams} 个进行中的流，期限 {timeout} 秒"
+        )
+        self._deadline = asyncio.get_running_loop().call_later(
+            timeout, self.cancel_streams
+        )
+
+    def cancel_streams(self) -> None:
+        """取消所有仍在进行的流。"""
+        if self._streams:
+            logger.warning(f"排空期限已到，取消 {len(self._streams)} 个未结束的流")
+        for task in list(self._streams):
+            task.cancel()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """等待所有流结束。
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            是否在期限内全部结束
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if self._deadline is not None:
+                self._deadline.cancel()
+
+    def install_signal_handlers(self, timeout: float) -> None:
+        """在服务器已有的退出信号处理之前插入排空逻辑。
+
+        只能在主线程中注册信号处理，其他情况下仅在 lifespan 关闭时排空。
+
+        Args:
+            timeout: 排空期限（秒）
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            previous = signal.getsignal(sig)
+            # 只串联服务器注册的处理函数，默认处理保持不变
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.begin_drain, timeout)
+                previous(signum, frame)
+
+            signal.signal(sig, handler)
+
+
+# 创建单例
+lifecycle = Lifecycle()
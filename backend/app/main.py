@@ -1,15 +1,102 @@
-from fastapi import FastAPI
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api.chat import router
+from loguru import logger
+
+from app.api.chat import manager, router
+from app.api.files import router as files_router
+from app.api.health import router as health_router
+from app.config.configuration import get_setting
+from app.config.watcher import get_mcp_config_watcher
+from app.core.health import health_monitor
+from app.core.idempotency import get_turn_registry
+from app.core.lifecycle import lifecycle
 from app.utils.logging import setup_logging
+from app.utils.loop_monitor import loop_monitor
+from app.services.usage import get_usage_meter
+from app.utils.offload import get_executor
+from app.utils.prewarm import preload_modules
+from app.utils.telemetry import render_metrics, setup_tracing, shutdown_tracing
 
 # 设置日志
 setup_logging()
 
+
+async def prewarm_resources() -> None:
+    """后台预热：导入重量级依赖，再创建备用Agent并建立LLM连接，最后开始依赖探测。"""
+    setting = get_setting()
+    if setting.PREWARM_IMPORTS:
+        await asyncio.to_thread(preload_modules)
+    # 延迟导入，保持应用导入阶段不加载openai
+    from app.services.llm_client import prewarm_llm_connections
+
+    await asyncio.gather(
+        manager.prewarm(setting.PREWARM_AGENTS),
+        prewarm_llm_connections(setting.PREWARM_LLM_CONNECTIONS),
+    )
+    # 预热完成后再开始探测：探测会在事件循环中导入依赖，与预热线程争用导入锁会阻塞循环，
+    # 且备用Agent就绪后可直接复用其MCP会话
+    health_monitor.start(manager.all_agents)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期。
+
+    启动时配置链路追踪、开始监听MCP配置、事件循环监控与依赖健康探测，并在后台预热依赖、
+    备用Agent与LLM连接，不阻塞服务开始监听。关闭时先排空进行中的对话流，再依次释放Agent、
+    LLM连接池、链路导出与日志队列。
+    """
+    setting = get_setting()
+    # 设置链路追踪
+    setup_tracing(setting.OTEL_EXPORTER_OTLP_ENDPOINT, setting.OTEL_SERVICE_NAME)
+    # uvicorn 在连接全部结束后才执行关闭逻辑，排空需要在收到信号时就开始
+    lifecycle.install_signal_handlers(setting.SHUTDOWN_DRAIN_TIMEOUT)
+    loop_monitor.start(
+        setting.LOOP_MONITOR_INTERVAL, setting.LOOP_BLOCK_THRESHOLD, setting.LOOP_DEBUG
+    )
+    get_mcp_config_watcher().start()
+    await get_usage_meter().start(setting.USAGE_FLUSH_INTERVAL)
+    prewarm = asyncio.create_task(prewarm_resources())
+    yield
+
+    lifecycle.begin_drain(setting.SHUTDOWN_DRAIN_TIMEOUT)
+    if not await lifecycle.wait_idle(setting.SHUTDOWN_DRAIN_TIMEOUT):
+        lifecycle.cancel_streams()
+    if get_turn_registry.cache_info().currsize:
+        get_turn_registry().close()
+    if not prewarm.done():
+        prewarm.cancel()
+        try:
+            await prewarm
+        except (asyncio.CancelledError, Exception):
+            pass
+    await health_monitor.stop()
+    await loop_monitor.stop()
+    await get_mcp_config_watcher().stop()
+    await manager.close_all()
+    await get_usage_meter().stop()
+    if get_executor.cache_info().currsize:
+        get_executor().shutdown()
+    # 只关闭已创建的共享LLM客户端
+    llm_client = sys.modules.get("app.services.llm_client")
+    if llm_client is not None and llm_client.get_openai_client.cache_info().currsize:
+        await llm_client.get_openai_client().close()
+    shutdown_tracing()
+    logger.info("服务已关闭")
+    await logger.complete()
+
+
 # 创建FastAPI应用
 app = FastAPI(
-    title="Wiley AI Backend", description="Wiley AI聊天后端API", version="1.0.0"
+    title="Wiley AI Backend",
+    description="Wiley AI聊天后端API",
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # 添加CORS中间件
@@ -23,10 +110,20 @@ app.add_middleware(
 
 # 注册路由
 app.include_router(router, prefix="/api")
+app.include_router(files_router, prefix="/api")
+app.include_router(health_router)
 
 
 # 健康检查端点
 @app.get("/health")
 async def health_check():
-    """健康检查端点。"""
+    """存活检查端点，只表示进程可以响应请求，依赖状态见 /ready 与 /health/deep。"""
     return {"status": "ok"}
+
+
+# Prometheus指标端点
+@app.get("/metrics")
+async def metrics():
+    """Prometheus指标端点。"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
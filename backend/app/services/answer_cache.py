@@ -0,0 +1,273 @@
+"""回答缓存模块。
+
+对不依赖个人记忆与历史上下文的首轮提问缓存完整的SSE事件序列，重复提问时直接回放，
+不调用LLM与工具。分两级：
+
+- 精确匹配：键为规范化后的问题、系统提示词哈希与工具目录版本；
+- 语义匹配（可选）：配置了嵌入模型时，在本地向量索引中按余弦相似度查找相近的问题。
+
+缓存只保存在当前进程内存中。
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.config.configuration import get_setting
+from app.utils.telemetry import ANSWER_CACHE_LOOKUPS
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from app.services.llm_client import UsageCallback
+
+# 规范化时去除的结尾标点
+TRAILING_PUNCTUATION = re.compile(r"[\s?？!！.。~～]+$")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """规范化问题：统一全半角与大小写，合并空白，去掉结尾标点。"""
+    text = unicodedata.normalize("NFKC", text).lower().strip()
+    return TRAILING_PUNCTUATION.sub("", WHITESPACE.sub(" ", text))
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class CachedAnswer:
+    """一次回答的SSE帧序列与最终文本。"""
+
+    __slots__ = ("frames", "answer", "namespace", "expires_at")
+
+    def __init__(
+        self, frames: List[str], answer: str, namespace: str, expires_at: float
+    ) -> None:
+        self.frames = frames
+        self.answer = answer
+        self.namespace = namespace
+        self.expires_at = expires_at
+
+
+class VectorIndex:
+    """按命名空间划分的内存向量索引，向量已归一化，点积即余弦相似度。"""
+
+    def __init__(self) -> None:
+        self._keys: Dict[str, List[str]] = {}
+        self._vectors: Dict[str, List["np.ndarray"]] = {}
+        self._matrices: Dict[str, "np.ndarray"] = {}
+
+    def add(self, namespace: str, key: str, vector: "np.ndarray") -> None:
+        self._keys.setdefault(namespace, []).append(key)
+        self._vectors.setdefault(namespace, []).append(vector)
+        self._matrices.pop(namespace, None)
+
+    def remove(self, namespace: str, key: str) -> None:
+        keys = self._keys.get(namespace) or []
+        if key in keys:
+            index = keys.index(key)
+            del keys[index]
+            del self._vectors[namespace][index]
+            self._matrices.pop(namespace, None)
+
+    def search(self, namespace: str, vector: "np.ndarray") -> Tuple[Optional[str], float]:
+        """返回命名空间内最相似的键与相似度。"""
+        import numpy as np
+
+        keys = self._keys.get(namespace)
+        if not keys:
+            return None, 0.0
+        matrix = self._matrices.get(namespace)
+        if matrix is None:
+            matrix = self._matrices[namespace] = np.vstack(self._vectors[namespace])
+        scores = matrix @ vector
+        best = int(scores.argmax())
+        return keys[best], float(scores[best])
+
+
+class AnswerCache:
+    """首轮问答的精确与语义缓存，按最近使用淘汰并带有过期时间。"""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        embedding_model: Optional[str] = None,
+        similarity: float = 0.95,
+    ):
+        """初始化AnswerCache。
+
+        Args:
+            max_entries: 最大缓存条数
+            ttl: 缓存有效期（秒）
+            embedding_model: 语义匹配使用的嵌入模型，为None时只做精确匹配
+            similarity: 语义匹配的最低余弦相似度
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embedding_model = embedding_model
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self._index = VectorIndex()
+
+    @staticmethod
+    def namespace(system_prompt: str, tools_version: str) -> str:
+        """系统提示词或工具目录变化后，旧的回答不再命中。"""
+        return f"{hash_text(system_prompt)}:{tools_version}"
+
+    @staticmethod
+    def key(namespace: str, prompt: str) -> str:
+        return f"{namespace}:{hash_text(normalize_prompt(prompt))}"
+
+    def _get(self, key: str) -> Optional[CachedAnswer]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and self.embedding_model:
+            self._index.remove(entry.namespace, key)
+
+    async def _embed(
+        self,
+        text: str,
+        on_usage: Optional["UsageCallback"] = None,
+        user_id: str = "",
+    ) -> "np.ndarray":
+        """计算问题向量，与对话共享限流器并计量用量。"""
+        import numpy as np
+        from openai import RateLimitError
+
+        from app.services.llm_client import get_openai_client
+        from app.services.rate_limiter import estimate_request_tokens, get_rate_limiter
+
+        text = normalize_prompt(text)
+        limiter = get_rate_limiter()
+        estimated = estimate_request_tokens([{"role": "user", "content": text}])
+        await limiter.acquire(self.embedding_model, estimated, user_id)
+        usage: Dict[str, Any] | None = None
+        try:
+            # 限流由共享限流器处理，不使用SDK的自动重试
+            response = await (
+                get_openai_client()
+                .with_options(max_retries=0)
+                .embeddings.create(model=self.embedding_model, input=text)
+            )
+            if response.usage is not None:
+                usage = response.usage.model_dump()
+        except RateLimitError as e:
+            limiter.rate_limited(self.embedding_model, e.response.headers, 1)
+            raise
+        finally:
+            limiter.settle(self.embedding_model, estimated, usage)
+            if usage and on_usage is not None:
+                on_usage(self.embedding_model, usage)
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    async def lookup(
+        self,
+        prompt: str,
+        namespace: str,
+        on_usage: Optional["UsageCallback"] = None,
+        user_id: str = "",
+    ) -> Tuple[Optional[CachedAnswer], Optional["np.ndarray"]]:
+        """查找缓存的回答。
+
+        Args:
+            prompt: 用户问题
+            namespace: 由系统提示词与工具目录版本确定的命名空间
+            on_usage: 接收计算问题向量时token用量的回调
+            user_id: 发起请求的用户ID，用于限流时的公平调度
+
+        Returns:
+            命中的回答（未命中时为None），以及语义匹配时计算的问题向量（供写入时复用）
+        """
+        entry = self._get(self.key(namespace, prompt))
+        if entry is not None:
+            ANSWER_CACHE_LOOKUPS.labels("exact", "hit").inc()
+            return entry, None
+        if not self.embedding_model:
+            ANSWER_CACHE_LOOKUPS.labels("exact", "miss").inc()
+            return None, None
+
+        try:
+            vector = await self._embed(prompt, on_usage, user_id)
+        except Exception as e:
+            logger.warning(f"计算问题向量失败，跳过语义缓存: {e}")
+            ANSWER_CACHE_LOOKUPS.labels("semantic", "error").inc()
+            return None, None
+        key, score = self._index.search(namespace, vector)
+        entry = self._get(key) if key is not None and score >= self.similarity else None
+        ANSWER_CACHE_LOOKUPS.labels("semantic", "hit" if entry else "miss").inc()
+        if entry is not None:
+            logger.debug(f"语义缓存命中，相似度 {score:.3f}")
+        return entry, vector
+
+    def store(
+        self,
+        prompt: str,
+        namespace: str,
+        frames: List[str],
+        answer: str,
+        vector: Optional["np.ndarray"] = None,
+    ) -> None:
+        """写入一次完整回答。
+
+        Args:
+            prompt: 用户问题
+            namespace: 命名空间
+            frames: 回答的SSE帧（不含携带消息ID的start帧）
+            answer: 回答文本
+            vector: 问题向量，启用语义匹配时写入索引
+        """
+        key = self.key(namespace, prompt)
+        self._evict(key)
+        self._entries[key] = CachedAnswer(
+            frames, answer, namespace, time.monotonic() + self.ttl
+        )
+        if vector is not None:
+            self._index.add(namespace, key, vector)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    @staticmethod
+    async def replay(
+        entry: CachedAnswer, interval: float
+    ) -> AsyncGenerator[str, None]:
+        """按配置的间隔回放缓存的SSE帧。
+
+        Args:
+            entry: 缓存的回答
+            interval: 帧之间的间隔（秒），为0时立即发送全部帧
+        """
+        for frame in entry.frames:
+            yield frame
+            if interval:
+                await asyncio.sleep(interval)
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> AnswerCache:
+    """返回单例回答缓存，首次调用时根据配置创建。"""
+    setting = get_setting()
+    return AnswerCache(
+        setting.ANSWER_CACHE_MAX_ENTRIES,
+        setting.ANSWER_CACHE_TTL,
+        setting.ANSWER_CACHE_EMBEDDING_MODEL,
+        setting.ANSWER_CACHE_SIMILARITY,
+    )
@@ -0,0 +1,349 @@
+"""本地内容寻址的附件存储。
+
+附件按SHA-256存储在本地目录，相同内容只保存一份。写入时逐块落盘并计算哈希，
+不在内存中缓存完整文件；发送给LLM时才按需编码。
+"""
+
+import asyncio
+import base64
+import binascii
+import contextlib
+import copy
+import hashlib
+import json
+import os
+import re
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, AsyncIterable, Dict, List, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+
+from app.config.configuration import get_setting
+from app.core.exception import BlobTooLargeException
+
+# 流式写入与读取的块大小
+CHUNK_SIZE = 64 * 1024
+# 文本附件内联给LLM的最大字符数
+TEXT_ATTACHMENT_LIMIT = 100_000
+# base64内容中允许出现并在解码前去除的空白字符
+BASE64_WHITESPACE = str.maketrans("", "", " \t\r\n\f\v")
+# 指向本地存储的附件URL，例如 /api/files/<sha256>
+BLOB_URL_PATTERN = re.compile(r"/files/([0-9a-f]{64})$")
+
+
+class Attachment(BaseModel):
+    """消息附件的引用。
+
+    历史中只保存引用，发送给LLM时再解析为具体内容。
+    """
+
+    media_type: str
+    filename: Optional[str] = None
+    blob_id: Optional[str] = None  # 本地存储中的ID（内容的SHA-256）
+    url: Optional[str] = None  # 外部URL，直接按引用传递
+    size: Optional[int] = None
+
+
+class BlobStore:
+    """内容寻址的本地附件存储。"""
+
+    def __init__(self, root: str | Path, max_size: int):
+        """初始化BlobStore。
+
+        Args:
+            root: 存储目录
+            max_size: 单个附件的最大字节数
+        """
+        self.root = Path(root)
+        self.max_size = max_size
+
+    def path(self, blob_id: str) -> Path:
+        """返回附件的存储路径，按哈希前两位分目录。
+
+        Args:
+            blob_id: 附件ID
+
+        Returns:
+            存储路径
+
+        Raises:
+            ValueError: 如果附件ID不是合法的SHA-256
+        """
+        if not re.fullmatch(r"[0-9a-f]{64}", blob_id):
+            raise ValueError(f"无效的附件ID: {blob_id}")
+        return self.root / blob_id[:2] / blob_id
+
+    def exists(self, blob_id: str) -> bool:
+        try:
+            return self.path(blob_id).is_file()
+        except ValueError:
+            return False
+
+    def media_type(self, blob_id: str) -> str:
+        """读取附件首次写入时记录的媒体类型。"""
+        meta = self.path(blob_id).with_suffix(".json")
+        try:
+            return json.loads(meta.read_text(encoding="utf-8"))["media_type"]
+        except (OSError, ValueError, KeyError):
+            return "application/octet-stream"
+
+    async def put_stream(
+        self,
+        chunks: AsyncIterable[bytes],
+        media_type: str,
+        filename: Optional[str] = None,
+    ) -> Attachment:
+        """流式写入附件。
+
+        数据逐块写入临时文件并计算哈希，完成后按哈希重命名；
+        内容已存在时丢弃临时文件，实现去重。
+
+        Args:
+            chunks: 附件内容的字节块
+            media_type: 媒体类型
+            filename: 原始文件名
+
+        Returns:
+            附件引用
+
+        Raises:
+            BlobTooLargeException: 如果附件超过大小限制
+        """
+        tmp_dir = self.root / "tmp"
+        await asyncio.to_thread(tmp_dir.mkdir, parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=tmp_dir)
+        file = open(fd, "wb")
+
+        def write(chunk: bytes) -> None:
+            hasher.update(chunk)
+            file.write(chunk)
+
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > self.max_size:
+                    raise BlobTooLargeException(
+                        f"附件超过大小限制: {self.max_size} 字节"
+                    )
+                # 哈希与写盘都放到线程中，避免阻塞事件循环
+                await asyncio.to_thread(write, chunk)
+        except BaseException:
+            file.close()
+            os.unlink(tmp_name)
+            raise
+        await asyncio.to_thread(file.close)
+
+        blob_id = hasher.hexdigest()
+        await asyncio.to_thread(self._commit, tmp_name, blob_id, media_type)
+        return Attachment(
+            media_type=media_type, filename=filename, blob_id=blob_id, size=size
+        )
+
+    def _commit(self, tmp_name: str, blob_id: str, media_type: str) -> None:
+        path = self.path(blob_id)
+        try:
+            if path.exists():
+                logger.debug(f"附件 {blob_id} 已存在，跳过写入")
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 先写入媒体类型，附件可见时元数据已就绪
+            fd, meta_tmp = tempfile.mkstemp(dir=self.root / "tmp")
+            try:
+                with open(fd, "w", encoding="utf-8") as f:
+                    json.dump({"media_type": media_type}, f)
+                os.replace(meta_tmp, path.with_suffix(".json"))
+            except BaseException:
+                os.unlink(meta_tmp)
+                raise
+            os.replace(tmp_name, path)
+        finally:
+            # 已存在或写入失败时清理临时文件，重命名成功后临时文件已不存在
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp_name)
+
+    async def put_base64(
+        self, data: str, media_type: str, filename: Optional[str] = None
+    ) -> Attachment:
+        """分块解码base64内容并写入，不生成完整的解码副本。
+
+        Args:
+            data: base64编码的内容
+            media_type: 媒体类型
+            filename: 原始文件名
+
+        Returns:
+            附件引用
+
+        Raises:
+            ValueError: 如果内容不是合法的base64
+        """
+        step = CHUNK_SIZE // 3 * 4
+
+        def decode(text: str) -> bytes:
+            try:
+                return base64.b64decode(text, validate=True)
+            except binascii.Error as e:
+                raise ValueError(f"无效的base64内容: {e}")
+
+        async def chunks():
+            # 内容可能按行折叠或带有空白，逐块去除空白后只解码4的倍数个字符，余下的并入下一块
+            pending = ""
+            for start in range(0, len(data), step):
+                pending += data[start : start + step].translate(BASE64_WHITESPACE)
+                aligned = len(pending) - len(pending) % 4
+                if aligned:
+                    yield decode(pending[:aligned])
+                    pending = pending[aligned:]
+            if pending:
+                yield decode(pending)
+
+        return await self.put_stream(chunks(), media_type, filename)
+
+    async def ingest_url(
+        self, url: str, media_type: str, filename: Optional[str] = None
+    ) -> Attachment:
+        """将前端文件part中的URL转换为附件引用。
+
+        data URL 写入本地存储；指向本地存储的URL直接引用；
+        其他URL按引用传递给LLM。
+
+        Args:
+            url: 文件URL
+            media_type: 媒体类型
+            filename: 原始文件名
+
+        Returns:
+            附件引用
+        """
+        if url.startswith("data:"):
+            header, _, data = url.partition(",")
+            if not header.endswith(";base64"):
+                raise ValueError("仅支持base64编码的data URL")
+            return await self.put_base64(data, media_type, filename)
+
+        match = BLOB_URL_PATTERN.search(url)
+        if match and self.exists(match.group(1)):
+            blob_id = match.group(1)
+            size = (await asyncio.to_thread(self.path(blob_id).stat)).st_size
+            return Attachment(
+                media_type=media_type, filename=filename, blob_id=blob_id, size=size
+            )
+
+        return Attachment(media_type=media_type, filename=filename, url=url)
+
+    async def read_bytes(self, blob_id: str, limit: int = -1) -> bytes:
+        def read() -> bytes:
+            with open(self.path(blob_id), "rb") as f:
+                return f.read(limit)
+
+        return await asyncio.to_thread(read)
+
+    async def to_openai_part(
+        self, attachment: Attachment, include_image: bool = True
+    ) -> Dict[str, Any]:
+        """将附件引用解析为OpenAI消息内容。
+
+        图片优先按URL引用传递，未配置公开地址时才编码为data URL，超过内联大小限制的图片只附上说明；
+        文本类附件内联；其他类型只附上说明。
+
+        Args:
+            attachment: 附件引用
+            include_image: 是否发送图片内容，为False时图片只附上说明
+
+        Returns:
+            OpenAI格式的消息内容
+        """
+        setting = get_setting()
+        name = attachment.filename or attachment.blob_id or attachment.url
+        if attachment.media_type.startswith("image/"):
+            if not include_image:
+                return {"type": "text", "text": f"[图片: {name}，较早的图片未发送]"}
+            if attachment.url:
+                url = attachment.url
+            elif public_base_url := setting.BLOB_PUBLIC_BASE_URL:
+                url = f"{public_base_url.rstrip('/')}/api/files/{attachment.blob_id}"
+            elif (attachment.size or 0) > setting.BLOB_INLINE_IMAGE_MAX_SIZE:
+                return {
+                    "type": "text",
+                    "text": f"[图片: {name}，大小 {attachment.size} 字节超过内联限制，未发送]",
+                }
+            else:
+                data = await self.read_bytes(attachment.blob_id)
+                encoded = await asyncio.to_thread(base64.b64encode, data)
+                url = f"data:{attachment.media_type};base64,{encoded.decode('ascii')}"
+            return {"type": "image_url", "image_url": {"url": url}}
+
+        if attachment.blob_id and (
+            attachment.media_type.startswith("text/")
+            or attachment.media_type in ("application/json", "application/xml")
+        ):
+            # UTF-8每个字符最多4字节，只读取需要的部分
+            data = await self.read_bytes(attachment.blob_id, TEXT_ATTACHMENT_LIMIT * 4)
+            text = data.decode("utf-8", errors="replace")[:TEXT_ATTACHMENT_LIMIT]
+            return {"type": "text", "text": f"附件 {name}:\n{text}"}
+
+        return {
+            "type": "text",
+            "text": f"[附件: {name}, 类型: {attachment.media_type}, 大小: {attachment.size}]",
+        }
+
+    async def resolve_messages(
+        self, messages: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """将消息中的附件引用解析为OpenAI格式，不含附件的消息原样返回。
+
+        只发送最近的 ``BLOB_HISTORY_IMAGES`` 张图片，更早的图片替换为说明，
+        每轮读取与编码的图片数量不随对话增长。
+
+        Args:
+            messages: 消息列表，附件以 ``{"type": "attachment"}`` 内容块表示
+
+        Returns:
+            可直接发送给LLM的消息列表
+        """
+        # 所有图片附件的位置 (消息序号, 内容块序号)，按出现顺序
+        images = [
+            (i, j)
+            for i, message in enumerate(messages)
+            if isinstance(message.get("content"), list)
+            for j, part in enumerate(message["content"])
+            if part.get("type") == "attachment"
+            and str(part.get("attachment", {}).get("media_type", "")).startswith("image/")
+        ]
+        omitted = set(images[: max(0, len(images) - get_setting().BLOB_HISTORY_IMAGES)])
+        resolved = []
+        for i, message in enumerate(messages):
+            content = message.get("content")
+            if not isinstance(content, list) or not any(
+                part.get("type") == "attachment" for part in content
+            ):
+                resolved.append(message)
+                continue
+            parts = []
+            for j, part in enumerate(content):
+                if part.get("type") == "attachment":
+                    try:
+                        part = await self.to_openai_part(
+                            Attachment.model_validate(part["attachment"]),
+                            include_image=(i, j) not in omitted,
+                        )
+                    except (OSError, ValueError) as e:
+                        logger.error(f"读取附件失败: {e}")
+                        part = {"type": "text", "text": "[附件读取失败]"}
+                parts.append(part)
+            message = copy.copy(message)
+            message["content"] = parts
+            resolved.append(message)
+        return resolved
+
+
+@lru_cache(maxsize=1)
+def get_blob_store() -> BlobStore:
+    """返回单例存储，首次调用时根据配置创建。"""
+    setting = get_setting()
+    return BlobStore(setting.BLOB_STORE_DIR, setting.BLOB_MAX_SIZE)
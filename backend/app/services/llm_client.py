@@ -1,17 +1,135 @@
 import asyncio
-from typing import Any, AsyncGenerator, Dict, List, TypedDict, Literal
+import hashlib
+import json
+import time
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    TypedDict,
+)
 
 from loguru import logger
-from openai import AsyncOpenAI
-from openai.types.chat import ParsedFunctionToolCall
 from pydantic import BaseModel
 from app.services.mcp_client import Client
-from app.config.configuration import setting
+from app.config.configuration import get_setting
+from app.utils.logging import truncate
+from app.services.rate_limiter import (
+    CHARS_PER_TOKEN,
+    Priority,
+    estimate_request_tokens,
+    get_rate_limiter,
+)
+from app.utils.offload import get_executor
+from app.utils.telemetry import (
+    LLM_ROUTING_DECISIONS,
+    LLM_TOKENS_PER_SECOND,
+    LLM_TTFT_SECONDS,
+    generator_span,
+    tracer,
+)
+
+
+if TYPE_CHECKING:
+    from mcp import Tool
+    from openai import AsyncOpenAI
+    from openai.types.chat import ParsedFunctionToolCall
+
+# 接收一次调用用量的回调：(模型, OpenAI格式的usage)
+UsageCallback = Callable[[str, Dict[str, Any]], None]
+
+# 工具数达到该值时在线程中转换工具目录（约5ms，与解释器的线程切换间隔相当）
+TOOL_CATALOG_INLINE_LIMIT = 1000
 
 
 class MessageChunk(BaseModel):
     type: Literal["reasoning", "message", "tool_call"]
-    data: str | list[ParsedFunctionToolCall]
+    data: "str | list[ParsedFunctionToolCall]"
+
+    @classmethod
+    def ensure_built(cls) -> None:
+        """导入openai类型并完成模型构建。
+
+        openai 的类型模块导入较慢，推迟到首次使用 ``MessageChunk`` 时。
+        """
+        if not cls.__pydantic_complete__:
+            from openai.types.chat import ParsedFunctionToolCall
+
+            cls.model_rebuild(
+                _types_namespace={"ParsedFunctionToolCall": ParsedFunctionToolCall}
+            )
+
+
+class StreamFunction:
+    """流式累积中的函数调用。"""
+
+    __slots__ = ("name", "arguments")
+
+    def __init__(self, name: str = "", arguments: str = "") -> None:
+        self.name = name
+        self.arguments = arguments
+
+
+class StreamToolCall:
+    """流式累积中的工具调用，字段与 ``ParsedFunctionToolCall`` 保持一致。"""
+
+    __slots__ = ("id", "type", "function")
+
+    def __init__(self, id: str, name: str = "", arguments: str = "") -> None:
+        self.id = id
+        self.type = "function"
+        self.function = StreamFunction(name, arguments)
+
+
+class StreamChunk:
+    """流式增量的轻量表示，不做校验，用于逐token的热路径。
+
+    type 取值与 ``MessageChunk`` 相同；tool_call 时 data 为 ``StreamToolCall`` 列表。
+    """
+
+    __slots__ = ("type", "data")
+
+    def __init__(self, type: str, data: str | list[StreamToolCall]) -> None:
+        self.type = type
+        self.data = data
+
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> "AsyncOpenAI":
+    """返回进程内共享的OpenAI客户端，所有Agent复用同一个连接池。"""
+    from openai import AsyncOpenAI
+
+    setting = get_setting()
+    return AsyncOpenAI(api_key=setting.OPENAI_API_KEY, base_url=setting.OPENAI_BASE_URL)
+
+
+async def prewarm_llm_connections(count: int) -> None:
+    """并发发起轻量请求，提前建立到LLM服务的连接（TCP/TLS握手）。
+
+    预热失败不影响服务启动，首个请求会自行建立连接。
+
+    Args:
+        count: 预先建立的连接数
+    """
+    if count <= 0:
+        return
+    client = get_openai_client()
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(client.models.list() for _ in range(count)), return_exceptions=True
+    )
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if failed:
+        logger.warning(f"预热LLM连接失败 {len(failed)}/{count}: {failed[0]}")
+    logger.info(
+        f"LLM连接预热完成，耗时 {time.perf_counter() - start:.2f} 秒"
+    )
 
 
 class ToolDefinition(TypedDict):
@@ -21,6 +139,50 @@ class ToolDefinition(TypedDict):
     function: Dict[str, Any]
 
 
+def convert_tools(tools: "list[Tool]") -> List[ToolDefinition]:
+    """将MCP工具定义转换为OpenAI函数调用格式。
+
+    Args:
+        tools: MCP工具列表
+
+    Returns:
+        OpenAI工具列表，无法转换的工具会被跳过
+    """
+    openai_tools: List[ToolDefinition] = []
+
+    for tool in tools:
+        try:
+            tool_schema: ToolDefinition = {
+                "type": "function",
+                "function": {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "parameters": {},
+                    "strict": True,
+                },
+            }
+
+            input_schema = tool.inputSchema
+
+            parameters = {
+                "type": input_schema["type"],
+                "properties": input_schema["properties"],
+                "required": input_schema.get("required", ""),
+                "additionalProperties": False,
+            }
+            for prop in parameters["properties"].values():
+                # 特殊处理枚举值
+                if "enum" in prop:
+                    prop["description"] = f"可选值: {', '.join(prop['enum'])}"
+
+            tool_schema["function"]["parameters"] = parameters
+            openai_tools.append(tool_schema)
+        except Exception as e:
+            logger.warning(f"转换工具定义失败: {e}")
+
+    return openai_tools
+
+
 class LLMClient:
     """管理与LLM提供商的通信。"""
 
@@ -34,19 +196,23 @@ class LLMClient:
         """
         self.mcp_servers = servers
         self.openai_tools = None
+        # 工具目录版本，工具定义变化后回答缓存不再命中
+        self.tools_version: str = ""
+        # 工具定义占用的输入token数（估算），用于限流
+        self.tools_tokens = 0
+        self.tool_names: set[str] = set()
         self.timeout = timeout
         self.max_retries = max_retries
         self.openai_client = self._init_openai_client()
 
-    def _init_openai_client(self) -> AsyncOpenAI:
+    def _init_openai_client(self) -> "AsyncOpenAI":
         """初始化OpenAI客户端。
 
         Returns:
-            OpenAI客户端实例
+            共享连接池、使用本实例超时设置的OpenAI客户端；
+            重试由本类结合限流器处理，不使用SDK的自动重试
         """
-        api_key = setting.OPENAI_API_KEY
-        base_url = setting.OPENAI_BASE_URL
-        return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=self.timeout)
+        return get_openai_client().with_options(timeout=self.timeout, max_retries=0)
 
     @classmethod
     async def create(cls, servers: list[Client]):
@@ -59,10 +225,30 @@ class LLMClient:
             LLMClient实例
         """
         self = cls(servers)
-        self.openai_tools = await self.convert_mcp_to_openai_tools()
+        self.set_tools(await self.convert_mcp_to_openai_tools())
         logger.info(f"已加载OpenAI工具: {len(self.openai_tools)}个")
         return self
 
+    async def refresh_tools(self, servers: list[Client]) -> None:
+        """MCP服务变更后刷新工具定义。
+
+        先生成新的工具列表再整体替换，进行中的请求不受影响。
+
+        Args:
+            servers: 新的MCP服务器列表
+        """
+        self.mcp_servers = servers
+        self.set_tools(await self.convert_mcp_to_openai_tools())
+        logger.info(f"已刷新OpenAI工具: {len(self.openai_tools)}个")
+
+    def set_tools(self, tools: List[ToolDefinition]) -> None:
+        """替换工具定义并更新工具目录版本。"""
+        serialized = json.dumps(tools, sort_keys=True, ensure_ascii=False)
+        self.tools_version = hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:16]
+        self.tools_tokens = len(serialized) // CHARS_PER_TOKEN if tools else 0
+        self.tool_names = {tool["function"]["name"] for tool in tools}
+        self.openai_tools = tools
+
     async def convert_mcp_to_openai_tools(self) -> List[ToolDefinition]:
         """将MCP Server返回的工具列表转换为OpenAI函数调用格式
 
@@ -70,101 +256,178 @@ class LLMClient:
             OpenAI工具列表
         """
         all_tools = []
-        for server in self.mcp_servers:
+        # 遍历快照，刷新期间服务列表可能被替换
+        for server in list(self.mcp_servers):
             try:
                 tools = await server.list_tools()
                 all_tools.extend(tools)
             except Exception as e:
                 logger.error(f"从服务器获取工具列表失败: {e}")
 
-        openai_tools: List[ToolDefinition] = []
+        # 工具目录较大时在线程中转换，避免阻塞事件循环
+        return await get_executor().run(
+            len(all_tools),
+            convert_tools,
+            all_tools,
+            threshold=TOOL_CATALOG_INLINE_LIMIT,
+        )
 
-        for tool in all_tools:
-            try:
-                tool_schema: ToolDefinition = {
-                    "type": "function",
-                    "function": {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "parameters": {},
-                        "strict": True,
-                    },
-                }
-
-                input_schema = tool.inputSchema
-
-                parameters = {
-                    "type": input_schema["type"],
-                    "properties": input_schema["properties"],
-                    "required": input_schema.get("required", ""),
-                    "additionalProperties": False,
-                }
-                for prop in parameters["properties"].values():
-                    # 特殊处理枚举值
-                    if "enum" in prop:
-                        prop["description"] = f"可选值: {', '.join(prop['enum'])}"
-
-                tool_schema["function"]["parameters"] = parameters
-                openai_tools.append(tool_schema)
-            except Exception as e:
-                logger.warning(f"转换工具定义失败: {e}")
+    async def stream_response(
+        self,
+        messages: list[dict[str, Any]],
+        model: str | None = None,
+        on_usage: Optional[UsageCallback] = None,
+        user_id: str = "",
+        priority: Priority = "interactive",
+    ) -> AsyncGenerator[StreamChunk, None]:
+        """从LLM获取流式响应（低开销模式）。
 
-        return openai_tools
-
-    async def get_response(
-        self, messages: list[dict[str, str]], model: str = None
-    ) -> AsyncGenerator[MessageChunk, None]:
-        """从LLM获取响应。
+        直接解析原始的SSE分片，自行累积工具调用参数，
+        每个增量只产生一个 ``StreamChunk``，不构造SDK模型、不做pydantic校验，
+        也不维护完整快照。
 
         Args:
             messages: 消息字典列表。
             model: 模型名称，默认为None，将使用环境变量中的设置。
+            on_usage: 流结束后接收本次调用token用量的回调
+            user_id: 发起请求的用户ID，用于限流时的公平调度
+            priority: 限流时的请求优先级
 
-        Returns:
-            LLM的响应，如果出错则返回None。
+        Yields:
+            流式增量
+
+        Raises:
+            RuntimeError: 如果流中返回了错误事件
         """
+        from openai import APIConnectionError, InternalServerError, RateLimitError
+
         retry_count = 0
+        rate_limited = 0
         last_error = None
+        setting = get_setting()
         model = model or setting.LLM_MODEL
-        logger.debug(messages)
+        limiter = get_rate_limiter()
+        estimated = (
+            estimate_request_tokens(messages)
+            + self.tools_tokens
+            + setting.LLM_COMPLETION_TOKENS_ESTIMATE
+        )
+        # 没有工具时不传 tools 与 tool_choice
+        tool_options: dict[str, Any] = (
+            {"tools": self.openai_tools, "tool_choice": "auto"}
+            if self.openai_tools
+            else {}
+        )
+        logger.opt(lazy=True).debug("请求消息: {}", lambda: truncate(messages))
 
         while retry_count < self.max_retries:
+            await limiter.acquire(model, estimated, user_id, priority)
+            usage: Dict[str, Any] | None = None
             try:
                 # 记录请求信息
                 logger.debug(
                     f"发送请求到LLM，模型: {model}, 工具数量: {len(self.openai_tools) if self.openai_tools else 0}"
                 )
-                async with self.openai_client.chat.completions.stream(
-                    model=model,
-                    messages=messages,
-                    tools=self.openai_tools,
-                    tool_choice="auto",
-                ) as stream:
-                    async for event in stream:
-                        if event.type != "chunk":
-                            continue
-                        chunk_choices = event.chunk.choices or []
-                        snapshot_choices = event.snapshot.choices or []
-                        for index, choice in enumerate(chunk_choices):
-                            if choice.finish_reason == "tool_calls":
-                                yield MessageChunk(
-                                    type="tool_call",
-                                    data=snapshot_choices[index].message.tool_calls,
-                                )
-                            elif getattr(choice.delta, "reasoning_content", None):
-                                yield MessageChunk(
-                                    type="reasoning",
-                                    data=choice.delta.reasoning_content,
-                                )
-                            elif getattr(choice.delta, "content", None):
-                                yield MessageChunk(
-                                    type="message", data=choice.delta.content
-                                )
-                            else:
-                                pass
+                start = time.perf_counter()
+                first_token_at: float | None = None
+                token_count = 0
+                # 按 index 累积的工具调用
+                tool_calls: dict[int, StreamToolCall] = {}
+                with generator_span(
+                    "llm.response", attributes={"llm.model": model}
+                ) as span:
+                    async with self.openai_client.chat.completions.with_streaming_response.create(
+                        model=model,
+                        messages=messages,
+                        stream=True,
+                        # 最后一个分片返回本次调用的token用量
+                        stream_options={"include_usage": True},
+                        **tool_options,
+                    ) as response:
+                        limiter.observe(model, response.headers)
+                        # 直接解析SSE行，跳过SDK对每个分片的模型构造
+                        async for line in response.iter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            payload = line[5:].strip()
+                            if payload == "[DONE]":
+                                break
+                            chunk = json.loads(payload)
+                            if chunk.get("error"):
+                                raise RuntimeError(f"LLM流式响应错误: {chunk['error']}")
+                            if chunk.get("usage"):
+                                usage = chunk["usage"]
+
+                            for choice in chunk.get("choices") or ():
+                                delta = choice.get("delta")
+                                if delta:
+                                    for tool_delta in delta.get("tool_calls") or ():
+                                        index = tool_delta.get("index", 0)
+                                        tool_call = tool_calls.get(index)
+                                        if tool_call is None:
+                                            tool_call = StreamToolCall(tool_delta.get("id") or "")
+                                            tool_calls[index] = tool_call
+                                        elif tool_delta.get("id"):
+                                            tool_call.id = tool_delta["id"]
+                                        function = tool_delta.get("function")
+                                        if function:
+                                            if function.get("name"):
+                                                tool_call.function.name += function["name"]
+                                            if function.get("arguments"):
+                                                tool_call.function.arguments += function[
+                                                    "arguments"
+                                                ]
+
+                                    reasoning = delta.get("reasoning_content")
+                                    text = reasoning or delta.get("content")
+                                    if text:
+                                        if first_token_at is None:
+                                            first_token_at = time.perf_counter()
+                                            LLM_TTFT_SECONDS.labels(model).observe(
+                                                first_token_at - start
+                                            )
+                                            span.add_event("first_token")
+                                        token_count += 1
+                                        yield StreamChunk(
+                                            "reasoning" if reasoning else "message", text
+                                        )
+
+                                if choice.get("finish_reason") == "tool_calls" and tool_calls:
+                                    yield StreamChunk(
+                                        "tool_call",
+                                        [tool_calls[i] for i in sorted(tool_calls)],
+                                    )
+                                    tool_calls = {}
+                    if first_token_at is not None:
+                        elapsed = time.perf_counter() - first_token_at
+                        if elapsed > 0:
+                            LLM_TOKENS_PER_SECOND.labels(model).observe(
+                                token_count / elapsed
+                            )
+                    span.set_attribute("llm.output_chunks", token_count)
+                    if usage:
+                        span.set_attribute(
+                            "llm.prompt_tokens", usage.get("prompt_tokens") or 0
+                        )
+                        span.set_attribute(
+                            "llm.completion_tokens", usage.get("completion_tokens") or 0
+                        )
                 return
 
-            except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+            except RateLimitError as e:
+                # 服务商限流不计入普通重试次数，按 Retry-After 暂停后重新排队
+                rate_limited += 1
+                if rate_limited > setting.LLM_RATE_LIMIT_RETRIES:
+                    logger.error(f"LLM请求持续被限流，已达到最大重试次数: {e}")
+                    raise
+                limiter.rate_limited(model, e.response.headers, rate_limited)
+            except (
+                ConnectionError,
+                OSError,
+                asyncio.TimeoutError,
+                APIConnectionError,
+                InternalServerError,
+            ) as e:
                 last_error = e
                 retry_count += 1
                 wait_time = 2**retry_count  # 指数退避策略
@@ -179,6 +442,179 @@ class LLMClient:
                 else:
                     logger.error(f"获取LLM响应失败，已达到最大重试次数: {last_error}")
                     raise last_error
-            except Exception as e:
+            except json.JSONDecodeError as e:
+                # 服务商返回无法解析的行时结束本次响应；其他错误（如流中的错误事件）向上抛出，由调用方通知客户端
                 logger.exception(f"解析 LLM 响应时出错: {e}")
                 break
+            finally:
+                # 无论调用是否成功，都按已收到的用量校正配额并计量
+                limiter.settle(model, estimated, usage)
+                if usage and on_usage is not None:
+                    on_usage(model, usage)
+
+    def valid_tool_calls(self, tool_calls: list[StreamToolCall]) -> bool:
+        """工具调用是否都指向已知工具且参数是合法的JSON对象。"""
+        for tool_call in tool_calls:
+            if tool_call.function.name not in self.tool_names:
+                return False
+            try:
+                arguments = json.loads(tool_call.function.arguments or "{}")
+            except json.JSONDecodeError:
+                return False
+            if not isinstance(arguments, dict):
+                return False
+        return True
+
+    async def route_response(
+        self,
+        messages: list[dict[str, Any]],
+        model: str | None = None,
+        on_usage: Optional[UsageCallback] = None,
+        user_id: str = "",
+    ) -> AsyncGenerator[StreamChunk, None]:
+        """按轮次选择模型并返回流式增量。
+
+        配置了 ``LLM_TOOL_MODEL`` 时，每一轮先由小模型决定是否调用工具：
+        小模型返回合法的工具调用时直接采用；开始输出文本（即将给出最终回答）、
+        工具调用无法解析或调用失败时，放弃小模型的输出，改由主模型完成本轮。
+        小模型的思考内容不发送给客户端。
+
+        Args:
+            messages: 消息字典列表
+            model: 对话指定的模型，指定时不做路由
+            on_usage: 接收每次调用token用量的回调
+            user_id: 发起请求的用户ID
+
+        Yields:
+            流式增量
+        """
+        setting = get_setting()
+        tool_model = setting.LLM_TOOL_MODEL
+        if model or not self.openai_tools or tool_model in (None, setting.LLM_MODEL):
+            async for chunk in self.stream_response(messages, model, on_usage, user_id):
+                yield chunk
+            return
+
+        planned: StreamChunk | None = None
+        outcome = "handoff"
+        stream = self.stream_response(messages, tool_model, on_usage, user_id)
+        try:
+            async for chunk in stream:
+                if chunk.type == "message":
+                    break
+                if chunk.type == "tool_call":
+                    # 继续读取到流结束，以便记录用量
+                    planned = chunk
+        except Exception as e:
+            outcome = "error"
+            logger.warning(f"工具规划模型 {tool_model} 调用失败，改用主模型: {e}")
+        finally:
+            await stream.aclose()
+
+        if planned is not None:
+            if self.valid_tool_calls(planned.data):
+                LLM_ROUTING_DECISIONS.labels("tool_call").inc()
+                yield planned
+                return
+            outcome = "invalid_tool_call"
+            logger.warning(f"工具规划模型 {tool_model} 返回的工具调用无法解析，改用主模型")
+        LLM_ROUTING_DECISIONS.labels(outcome).inc()
+        async for chunk in self.stream_response(messages, None, on_usage, user_id):
+            yield chunk
+
+    async def complete(
+        self,
+        messages: list[dict[str, Any]],
+        model: str | None = None,
+        on_usage: Optional[UsageCallback] = None,
+        user_id: str = "",
+        priority: Priority = "background",
+    ) -> str:
+        """非流式调用LLM，不携带工具，用于摘要等后台任务。
+
+        Args:
+            messages: 消息字典列表
+            model: 模型名称，默认使用环境变量中的设置
+            on_usage: 接收本次调用token用量的回调
+            user_id: 发起请求的用户ID，用于限流时的公平调度
+            priority: 限流时的请求优先级，默认低于交互对话
+
+        Returns:
+            模型回答的文本
+        """
+        from openai import RateLimitError
+
+        setting = get_setting()
+        model = model or setting.LLM_MODEL
+        limiter = get_rate_limiter()
+        estimated = (
+            estimate_request_tokens(messages) + setting.LLM_COMPLETION_TOKENS_ESTIMATE
+        )
+        attempt = 0
+        while True:
+            await limiter.acquire(model, estimated, user_id, priority)
+            try:
+                with tracer.start_as_current_span(
+                    "llm.complete", attributes={"llm.model": model}
+                ):
+                    response = await self.openai_client.chat.completions.create(
+                        model=model, messages=messages
+                    )
+                break
+            except RateLimitError as e:
+                attempt += 1
+                if attempt > setting.LLM_RATE_LIMIT_RETRIES:
+                    raise
+                limiter.rate_limited(model, e.response.headers, attempt)
+        usage = response.usage.model_dump() if response.usage is not None else None
+        limiter.settle(model, estimated, usage)
+        if usage and on_usage is not None:
+            on_usage(model, usage)
+        return response.choices[0].message.content or ""
+
+    async def get_response(
+        self,
+        messages: list[dict[str, str]],
+        model: str = None,
+        on_usage: Optional[UsageCallback] = None,
+        user_id: str = "",
+        priority: Priority = "interactive",
+    ) -> AsyncGenerator[MessageChunk, None]:
+        """从LLM获取响应。
+
+        基于 ``stream_response``，返回经过校验的 ``MessageChunk``，
+        供不在流式热路径上的调用方使用。
+
+        Args:
+            messages: 消息字典列表。
+            model: 模型名称，默认为None，将使用环境变量中的设置。
+            on_usage: 流结束后接收本次调用token用量的回调
+            user_id: 发起请求的用户ID，用于限流时的公平调度
+            priority: 限流时的请求优先级
+
+        Returns:
+            LLM的响应，如果出错则返回None。
+        """
+        from openai.types.chat import ParsedFunction, ParsedFunctionToolCall
+
+        MessageChunk.ensure_built()
+        async for chunk in self.stream_response(
+            messages, model, on_usage, user_id, priority
+        ):
+            if chunk.type == "tool_call":
+                yield MessageChunk(
+                    type="tool_call",
+                    data=[
+                        ParsedFunctionToolCall(
+                            id=tool_call.id,
+                            type="function",
+                            function=ParsedFunction(
+                                name=tool_call.function.name,
+                                arguments=tool_call.function.arguments,
+                            ),
+                        )
+                        for tool_call in chunk.data
+                    ],
+                )
+            else:
+                yield MessageChunk(type=chunk.type, data=chunk.data)
@@ -1,19 +1,26 @@
 import asyncio
 import os
 import shutil
+import time
 from contextlib import AsyncExitStack
 from datetime import timedelta
-from typing import Any
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
 
 from loguru import logger
-from mcp import ClientSession, StdioServerParameters, Tool
-from mcp.client.stdio import stdio_client
-from mcp.client.streamable_http import streamablehttp_client
-from mcp.types import CallToolResult
 
+from app.config.configuration import get_setting
+from app.utils.telemetry import TOOL_CALL_BATCH_SIZE, TOOL_CALL_SECONDS, tracer
 
-async def progress_callback(message: str) -> None:
-    logger.info(message)
+if TYPE_CHECKING:
+    from mcp import ClientSession, Tool
+    from mcp.types import CallToolResult, LoggingMessageNotificationParams
+
+# 接收工具调用期间服务端通知的回调，参数为进度或日志事件；
+# 在会话的接收任务中调用，不能阻塞
+NotificationCallback = Callable[[dict[str, Any]], Awaitable[None]]
+
+# 服务端声明批量调用扩展的 experimental 能力：{"tool": 批量工具名, "maxCalls": 每批最多调用数}
+BATCH_CAPABILITY = "toolBatch"
 
 
 class Client:
@@ -29,13 +36,71 @@ class Client:
         self.name: str = name
         self.config: dict[str, Any] = config
         self.stdio_context: Any | None = None
-        self.session: ClientSession | None = None
+        self.session: "ClientSession | None" = None
         self._cleanup_lock: asyncio.Lock = asyncio.Lock()
         self.exit_stack: AsyncExitStack = AsyncExitStack()
-        self._tools_cache: list[Tool] | None = None
+        self._tools_cache: "list[Tool] | None" = None
+        # 连接由独立任务持有，便于在其他任务中关闭
+        self._lifecycle_task: asyncio.Task | None = None
+        self._stop_event: asyncio.Event = asyncio.Event()
+        # 进行中的工具调用，排空时等待其完成
+        self._inflight: int = 0
+        self._idle: asyncio.Event = asyncio.Event()
+        self._idle.set()
+        self.draining: bool = False
+        # 进行中的工具调用的通知回调，日志通知不携带请求ID，转发给所有进行中的调用
+        self._listeners: set[NotificationCallback] = set()
+        # 服务端声明的批量调用工具，不声明时为None
+        self.batch_tool: str | None = None
+        self.max_batch: int = 0
+
+    def _read_capabilities(self, result: Any) -> None:
+        """从初始化结果中读取批量调用扩展。"""
+        batch = (result.capabilities.experimental or {}).get(BATCH_CAPABILITY) or {}
+        self.batch_tool = batch.get("tool")
+        self.max_batch = int(batch.get("maxCalls") or 0)
+        if self.batch_tool:
+            logger.info(f"服务器 {self.name} 支持批量工具调用，每批最多 {self.max_batch} 个")
+
+    async def _on_log(self, params: "LoggingMessageNotificationParams") -> None:
+        """接收服务端的日志通知并转发给进行中的工具调用。"""
+        message = params.data if isinstance(params.data, str) else str(params.data)
+        logger.debug(f"服务器 {self.name} 日志 [{params.level}]: {message}")
+        for listener in list(self._listeners):
+            await listener({"kind": "log", "level": params.level, "message": message})
 
     async def initialize(self) -> None:
-        """初始化所有 MCP Server"""
+        """初始化所有 MCP Server
+
+        连接上下文由后台任务进入并持有，直到 ``cleanup``，
+        因此可以在任意任务中关闭（例如配置变更时由监听任务排空）。
+        """
+        ready: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._stop_event.clear()
+        self._lifecycle_task = asyncio.create_task(self._lifecycle(ready))
+        await ready
+
+    async def _lifecycle(self, ready: asyncio.Future[None]) -> None:
+        """在同一个任务中建立并关闭连接。"""
+        try:
+            await self._connect()
+        except Exception as e:
+            ready.set_exception(e)
+            return
+        ready.set_result(None)
+        try:
+            await self._stop_event.wait()
+        finally:
+            # 连接异常断开时传输层会取消本任务，同样需要退出上下文
+            self.session = None
+            await self.exit_stack.aclose()
+
+    async def _connect(self) -> None:
+        # mcp 包导入较慢，首次建立连接时才导入
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+        from mcp.client.streamable_http import streamablehttp_client
+
         try:
             # streamable-http 方式
             if "type" in self.config and self.config["type"] == "streamable-http":
@@ -46,15 +111,14 @@ class Client:
                     )
                 )
                 read_stream, write_stream, _ = streamable_http_transport
-                # todo 消息 回调 竟然在 此处。。。
                 session = await self.exit_stack.enter_async_context(
                     ClientSession(
                         read_stream,
                         write_stream,
-                        message_handler=progress_callback,
+                        logging_callback=self._on_log,
                     )
                 )
-                await session.initialize()
+                self._read_capabilities(await session.initialize())
                 self.session = session
             # stdio 方式
             if "command" in self.config and self.config["command"]:
@@ -75,17 +139,18 @@ class Client:
                 )
                 read, write = stdio_transport
                 session = await self.exit_stack.enter_async_context(
-                    ClientSession(read, write)
+                    ClientSession(read, write, logging_callback=self._on_log)
                 )
-                await session.initialize()
+                self._read_capabilities(await session.initialize())
                 self.session = session
             logger.info(f"🔗 连接MCP服务 {self.name}...")
         except Exception as e:
             logger.error(f"❌ 初始化错误 {self.name}: {e}")
-            await self.cleanup()
+            await self.exit_stack.aclose()
+            self.session = None
             raise
 
-    async def list_tools(self) -> list[Tool]:
+    async def list_tools(self) -> "list[Tool]":
         """从MCP Server列出所有工具
 
         Returns:
@@ -104,7 +169,10 @@ class Client:
 
         try:
             tools_response = await self.session.list_tools()
-            self._tools_cache = tools_response.tools
+            # 批量调用工具只供客户端使用，不提供给模型
+            self._tools_cache = [
+                tool for tool in tools_response.tools if tool.name != self.batch_tool
+            ]
             return self._tools_cache
         except Exception as e:
             logger.error(f"获取工具列表失败: {e}")
@@ -116,7 +184,8 @@ class Client:
         arguments: dict[str, Any],
         retries: int = 2,
         delay: float = 1.0,
-    ) -> CallToolResult | None:
+        on_notification: NotificationCallback | None = None,
+    ) -> "CallToolResult | None":
         """执行工具并具有重试机制。
 
         Args:
@@ -124,6 +193,7 @@ class Client:
             arguments: 工具参数。
             retries: 重试次数。
             delay: 重试之间的延迟（秒）。
+            on_notification: 接收执行期间进度与日志通知的回调。
 
         Returns:
             工具执行结果。
@@ -135,15 +205,65 @@ class Client:
         if not self.session:
             raise RuntimeError(f"服务器 {self.name} 未初始化")
 
+        self._inflight += 1
+        self._idle.clear()
+        if on_notification is not None:
+            self._listeners.add(on_notification)
+        try:
+            return await self._execute_tool(
+                tool_name, arguments, retries, delay, on_notification
+            )
+        finally:
+            self._listeners.discard(on_notification)
+            self._inflight -= 1
+            if self._inflight == 0:
+                self._idle.set()
+
+    async def _execute_tool(
+        self,
+        tool_name: str,
+        arguments: dict[str, Any],
+        retries: int,
+        delay: float,
+        on_notification: NotificationCallback | None = None,
+    ) -> "CallToolResult | None":
+        progress_callback = None
+        if on_notification is not None:
+
+            async def progress_callback(
+                progress: float, total: float | None, message: str | None
+            ) -> None:
+                await on_notification(
+                    {
+                        "kind": "progress",
+                        "progress": progress,
+                        "total": total,
+                        "message": message,
+                    }
+                )
+
         attempt = 0
         while attempt < retries:
+            start = time.perf_counter()
             try:
                 logger.info(f"执行工具 {tool_name} 在服务器 {self.name}...")
-                result = await self.session.call_tool(tool_name, arguments)
+                with tracer.start_as_current_span(
+                    "mcp.call_tool",
+                    attributes={"mcp.server": self.name, "mcp.tool": tool_name},
+                ):
+                    result = await self.session.call_tool(
+                        tool_name, arguments, progress_callback=progress_callback
+                    )
+                TOOL_CALL_SECONDS.labels(self.name, tool_name, "ok").observe(
+                    time.perf_counter() - start
+                )
                 logger.debug(f"工具 {tool_name} 执行成功")
                 return result
 
             except Exception as e:
+                TOOL_CALL_SECONDS.labels(self.name, tool_name, "error").observe(
+                    time.perf_counter() - start
+                )
                 attempt += 1
                 logger.warning(
                     f"执行工具 {tool_name} 出错: {e}。尝试 {attempt}/{retries}。"
@@ -155,11 +275,155 @@ class Client:
                     logger.error(f"工具 {tool_name} 达到最大重试次数。失败。")
                     raise
 
+    async def execute_tools(
+        self,
+        calls: list[tuple[str, dict[str, Any]]],
+        on_notification: list[NotificationCallback | None] | None = None,
+    ) -> "list[CallToolResult | BaseException]":
+        """并发执行本服务器上的多个工具调用，按调用顺序返回结果。
+
+        服务端声明了批量调用扩展时，多个调用合并为一次 ``tools/call`` 请求；
+        否则在同一会话上流水线发送，不等待前一个调用返回。
+
+        Args:
+            calls: (工具名称, 参数) 列表
+            on_notification: 与 calls 一一对应的通知回调
+
+        Returns:
+            每个调用的结果，执行失败时为异常
+        """
+        callbacks = on_notification or [None] * len(calls)
+        if (
+            self.batch_tool
+            and self.max_batch > 1
+            and len(calls) > 1
+            and get_setting().MCP_TOOL_BATCHING
+        ):
+            TOOL_CALL_BATCH_SIZE.labels(self.name, "batch").observe(len(calls))
+            chunks = await asyncio.gather(
+                *(
+                    self._execute_batch(
+                        calls[i : i + self.max_batch],
+                        callbacks[i : i + self.max_batch],
+                    )
+                    for i in range(0, len(calls), self.max_batch)
+                )
+            )
+            return [result for chunk in chunks for result in chunk]
+
+        TOOL_CALL_BATCH_SIZE.labels(self.name, "pipeline").observe(len(calls))
+        return await asyncio.gather(
+            *(
+                self.execute_tool(name, arguments, on_notification=callback)
+                for (name, arguments), callback in zip(calls, callbacks)
+            ),
+            return_exceptions=True,
+        )
+
+    async def _execute_batch(
+        self,
+        calls: list[tuple[str, dict[str, Any]]],
+        callbacks: list[NotificationCallback | None],
+    ) -> "list[CallToolResult | BaseException]":
+        """以一次批量调用执行多个工具。
+
+        批量请求只发送一次、不重试。服务端拒绝批量请求本身（返回协议错误或整体错误结果，
+        此时批内调用都未执行）时改为逐个流水线执行；超时、连接中断或返回的结果无效时，
+        批内调用可能已经执行，不再重新调用，每个调用都返回该错误，避免有副作用的工具重复执行。
+        """
+        from mcp.shared.exceptions import McpError
+        from mcp.types import (
+            INVALID_PARAMS,
+            INVALID_REQUEST,
+            METHOD_NOT_FOUND,
+            CallToolResult,
+        )
+
+        if len(calls) == 1:
+            try:
+                return [
+                    await self.execute_tool(*calls[0], on_notification=callbacks[0])
+                ]
+            except Exception as e:
+                return [e]
+
+        listeners = [callback for callback in callbacks if callback is not None]
+
+        # 批量调用的通知无法区分属于哪个调用，转发给批内所有调用
+        async def fan_out(update: dict[str, Any]) -> None:
+            for listener in listeners:
+                await listener(update)
+
+        try:
+            response = await self.execute_tool(
+                self.batch_tool,
+                {
+                    "calls": [
+                        {"name": name, "arguments": arguments}
+                        for name, arguments in calls
+                    ]
+                },
+                retries=1,
+                on_notification=fan_out if listeners else None,
+            )
+        except McpError as e:
+            if e.error.code not in (METHOD_NOT_FOUND, INVALID_PARAMS, INVALID_REQUEST):
+                logger.error(f"服务器 {self.name} 批量工具调用失败: {e}")
+                return [e] * len(calls)
+            logger.warning(f"服务器 {self.name} 拒绝批量工具调用，改为逐个调用: {e}")
+            response = None
+        except Exception as e:
+            logger.error(f"服务器 {self.name} 批量工具调用失败: {e}")
+            return [e] * len(calls)
+
+        if response is not None and not response.isError:
+            results = (response.structuredContent or {}).get("results")
+            try:
+                if not isinstance(results, list) or len(results) != len(calls):
+                    raise ValueError(f"结果数量不符: {response.content}")
+                return [CallToolResult.model_validate(result) for result in results]
+            except ValueError as e:
+                logger.error(f"服务器 {self.name} 批量调用返回的结果无效: {e}")
+                error = RuntimeError(f"批量调用返回的结果无效: {e}")
+                return [error] * len(calls)
+        if response is not None:
+            logger.warning(
+                f"服务器 {self.name} 拒绝批量工具调用，改为逐个调用: {response.content}"
+            )
+        return await asyncio.gather(
+            *(
+                self.execute_tool(name, arguments, on_notification=callback)
+                for (name, arguments), callback in zip(calls, callbacks)
+            ),
+            return_exceptions=True,
+        )
+
+    async def drain(self, timeout: float) -> None:
+        """排空并关闭服务器：不再接受新的工具调用，等待进行中的调用完成后清理。
+
+        Args:
+            timeout: 等待进行中调用的最长时间（秒），超时后直接关闭
+        """
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"服务器 {self.name} 仍有 {self._inflight} 个工具调用未完成，强制关闭"
+            )
+        await self.cleanup()
+
     async def cleanup(self) -> None:
         """清理服务器资源。"""
         async with self._cleanup_lock:
             try:
-                await self.exit_stack.aclose()
+                if self._lifecycle_task is not None:
+                    self._stop_event.set()
+                    # 连接异常断开时任务可能已以取消或异常结束
+                    await asyncio.gather(self._lifecycle_task, return_exceptions=True)
+                    self._lifecycle_task = None
+                else:
+                    await self.exit_stack.aclose()
                 self.session = None
                 self.stdio_context = None
                 # 清除缓存
@@ -0,0 +1,178 @@
+"""工具预取模块。
+
+用户消息到达时，按配置的规则预测本轮可能发起的工具调用（例如资讯类问题的网页搜索），
+在查询记忆与首次调用LLM的同时提前执行。模型随后发起匹配的调用时直接使用预取的结果，
+本轮结束时取消未被使用的预取，命中与未使用的次数计入指标，便于调整规则。
+
+只应为只读、没有副作用的工具配置预取规则。
+"""
+
+import asyncio
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from app.config.configuration import get_setting
+from app.services.answer_cache import normalize_prompt
+from app.utils.telemetry import TOOL_PREFETCHES
+
+if TYPE_CHECKING:
+    from mcp.types import CallToolResult
+
+    from app.services.mcp_client import Client
+
+# 按工具名称查找服务器，找不到时返回None
+ServerFinder = Callable[[str], Awaitable[Optional["Client"]]]
+
+
+def fill(template: Any, values: Dict[str, str]) -> Any:
+    """将参数模板中字符串里的占位符替换为用户消息与正则命名分组。"""
+    if isinstance(template, str):
+        return template.format_map(values)
+    if isinstance(template, dict):
+        return {key: fill(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        return [fill(value, values) for value in template]
+    return template
+
+
+def same_value(a: Any, b: Any) -> bool:
+    # 字符串参数按规范化后比较，忽略大小写、全半角与结尾标点的差异
+    if isinstance(a, str) and isinstance(b, str):
+        return normalize_prompt(a) == normalize_prompt(b)
+    return a == b
+
+
+class PrefetchRule:
+    """一条预取规则：用户消息匹配时以给定参数预先调用工具。"""
+
+    __slots__ = ("tool", "pattern", "arguments", "match")
+
+    def __init__(
+        self,
+        tool: str,
+        pattern: str,
+        arguments: Dict[str, Any],
+        match: Optional[List[str]] = None,
+    ) -> None:
+        """初始化PrefetchRule。
+
+        Args:
+            tool: 工具名称
+            pattern: 匹配用户消息的正则（不区分大小写）
+            arguments: 参数模板，字符串中的 {message} 与正则命名分组会被替换
+            match: 判断命中时需要相同的参数，None表示全部参数，空列表表示该工具的任意调用
+        """
+        self.tool = tool
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.arguments = arguments
+        self.match = match
+
+    def predict(self, message: str) -> Optional[Dict[str, Any]]:
+        """用户消息匹配时返回预测的调用参数，否则返回None。"""
+        found = self.pattern.search(message)
+        if found is None:
+            return None
+        values = {key: value for key, value in found.groupdict().items() if value is not None}
+        return fill(self.arguments, {"message": message, **values})
+
+
+class Prefetch:
+    """一次预取的工具调用。"""
+
+    __slots__ = ("rule", "arguments", "task", "used")
+
+    def __init__(
+        self, rule: PrefetchRule, arguments: Dict[str, Any], task: asyncio.Task
+    ) -> None:
+        self.rule = rule
+        self.arguments = arguments
+        self.task = task
+        self.used = False
+
+    def matches(self, tool: str, arguments: Dict[str, Any]) -> bool:
+        if tool != self.rule.tool:
+            return False
+        keys = self.rule.match if self.rule.match is not None else self.arguments.keys()
+        return all(same_value(arguments.get(key), self.arguments.get(key)) for key in keys)
+
+
+class TurnPrefetcher:
+    """一轮对话中的预取调用。"""
+
+    def __init__(self, rules: List[PrefetchRule]) -> None:
+        self.rules = rules
+        self._prefetches: List[Prefetch] = []
+
+    def start(self, message: str, find_server: ServerFinder) -> None:
+        """按规则预测工具调用并在后台开始执行。
+
+        Args:
+            message: 用户消息
+            find_server: 按工具名称查找服务器
+        """
+        for rule in self.rules:
+            try:
+                arguments = rule.predict(message)
+            except (KeyError, ValueError) as e:
+                logger.error(f"工具 {rule.tool} 的预取参数模板无效: {e}")
+                continue
+            if arguments is None:
+                continue
+            logger.debug(f"预取工具 {rule.tool}")
+            task = asyncio.create_task(self._run(rule.tool, arguments, find_server))
+            # 未被使用的预取失败时不记录为未处理的异常
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._prefetches.append(Prefetch(rule, arguments, task))
+
+    @staticmethod
+    async def _run(
+        tool: str, arguments: Dict[str, Any], find_server: ServerFinder
+    ) -> "CallToolResult":
+        server = await find_server(tool)
+        if server is None:
+            raise RuntimeError(f"找不到可以处理工具 {tool} 的服务器")
+        return await server.execute_tool(tool, arguments, retries=1)
+
+    def take(self, tool: str, arguments: Dict[str, Any]) -> Optional[asyncio.Task]:
+        """返回与该调用匹配的预取任务，每个预取只使用一次。
+
+        Args:
+            tool: 模型调用的工具名称
+            arguments: 模型给出的参数
+
+        Returns:
+            预取任务（可能仍在执行），没有匹配的预取时为None
+        """
+        for prefetch in self._prefetches:
+            if not prefetch.used and prefetch.matches(tool, arguments):
+                prefetch.used = True
+                TOOL_PREFETCHES.labels(tool, "hit").inc()
+                return prefetch.task
+        return None
+
+    def finish(self) -> None:
+        """本轮结束时取消未被使用的预取。"""
+        for prefetch in self._prefetches:
+            if not prefetch.used:
+                prefetch.task.cancel()
+                TOOL_PREFETCHES.labels(prefetch.rule.tool, "unused").inc()
+        self._prefetches.clear()
+
+
+@lru_cache(maxsize=1)
+def get_prefetch_rules() -> List[PrefetchRule]:
+    """返回配置的预取规则，无效的规则记录错误后跳过。"""
+    rules = []
+    for raw in get_setting().TOOL_PREFETCH_RULES:
+        try:
+            rules.append(
+                PrefetchRule(
+                    raw["tool"], raw["pattern"], raw.get("arguments") or {}, raw.get("match")
+                )
+            )
+        except (KeyError, TypeError, re.error) as e:
+            logger.error(f"工具预取规则 {raw} 无效: {e}")
+    return rules
@@ -0,0 +1,329 @@
+"""LLM调用的客户端限流模块。
+
+所有Agent共享同一个限流器，按模型分别维护每分钟请求数（RPM）与每分钟token数（TPM）
+两个令牌桶。令牌不足时请求排队：先按优先级（交互对话优先于摘要等后台任务），
+同一优先级内按用户轮询，避免单个用户的大量请求占满配额。
+
+TPM按估算的输入token数加上预留的输出token数扣减，调用结束后按实际用量校正；
+服务商返回429时按 Retry-After 暂停该模型的所有请求。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Any, Deque, Dict, Literal, Mapping, Optional
+
+from loguru import logger
+
+from app.config.configuration import get_setting
+from app.utils.telemetry import LLM_RATE_LIMIT_WAIT_SECONDS, LLM_RATE_LIMITED
+
+Priority = Literal["interactive", "background"]
+# 按顺序调度，靠前的优先级先获得令牌
+PRIORITIES: tuple[Priority, ...] = ("interactive", "background")
+
+# 估算token时每个token对应的字符数（中英文混合的保守值）
+CHARS_PER_TOKEN = 2
+# 每张图片按固定token数估算
+IMAGE_TOKENS = 1000
+
+
+def estimate_request_tokens(messages: list[dict[str, Any]]) -> int:
+    """粗略估算请求消息的输入token数，也用于判断对话历史是否需要压缩。"""
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or ():
+            if part.get("type") == "text":
+                chars += len(part.get("text", ""))
+            else:
+                images += 1
+        for tool_call in message.get("tool_calls") or ():
+            chars += len(tool_call["function"]["arguments"])
+    return chars // CHARS_PER_TOKEN + images * IMAGE_TOKENS
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """解析响应头中的重试等待时间（秒），支持秒数与HTTP日期两种格式。"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """按分钟配额匀速补充的令牌桶，容量为一分钟的配额。"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """距离可以扣减 amount 个令牌的秒数，超过容量的请求只需等桶满。"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        # 超过容量的请求允许透支，之后的请求等待补足
+        self._refill()
+        self.level -= amount
+
+    def give(self, amount: float) -> None:
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def clamp(self, remaining: float) -> None:
+        """按服务商返回的剩余配额下调令牌数。"""
+        self._refill()
+        self.level = min(self.level, remaining)
+
+
+class Waiter:
+    __slots__ = ("tokens", "future", "enqueued_at")
+
+    def __init__(self, tokens: int, future: asyncio.Future) -> None:
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class ModelLimiter:
+    """单个模型的令牌桶与等待队列。"""
+
+    def __init__(self, model: str, rpm: Optional[int], tpm: Optional[int]):
+        """初始化ModelLimiter。
+
+        Args:
+            model: 模型名称
+            rpm: 每分钟请求数上限，None表示不限制
+            tpm: 每分钟token数上限，None表示不限制
+        """
+        self.model = model
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+        # 每个优先级一个按用户轮询的队列：用户 -> 该用户的等待者
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[Waiter]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = self.paused_until - time.monotonic()
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return max(wait, 0.0)
+
+    def _take(self, tokens: int) -> None:
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def _next(self) -> Optional[tuple[Priority, str, Waiter]]:
+        """按优先级与用户轮询顺序返回下一个等待者，跳过已取消的等待者。"""
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue:
+                user_id, waiters = next(iter(queue.items()))
+                while waiters and waiters[0].future.done():
+                    waiters.popleft()
+                if waiters:
+                    return priority, user_id, waiters[0]
+                del queue[user_id]
+        return None
+
+    async def acquire(self, tokens: int, user_id: str, priority: Priority) -> None:
+        """等待直到可以发起一次请求并扣减令牌。
+
+        Args:
+            tokens: 本次请求估算的token数
+            user_id: 用户ID，用于同一优先级内的公平调度
+            priority: 请求优先级
+        """
+        if self._next() is None and self._wait_time(tokens) == 0:
+            self._take(tokens)
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiter = Waiter(tokens, future)
+        self._queues[priority].setdefault(user_id, deque()).append(waiter)
+        self._wake()
+        await future
+        LLM_RATE_LIMIT_WAIT_SECONDS.labels(priority).observe(
+            time.monotonic() - waiter.enqueued_at
+        )
+
+    def _wake(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        """依次放行等待者；等待令牌期间有新请求入队时重新选择。"""
+        while True:
+            head = self._next()
+            if head is None:
+                return
+            priority, user_id, waiter = head
+            wait = self._wait_time(waiter.tokens)
+            if wait > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            queue = self._queues[priority]
+            queue[user_id].popleft()
+            # 放行后该用户排到队尾
+            queue.move_to_end(user_id)
+            self._take(waiter.tokens)
+            waiter.future.set_result(None)
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """按实际用量校正TPM令牌桶。"""
+        if self.tokens is not None:
+            self.tokens.give(estimated - actual)
+
+    def pause(self, delay: float) -> None:
+        """服务商限流时暂停该模型的所有请求。"""
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """按服务商返回的剩余配额（x-ratelimit-remaining-*）下调令牌数。"""
+        for bucket, name in (
+            (self.requests, "x-ratelimit-remaining-requests"),
+            (self.tokens, "x-ratelimit-remaining-tokens"),
+        ):
+            value = headers.get(name)
+            if bucket is not None and value:
+                try:
+                    bucket.clamp(float(value))
+                except ValueError:
+                    pass
+
+
+class RateLimiter:
+    """按模型管理限流的共享限流器。"""
+
+    def __init__(
+        self,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        model_limits: Optional[Dict[str, Dict[str, int]]] = None,
+    ):
+        """初始化RateLimiter。
+
+        Args:
+            rpm: 默认的每分钟请求数上限
+            tpm: 默认的每分钟token数上限
+            model_limits: 按模型覆盖的上限，如 {"model": {"rpm": 500, "tpm": 30000}}
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.model_limits = model_limits or {}
+        self._models: Dict[str, ModelLimiter] = {}
+
+    def limiter(self, model: str) -> ModelLimiter:
+        limiter = self._models.get(model)
+        if limiter is None:
+            limits = self.model_limits.get(model, {})
+            limiter = self._models[model] = ModelLimiter(
+                model, limits.get("rpm", self.rpm), limits.get("tpm", self.tpm)
+            )
+        return limiter
+
+    async def acquire(
+        self,
+        model: str,
+        tokens: int,
+        user_id: str = "",
+        priority: Priority = "interactive",
+    ) -> None:
+        """等待该模型的配额，返回后即可发起请求。
+
+        Args:
+            model: 模型名称
+            tokens: 本次请求估算的token数（输入加预留的输出）
+            user_id: 用户ID
+            priority: 请求优先级
+        """
+        await self.limiter(model).acquire(tokens, user_id, priority)
+
+    def settle(self, model: str, estimated: int, usage: Optional[Dict[str, Any]]) -> None:
+        """调用结束后按实际用量校正TPM配额。
+
+        Args:
+            model: 模型名称
+            estimated: 发起请求时扣减的token数
+            usage: OpenAI格式的usage字段，没有用量时不校正
+        """
+        if usage:
+            actual = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+            self.limiter(model).settle(estimated, actual)
+
+    def observe(self, model: str, headers: Mapping[str, str]) -> None:
+        """根据响应头同步服务商的剩余配额。"""
+        self.limiter(model).observe(headers)
+
+    def rate_limited(self, model: str, headers: Mapping[str, str], attempt: int) -> float:
+        """记录一次429响应并暂停该模型的请求。
+
+        Args:
+            model: 模型名称
+            headers: 429响应的响应头
+            attempt: 本次请求已重试的次数，没有 Retry-After 时用于指数退避
+
+        Returns:
+            暂停的秒数
+        """
+        delay = parse_retry_after(headers)
+        if delay is None:
+            delay = min(2**attempt, 60)
+        LLM_RATE_LIMITED.labels(model).inc()
+        self.limiter(model).pause(delay)
+        logger.warning(f"模型 {model} 触发服务商限流，{delay:.1f} 秒后重试")
+        return delay
+
+
+@lru_cache(maxsize=1)
+def get_rate_limiter() -> RateLimiter:
+    """返回单例限流器，首次调用时根据配置创建。"""
+    setting = get_setting()
+    return RateLimiter(
+        setting.LLM_RPM_LIMIT, setting.LLM_TPM_LIMIT, setting.LLM_MODEL_RATE_LIMITS
+    )
@@ -0,0 +1,195 @@
+"""Token用量统计与配额模块。
+
+每次LLM调用结束时记录一次用量（不在逐token路径上），先累加到内存计数器，
+由后台任务按间隔批量写入本地SQLite。写入后从存储重新汇总当日用量，
+多个worker共用同一个存储时配额会在一个刷新间隔内收敛。
+"""
+
+import asyncio
+import sqlite3
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.config.configuration import get_setting
+from app.utils.telemetry import LLM_TOKENS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    requests INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, chat_id, model)
+)
+"""
+UPSERT = """
+INSERT INTO usage (day, user_id, chat_id, model, prompt_tokens, completion_tokens, cached_tokens, requests)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, user_id, chat_id, model) DO UPDATE SET
+    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+    completion_tokens = completion_tokens + excluded.completion_tokens,
+    cached_tokens = cached_tokens + excluded.cached_tokens,
+    requests = requests + excluded.requests
+"""
+DAILY_TOTALS = """
+SELECT user_id, SUM(prompt_tokens + completion_tokens) FROM usage WHERE day = ? GROUP BY user_id
+"""
+
+# 计数器键：(日期, 用户, 对话, 模型)
+UsageKey = Tuple[str, str, str, str]
+
+
+def utc_day() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def seconds_until_next_day() -> int:
+    """距下一个UTC日（配额重置）的秒数。"""
+    return 86400 - int(time.time()) % 86400
+
+
+class UsageMeter:
+    """内存中的用量计数器，批量写入本地存储，并按用户检查每日配额。"""
+
+    def __init__(self, path: str, daily_quota: Optional[int] = None):
+        """初始化UsageMeter。
+
+        Args:
+            path: SQLite数据库路径
+            daily_quota: 每个用户每日的token配额（输入+输出），None表示不限制
+        """
+        self.path = Path(path)
+        self.daily_quota = daily_quota
+        self.day: str = utc_day()
+        # 尚未写入存储的增量：[输入, 输出, 缓存命中, 请求数]
+        self._pending: Dict[UsageKey, List[int]] = {}
+        # 存储中的当日用量（最近一次刷新时）与之后的未写入增量
+        self._stored_totals: Dict[str, int] = {}
+        self._pending_totals: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(
+        self, user_id: str, chat_id: str, model: str, usage: Dict[str, Any]
+    ) -> None:
+        """记录一次LLM调用的用量。
+
+        Args:
+            user_id: 用户ID
+            chat_id: 对话ID
+            model: 模型名称
+            usage: OpenAI格式的usage字段
+        """
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        self._roll_day()
+        key = (self.day, user_id, chat_id, model)
+        counters = self._pending.get(key)
+        if counters is None:
+            counters = self._pending[key] = [0, 0, 0, 0]
+        counters[0] += prompt
+        counters[1] += completion
+        counters[2] += cached
+        counters[3] += 1
+        self._pending_totals[user_id] = (
+            self._pending_totals.get(user_id, 0) + prompt + completion
+        )
+        LLM_TOKENS.labels(model, "prompt").inc(prompt)
+        LLM_TOKENS.labels(model, "completion").inc(completion)
+        if cached:
+            LLM_TOKENS.labels(model, "cached").inc(cached)
+
+    def used(self, user_id: str) -> int:
+        """返回用户当日已使用的token数。"""
+        self._roll_day()
+        return self._stored_totals.get(user_id, 0) + self._pending_totals.get(user_id, 0)
+
+    def within_quota(self, user_id: str) -> bool:
+        """用户当日用量是否仍在配额内。"""
+        return self.daily_quota is None or self.used(user_id) < self.daily_quota
+
+    def _roll_day(self) -> None:
+        day = utc_day()
+        if day != self.day:
+            # 跨日后重新计算配额，未写入的增量仍按原日期写入
+            self.day = day
+            self._stored_totals = {}
+            self._pending_totals = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute(SCHEMA)
+        return connection
+
+    def _write(self, rows: List[Tuple[Any, ...]], day: str) -> Dict[str, int]:
+        """写入增量并返回存储中的当日用量（在线程中执行）。"""
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(UPSERT, rows)
+            return dict(connection.execute(DAILY_TOTALS, (day,)).fetchall())
+        finally:
+            connection.close()
+
+    async def flush(self) -> None:
+        """将内存中的增量批量写入存储，写入失败时保留增量等待下次重试。"""
+        pending, self._pending = self._pending, {}
+        pending_totals, self._pending_totals = self._pending_totals, {}
+        day = self.day
+        rows = [(*key, *counters) for key, counters in pending.items()]
+        try:
+            totals = await asyncio.to_thread(self._write, rows, day)
+        except Exception as e:
+            logger.error(f"写入用量统计失败: {e}")
+            for key, counters in pending.items():
+                merged = self._pending.setdefault(key, [0, 0, 0, 0])
+                for i, value in enumerate(counters):
+                    merged[i] += value
+            for user_id, value in pending_totals.items():
+                self._pending_totals[user_id] = self._pending_totals.get(user_id, 0) + value
+            return
+        if day == self.day:
+            self._stored_totals = totals
+        if rows:
+            logger.debug(f"已写入 {len(rows)} 条用量统计")
+
+    async def _flush_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    async def start(self, interval: float) -> None:
+        """加载当日用量并启动后台写入任务。
+
+        Args:
+            interval: 批量写入的间隔（秒）
+        """
+        if self._task is not None:
+            return
+        await self.flush()
+        self._task = asyncio.create_task(self._flush_periodically(interval))
+
+    async def stop(self) -> None:
+        """停止后台任务并写入剩余的增量。"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+@lru_cache(maxsize=1)
+def get_usage_meter() -> UsageMeter:
+    """返回单例用量计数器，首次调用时根据配置创建。"""
+    setting = get_setting()
+    return UsageMeter(setting.USAGE_DB_PATH, setting.USER_DAILY_TOKEN_QUOTA)
@@ -1,15 +1,193 @@
 """日志配置模块。"""
 
+import asyncio
+import copy
 import logging
 import os
+import queue
 import sys
-from typing import Any, Dict, Optional
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional
 
 from loguru import logger
 
+# 日志中单个载荷（消息列表、工具结果等）的默认最大长度
+DEFAULT_PAYLOAD_LIMIT = 1000
+
+
+def truncate(value: Any, limit: int = DEFAULT_PAYLOAD_LIMIT) -> str:
+    """将大载荷截断为适合记录日志的字符串。
+
+    配合 ``logger.opt(lazy=True)`` 使用，只有在日志级别生效时才会执行。
+
+    Args:
+        value: 需要记录的对象
+        limit: 最大保留字符数
+
+    Returns:
+        截断后的字符串
+    """
+    if isinstance(value, (list, tuple)):
+        # 逐条序列化，达到上限即停止，避免对整段历史做repr
+        pieces = []
+        size = 0
+        for item in value:
+            piece = truncate(item, limit - size)
+            pieces.append(piece)
+            size += len(piece) + 2
+            if size >= limit:
+                return f"[{', '.join(pieces)}, ...(已截断，共{len(value)}条)]"
+        return f"[{', '.join(pieces)}]"
+
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(已截断，共{len(text)}字符)"
+
+
+def _make_truncate_patcher(limit: int) -> Callable[[Dict[str, Any]], None]:
+    """创建截断超长日志消息的patcher。
+
+    Args:
+        limit: 消息最大长度
+
+    Returns:
+        loguru patcher函数
+    """
+
+    def patcher(record: Dict[str, Any]) -> None:
+        message = record["message"]
+        if len(message) > limit:
+            record["message"] = (
+                f"{message[:limit]}...(已截断，共{len(message)}字符)"
+            )
+
+    return patcher
+
+
+class QueuedSink:
+    """后台线程写入的日志sink。
+
+    调用方（通常是事件循环线程）只将格式化后的消息放入内存队列，
+    文件与终端写入在独立线程中由一个私有的loguru实例完成，
+    因此轮转、保留等文件sink特性保持不变。
+
+    入队与后台线程的开销高于直接追加写入本地文件，只有写入可能阻塞时（如 stderr 管道）才更快，
+    见 ``benchmarks/bench_logging.py``。
+    """
+
+    _STOP = object()
+    # 存活的实例，fork后在子进程中重新启动写入线程
+    _instances: "weakref.WeakSet[QueuedSink]" = weakref.WeakSet()
+
+    def __init__(self, writer: Any, sink: Any, **options: Any) -> None:
+        """初始化队列sink。
+
+        Args:
+            writer: 独立的loguru实例（无处理器），用于实际写入
+            sink: 实际的写入目标，文件路径或流
+            **options: 传递给 ``writer.add`` 的其余参数，如 rotation、retention
+        """
+        self._writer = writer
+        self._writer.add(sink, format="{message}", level=0, **options)
+        self._raw = self._writer.opt(raw=True)
+        self._start()
+        QueuedSink._instances.add(self)
+
+    def _start(self) -> None:
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    @classmethod
+    def _after_fork(cls) -> None:
+        """子进程中重新创建队列与写入线程。
+
+        线程不会随fork复制（如 gunicorn preload_app 在主进程中初始化日志后fork worker），
+        不重新启动时子进程的日志只进入队列、永远不会写出。父进程中尚未写出的消息由父进程负责。
+        """
+        for sink in list(cls._instances):
+            sink._start()
+
+    def write(self, message: Any) -> None:
+        """将消息放入队列，不做任何I/O。"""
+        self._queue.put(message)
+
+    def _run(self) -> None:
+        """后台线程：依次写出队列中的消息。"""
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            try:
+                self._raw.log(item.record["level"].no, str(item))
+            except Exception as e:
+                sys.stderr.write(f"日志写入失败: {e}\n")
+
+    async def complete(self) -> None:
+        """等待当前已入队的消息全部写出，供 ``await logger.complete()`` 调用。"""
+        drained = threading.Event()
+        self._queue.put(drained)
+        await asyncio.to_thread(drained.wait, 5)
+
+    def stop(self) -> None:
+        """写出剩余消息并停止后台线程，在处理器被移除时调用。"""
+        self._queue.put(self._STOP)
+        self._thread.join(timeout=5)
+        self._writer.remove()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=QueuedSink._after_fork)
+
 
 class InterceptHandler(logging.Handler):
-    """将标准库日志重定向到loguru的处理程序。"""
+    """将标准库日志重定向到loguru的处理程序。
+
+    httpx、uvicorn、mcp 等库在流式响应期间会高频记录日志，因此：
+    级别映射按 levelno 缓存；低于处理器级别的记录在格式化消息前即被丢弃；
+    默认直接使用标准库记录中已有的调用位置，而不是遍历调用栈。
+    """
+
+    def __init__(self, level: int = logging.NOTSET, introspect: bool = False):
+        """初始化处理程序。
+
+        Args:
+            level: 处理器级别，低于该级别的记录不会转发给loguru
+            introspect: 是否遍历调用栈定位调用方（较慢，位置信息与loguru原生一致）
+        """
+        super().__init__(level)
+        self.introspect = introspect
+        self._levels: Dict[int, str | int] = {}
+        self._local = threading.local()
+        self._patched_logger = logger.patch(self._patch_location)
+
+    def _patch_location(self, record: Dict[str, Any]) -> None:
+        """用标准库记录中的调用位置覆盖loguru记录。"""
+        std_record = getattr(self._local, "record", None)
+        if std_record is None:
+            return
+        record["name"] = std_record.name
+        record["function"] = std_record.funcName
+        record["line"] = std_record.lineno
+
+    def _resolve_level(self, record: logging.LogRecord) -> str | int:
+        """获取对应的 Loguru 日志级别，按 levelno 缓存。"""
+        levelno = record.levelno
+        level = self._levels.get(levelno)
+        if level is None:
+            try:
+                level = logger.level(record.levelname).name
+            except ValueError:
+                level = levelno
+            self._levels[levelno] = level
+        return level
 
     def emit(self, record):
         """发送日志记录到loguru。
@@ -17,26 +195,32 @@ class InterceptHandler(logging.Handler):
         Args:
             record: 日志记录
         """
-        # 获取对应的 Loguru 日志级别
+        # 低于处理器级别的记录已由 logging 在调用 emit 前丢弃，不会构造消息
+        level = self._resolve_level(record)
+        message = record.getMessage()
+
+        if self.introspect:
+            # 找到日志调用的堆栈位置：跳过 logging 模块内部的帧
+            frame, depth = sys._getframe(1), 1
+            while frame and frame.f_code.co_filename == logging.__file__:
+                frame = frame.f_back
+                depth += 1
+            target = logger.opt(depth=depth, exception=record.exc_info)
+            if hasattr(record, "props"):
+                target = target.bind(**record.props)
+            target.log(level, message)
+            return
+
+        self._local.record = record
         try:
-            level = logger.level(record.levelname).name
-        except ValueError:
-            level = record.levelno
-
-        # 找到日志调用的堆栈位置
-        frame, depth = logging.currentframe(), 2
-        while frame and frame.f_back and depth > 0:
-            frame = frame.f_back
-            depth -= 1
-
-        # 提取额外的上下文信息
-        extras = {}
-        if hasattr(record, "props"):
-            extras.update(record.props)
-
-        logger.opt(depth=6, exception=record.exc_info).log(
-            level, record.getMessage(), **extras
-        )
+            target = self._patched_logger
+            if record.exc_info:
+                target = target.opt(exception=record.exc_info)
+            if hasattr(record, "props"):
+                target = target.bind(**record.props)
+            target.log(level, message)
+        finally:
+            self._local.record = None
 
 
 def setup_logging(config: Optional[Dict[str, Any]] = None):
@@ -50,6 +234,13 @@ def setup_logging(config: Optional[Dict[str, Any]] = None):
             - rotation: 日志文件轮转策略 (默认: "10 MB")
             - retention: 日志文件保留策略 (默认: "1 week")
             - format: 日志格式 (默认: 详细格式)
+            - enqueue: 控制台日志是否通过内存队列由后台线程写入。stderr 通常是管道，
+              读取方跟不上时写入会阻塞事件循环 (默认: True)
+            - file_enqueue: 文件日志是否同样通过队列写入。写入本地文件时同步写入开销更低，
+              仅在日志目录位于网络存储等写入可能阻塞的位置时开启 (默认: False)
+            - max_message_length: 单条日志消息最大长度，超出部分截断 (默认: 8000)
+            - module_levels: 按模块设置日志级别，如 {"httpx": "WARNING"} (默认: {})
+            - intercept_introspect: 标准库日志桥接时是否遍历调用栈定位调用方 (默认: False)
     """
     # 默认配置
     default_config = {
@@ -60,6 +251,11 @@ def setup_logging(config: Optional[Dict[str, Any]] = None):
         "retention": "1 week",
         "format": "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
         "file_format": "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}",
+        "enqueue": True,
+        "file_enqueue": False,
+        "max_message_length": 8000,
+        "module_levels": {},
+        "intercept_introspect": False,
     }
 
     # 合并配置
@@ -70,9 +266,33 @@ def setup_logging(config: Optional[Dict[str, Any]] = None):
     # 移除所有默认处理器
     logger.remove()
 
+    # 截断超长消息，避免大载荷拖慢格式化与写入
+    logger.configure(patcher=_make_truncate_patcher(log_config["max_message_length"]))
+
+    enqueue = log_config["enqueue"]
+    file_enqueue = log_config["file_enqueue"]
+    module_levels: Dict[str, str] = log_config["module_levels"]
+    # 按模块过滤，loguru 支持以模块名为键的过滤字典
+    module_filter = dict(module_levels) if module_levels else None
+
+    # 异步模式下，每个sink在后台线程中由独立的loguru实例写入
+    writer_template = copy.deepcopy(logger)
+    writer_template.configure(patcher=lambda record: None)
+
+    def make_sink(sink: Any, queued: bool, **options: Any) -> Any:
+        if not queued:
+            return sink, options
+        return QueuedSink(copy.deepcopy(writer_template), sink, **options), {}
+
     # 添加控制台处理器
+    console_sink, console_options = make_sink(sys.stderr, enqueue)
     logger.add(
-        sys.stderr, format=log_config["format"], level=log_config["level"]
+        console_sink,
+        format=log_config["format"],
+        level=log_config["level"],
+        filter=module_filter,
+        colorize=sys.stderr.isatty(),
+        **console_options,
     )
 
     # 确保日志目录存在
@@ -80,34 +300,54 @@ def setup_logging(config: Optional[Dict[str, Any]] = None):
     os.makedirs(log_dir, exist_ok=True)
 
     # 添加文件处理器
-    logger.add(
+    app_sink, app_options = make_sink(
         f"{log_dir}/app.log",
+        file_enqueue,
         rotation=log_config["rotation"],
         retention=log_config["retention"],
+    )
+    logger.add(
+        app_sink,
         format=log_config["file_format"],
         level=log_config["file_level"],
+        filter=module_filter,
+        **app_options,
     )
 
     # 添加错误日志文件处理器
-    logger.add(
+    error_sink, error_options = make_sink(
         f"{log_dir}/error.log",
+        file_enqueue,
         rotation=log_config["rotation"],
         retention=log_config["retention"],
+    )
+    logger.add(
+        error_sink,
         format=log_config["file_format"],
         level="ERROR",
+        **error_options,
     )
 
-    # 将标准库日志重定向到loguru
-    logging.root.handlers = [InterceptHandler()]
-    logging.root.setLevel(logging.getLevelName(log_config["level"]))
+    # 将标准库日志重定向到loguru，所有日志器共享同一个处理程序
+    std_level = logging.getLevelName(log_config["level"])
+    intercept_handler = InterceptHandler(
+        level=std_level, introspect=log_config["intercept_introspect"]
+    )
+    logging.root.handlers = [intercept_handler]
+    logging.root.setLevel(std_level)
 
     # 为所有已存在的日志器设置处理程序
     for name in logging.root.manager.loggerDict.keys():
-        logging.getLogger(name).handlers = [InterceptHandler()]
+        logging.getLogger(name).handlers = [intercept_handler]
         logging.getLogger(name).propagate = False
 
+    # 标准库日志器同样按模块设置级别，在创建日志记录前即被过滤
+    for name, level in module_levels.items():
+        if name:
+            logging.getLogger(name).setLevel(level)
+
     logger.info(
-        f"日志系统已初始化，控制台级别: {log_config['level']}, 文件级别: {log_config['file_level']}"
+        f"日志系统已初始化，控制台级别: {log_config['level']}, 文件级别: {log_config['file_level']}, 异步写入: 控制台 {enqueue}, 文件 {file_enqueue}"
     )
 
     return logger
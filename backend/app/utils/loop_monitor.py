@@ -0,0 +1,189 @@
+"""事件循环监控模块。
+
+所有对话流共用一个事件循环，任何阻塞调用都会拖慢全部并发流。这里：
+
+- 在循环中按间隔采样调度延迟，导出直方图；
+- 由独立的看门狗线程检查循环心跳，阻塞超过阈值时抓取循环线程的调用栈；
+- 调试模式下开启 asyncio 调试，并通过审计钩子标记在循环线程上执行的同步I/O。
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Optional, Set, Tuple
+
+from loguru import logger
+
+from app.utils.telemetry import EVENT_LOOP_LAG_SECONDS, EVENT_LOOP_STALLS
+
+# 保留最近的延迟样本数，用于计算窗口内的统计值
+LAG_WINDOW = 240
+# 调试模式下视为同步I/O的审计事件
+BLOCKING_AUDIT_EVENTS = frozenset(
+    {"open", "time.sleep", "socket.connect", "socket.getaddrinfo", "subprocess.Popen"}
+)
+
+
+def format_loop_stack(thread_id: int) -> str:
+    """格式化指定线程当前的调用栈。
+
+    Args:
+        thread_id: 线程ID
+
+    Returns:
+        调用栈文本，线程不存在时为空字符串
+    """
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return ""
+    return "".join(traceback.format_stack(frame))
+
+
+class LoopMonitor:
+    """事件循环延迟与阻塞检测。"""
+
+    def __init__(self) -> None:
+        self.lags: Deque[float] = deque(maxlen=LAG_WINDOW)
+        self.interval: float = 0.25
+        self.threshold: float = 0.1
+        self.debug: bool = False
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat: float = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped: threading.Event = threading.Event()
+        self._reported_io: Set[Tuple[str, str, int]] = set()
+        self._in_audit: threading.local = threading.local()
+        self._audit_installed: bool = False
+
+    @property
+    def lag(self) -> float:
+        """最近一次采样的调度延迟（秒）。"""
+        return self.lags[-1] if self.lags else 0.0
+
+    def snapshot(self) -> dict:
+        """返回窗口内的延迟统计（秒）。"""
+        lags = sorted(self.lags)
+        if not lags:
+            return {"lag": 0.0, "p99": 0.0, "max": 0.0, "samples": 0}
+        return {
+            "lag": self.lag,
+            "p99": lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+            "max": lags[-1],
+            "samples": len(lags),
+        }
+
+    async def _sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self._last_beat = time.monotonic()
+            self.lags.append(lag)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.threshold:
+                logger.warning(f"事件循环被阻塞 {lag * 1000:.0f} ms")
+
+    def _watch(self) -> None:
+        """看门狗线程：心跳超时即认为循环被阻塞，每次阻塞只记录一次调用栈。"""
+        reported_beat = None
+        while not self._stopped.wait(self.threshold / 2):
+            stalled = time.monotonic() - self._last_beat - self.interval
+            if stalled <= self.threshold or reported_beat == self._last_beat:
+                continue
+            reported_beat = self._last_beat
+            EVENT_LOOP_STALLS.inc()
+            logger.warning(
+                f"事件循环已阻塞超过 {stalled * 1000:.0f} ms，当前调用栈:\n"
+                f"{format_loop_stack(self._loop_thread_id)}"
+            )
+
+    def _audit(self, event: str, args: Tuple[Any, ...]) -> None:
+        """审计钩子：记录循环线程上的同步I/O，每个调用位置只记录一次。"""
+        if (
+            not self.debug
+            or event not in BLOCKING_AUDIT_EVENTS
+            or threading.get_ident() != self._loop_thread_id
+            or getattr(self._in_audit, "active", False)
+        ):
+            return
+        # 非阻塞套接字的连接是事件循环自身的正常操作
+        if event == "socket.connect" and args[0].gettimeout() == 0.0:
+            return
+        self._in_audit.active = True
+        try:
+            frame = sys._getframe(1)
+            # 格式化调用栈时读取源码（asyncio调试模式会频繁触发）不计入
+            caller = frame
+            while caller is not None:
+                if caller.f_code.co_filename.endswith("linecache.py"):
+                    return
+                caller = caller.f_back
+            # 定位到应用代码中的调用位置
+            site = frame
+            while site is not None and "/app/" not in site.f_code.co_filename:
+                site = site.f_back
+            site = site or frame
+            key = (event, site.f_code.co_filename, site.f_lineno)
+            if key in self._reported_io:
+                return
+            self._reported_io.add(key)
+            logger.warning(
+                f"事件循环线程上执行了同步I/O {event}{args[:1]}，位置 "
+                f"{site.f_code.co_filename}:{site.f_lineno}\n"
+                f"{''.join(traceback.format_stack(frame, limit=8))}"
+            )
+        finally:
+            self._in_audit.active = False
+
+    def start(self, interval: float, threshold: float, debug: bool = False) -> None:
+        """在当前事件循环中启动监控。
+
+        Args:
+            interval: 延迟采样间隔（秒）
+            threshold: 判定为阻塞的延迟阈值（秒）
+            debug: 是否开启调试模式（asyncio调试与同步I/O检测，开销较大）
+        """
+        if self._task is not None:
+            return
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+        if debug:
+            loop = asyncio.get_running_loop()
+            loop.set_debug(True)
+            loop.slow_callback_duration = threshold
+            # 审计钩子无法移除，只在调试模式下注册一次
+            if not self._audit_installed:
+                sys.addaudithook(self._audit)
+                self._audit_installed = True
+            logger.warning("事件循环调试模式已开启，会记录慢回调与循环线程上的同步I/O")
+
+    async def stop(self) -> None:
+        """停止采样任务与看门狗线程。"""
+        self._stopped.set()
+        self.debug = False
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+
+# 创建单例
+loop_monitor = LoopMonitor()
@@ -0,0 +1,112 @@
+"""CPU密集任务卸载模块。
+
+小负载直接在事件循环中执行，超过阈值的负载交给线程池或进程池，
+避免单个超大的工具结果或工具目录阻塞同一进程中所有对话流。
+
+线程池适合以Python字节码为主的处理（如工具格式转换），解释器会定期切换线程让出事件循环；
+``json`` 等C实现在整个调用期间持有GIL，放到线程中并不能减少阻塞，
+输入输出都是字符串的这类任务应使用进程池，参数与结果的序列化在执行器的后台线程中完成。
+"""
+
+import asyncio
+import json
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, Callable, Optional, TypeVar
+
+from loguru import logger
+
+from app.config.configuration import get_setting
+from app.utils.telemetry import OFFLOAD_TASKS
+
+T = TypeVar("T")
+
+
+def dumps(obj: Any) -> str:
+    """序列化为紧凑的JSON，保留非ASCII字符（可在进程池中执行）。"""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class SizeAwareExecutor:
+    """按负载大小选择执行位置的执行器。"""
+
+    def __init__(self, threshold: int, thread_workers: int, process_workers: int):
+        """初始化SizeAwareExecutor。
+
+        Args:
+            threshold: 负载大小阈值，达到该值时卸载到线程池或进程池
+            thread_workers: 线程池大小
+            process_workers: 进程池大小，为0时进程任务改用线程池
+        """
+        self.threshold = threshold
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                self.thread_workers, thread_name_prefix="offload"
+            )
+        return self._threads
+
+    def _process_pool(self) -> Executor:
+        if self.process_workers <= 0:
+            return self._thread_pool()
+        if self._processes is None:
+            # 服务进程中已有后台线程，fork 不安全，使用 spawn 启动干净的子进程
+            self._processes = ProcessPoolExecutor(
+                self.process_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._processes
+
+    async def run(
+        self,
+        size: int,
+        func: Callable[..., T],
+        *args: Any,
+        process: bool = False,
+        threshold: Optional[int] = None,
+    ) -> T:
+        """执行函数，负载较大时卸载到线程池或进程池。
+
+        Args:
+            size: 负载大小（字节数或条目数，与 threshold 对应）
+            func: 要执行的函数，进程池中执行时必须可以被pickle
+            *args: 函数参数
+            process: 是否使用进程池，适用于持有GIL的C实现且参数与结果易于序列化的任务
+            threshold: 覆盖默认阈值
+
+        Returns:
+            函数返回值
+        """
+        if size < (self.threshold if threshold is None else threshold):
+            return func(*args)
+        pool = self._process_pool() if process else self._thread_pool()
+        OFFLOAD_TASKS.labels("process" if pool is self._processes else "thread").inc()
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, partial(func, *args)
+        )
+
+    def shutdown(self) -> None:
+        """关闭线程池与进程池。"""
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+            logger.debug("卸载进程池已关闭")
+
+
+@lru_cache(maxsize=1)
+def get_executor() -> SizeAwareExecutor:
+    """返回单例执行器，首次调用时根据配置创建。"""
+    setting = get_setting()
+    return SizeAwareExecutor(
+        setting.OFFLOAD_THRESHOLD,
+        setting.OFFLOAD_THREAD_WORKERS,
+        setting.OFFLOAD_PROCESS_WORKERS,
+    )
@@ -0,0 +1,57 @@
+"""启动预热模块。
+
+应用导入时不加载重量级依赖，由这里在服务启动后（或多进程部署的主进程 fork 前）统一预热。
+"""
+
+import gc
+import importlib
+import time
+from typing import Iterable
+
+from loguru import logger
+
+# 可以在 fork 前导入、由各 worker 共享的模块：导入时不创建线程或连接
+FORK_SAFE_MODULES = (
+    "openai",
+    "openai.types.chat",
+    "mcp",
+    "mcp.client.stdio",
+    "mcp.client.streamable_http",
+    "yaml",
+)
+# mem0 导入时会启动遥测线程，线程无法跨 fork 保留，只能在 worker 内导入
+WORKER_MODULES = ("mem0",)
+
+
+def preload_modules(modules: Iterable[str] = FORK_SAFE_MODULES + WORKER_MODULES) -> float:
+    """导入重量级依赖并完成延迟构建的模型。
+
+    Args:
+        modules: 需要导入的模块
+
+    Returns:
+        预热耗时（秒）
+    """
+    start = time.perf_counter()
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"预热导入 {name} 失败: {e}")
+
+    from app.services.llm_client import MessageChunk
+
+    MessageChunk.ensure_built()
+    elapsed = time.perf_counter() - start
+    logger.info(f"依赖预热完成，耗时 {elapsed:.2f} 秒")
+    return elapsed
+
+
+def preload_before_fork() -> None:
+    """多进程部署时在主进程中预热，fork 出的 worker 以写时复制方式共享已导入的模块。
+
+    预热后冻结垃圾回收跟踪的对象，避免 worker 中的回收扫描写入共享页面而触发复制。
+    """
+    preload_modules(FORK_SAFE_MODULES)
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,235 @@
+"""SSE传输模块。
+
+负责对话流的编码与发送：
+- 按客户端的 Accept-Encoding 对整个流做增量压缩（gzip，安装了 brotli 时可用 br），
+  在事件边界刷新压缩器，客户端可以立即解出完整的事件；
+- 刷新策略：``frame`` 每个事件立即发送；``interval`` 合并一段时间内的事件后再发送，
+  减少小包数量与压缩器的刷新开销，代价是增加最多一个间隔的延迟；
+- 长时间没有事件时（例如等待工具执行）发送心跳注释，避免代理与负载均衡器断开空闲连接。
+
+逐token的事件高度重复，压缩后每个事件只需几个字节。
+"""
+
+import asyncio
+import json
+import zlib
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from fastapi.responses import StreamingResponse
+
+from app.config.configuration import get_setting
+from app.utils.telemetry import SSE_WIRE_BYTES
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+DATA_PREFIX = "data: "
+HEARTBEAT = b": ping\n\n"
+# 等待发送的最大帧数，超过时暂停生成
+MAX_PENDING_FRAMES = 64
+
+
+def sse_event(chunk: Dict[str, Any]) -> str:
+    """将事件编码为SSE帧，使用紧凑的JSON分隔符。"""
+    return f"{DATA_PREFIX}{json.dumps(chunk, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def negotiate_encoding(accept_encoding: str, preferred: List[str]) -> Optional[str]:
+    """按服务端的优先顺序选择客户端接受的压缩算法。
+
+    Args:
+        accept_encoding: 请求的 Accept-Encoding 头
+        preferred: 服务端支持的算法，按优先顺序
+
+    Returns:
+        选中的算法，都不接受时为None
+    """
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    for encoding in preferred:
+        if encoding == "br" and brotli is None:
+            continue
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+class StreamCompressor:
+    """增量压缩器，支持在事件边界刷新。"""
+
+    def __init__(self, encoding: str, level: int):
+        """初始化StreamCompressor。
+
+        Args:
+            encoding: gzip 或 br
+            level: 压缩级别（gzip 为1-9，br 为0-11）
+        """
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=level)
+        else:
+            # wbits=31 输出带gzip头的格式
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """输出目前为止的全部数据，客户端可以完整解压。"""
+        if self.encoding == "br":
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+async def encode_stream(
+    frames: AsyncGenerator[str, None],
+    compressor: Optional[StreamCompressor] = None,
+    flush_policy: str = "frame",
+    flush_interval: float = 0.05,
+    heartbeat: float = 0.0,
+) -> AsyncGenerator[bytes, None]:
+    """将SSE帧编码为发送的字节，按策略压缩、刷新并插入心跳。
+
+    帧生成器在单独的任务中运行，等待下一帧的超时只用于刷新与心跳，不会中断生成；
+    最多缓冲 MAX_PENDING_FRAMES 帧，客户端接收慢时生成随之暂停。
+
+    Args:
+        frames: SSE帧生成器
+        compressor: 压缩器，为None时不压缩
+        flush_policy: frame 每帧立即发送，interval 合并一段时间内的帧后发送
+        flush_interval: interval 策略下合并帧的最长时间（秒）
+        heartbeat: 空闲多久后发送心跳（秒），为0时不发送
+
+    Yields:
+        发送给客户端的字节
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[str] = asyncio.Queue(MAX_PENDING_FRAMES)
+
+    async def pump() -> None:
+        try:
+            async for frame in frames:
+                await queue.put(frame)
+        finally:
+            # 在等待入队时被取消，生成器停在 yield 处，需要显式关闭
+            await frames.aclose()
+
+    producer = asyncio.create_task(pump())
+    getter: Optional[asyncio.Task] = None
+    buffered: List[bytes] = []
+    flushed_at = sent_at = loop.time()
+
+    def drain(final: bool = False) -> bytes:
+        data = b"".join(buffered)
+        buffered.clear()
+        if compressor is not None:
+            data = compressor.compress(data)
+            data += compressor.finish() if final else compressor.flush()
+        SSE_WIRE_BYTES.inc(len(data))
+        return data
+
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.create_task(queue.get())
+            deadlines = []
+            if heartbeat:
+                deadlines.append(sent_at + heartbeat)
+            if buffered:
+                deadlines.append(flushed_at + flush_interval)
+            timeout = max(0.0, min(deadlines) - loop.time()) if deadlines else None
+            done, _ = await asyncio.wait(
+                {getter, producer}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                buffered.append(getter.result().encode("utf-8"))
+                getter = None
+                if flush_policy == "frame":
+                    yield drain()
+                    flushed_at = sent_at = loop.time()
+                    continue
+            elif producer in done:
+                break
+            now = loop.time()
+            if buffered and now - flushed_at >= flush_interval:
+                yield drain()
+                flushed_at = sent_at = now
+            elif not buffered and heartbeat and now - sent_at >= heartbeat:
+                buffered.append(HEARTBEAT)
+                yield drain()
+                flushed_at = sent_at = now
+        # 生成结束，发送队列中剩余的帧
+        while not queue.empty():
+            buffered.append(queue.get_nowait().encode("utf-8"))
+        producer.result()
+        data = drain(final=True)
+        if data:
+            yield data
+    finally:
+        for task in (getter, producer):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except BaseException:
+                    pass
+
+
+def sse_response(
+    frames: AsyncGenerator[str, None],
+    accept_encoding: str = "",
+    wrap: Optional[
+        Callable[[AsyncGenerator[bytes, None]], AsyncGenerator[bytes, None]]
+    ] = None,
+) -> StreamingResponse:
+    """按配置的传输策略创建SSE响应。
+
+    Args:
+        frames: SSE帧生成器
+        accept_encoding: 请求的 Accept-Encoding 头
+        wrap: 包装编码后的字节流，如 ``lifecycle.track``；帧生成器在单独的任务中运行，
+            需要记录请求任务的包装应放在这里
+
+    Returns:
+        流式响应
+    """
+    setting = get_setting()
+    headers = {
+        "Cache-Control": "no-cache",
+        # 关闭 nginx 等反向代理的响应缓冲
+        "X-Accel-Buffering": "no",
+    }
+    compressor = None
+    encoding = negotiate_encoding(accept_encoding, setting.SSE_COMPRESSION)
+    if encoding is not None:
+        compressor = StreamCompressor(encoding, setting.SSE_COMPRESSION_LEVEL)
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+    body = encode_stream(
+        frames,
+        compressor,
+        setting.SSE_FLUSH_POLICY,
+        setting.SSE_FLUSH_INTERVAL,
+        setting.SSE_HEARTBEAT_INTERVAL,
+    )
+    return StreamingResponse(
+        wrap(body) if wrap is not None else body,
+        media_type="text/event-stream",
+        headers=headers,
+    )
@@ -0,0 +1,209 @@
+"""性能埋点模块，提供Prometheus指标与OpenTelemetry链路追踪。"""
+
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from loguru import logger
+from opentelemetry import trace
+from opentelemetry.trace import Span, Status, StatusCode
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+# 链路追踪器，未配置导出器时为空操作实现
+tracer = trace.get_tracer("wiley-ai-backend")
+
+# 延迟类指标的分桶（秒）
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+AGENT_CREATE_SECONDS = Histogram(
+    "agent_create_seconds",
+    "创建并连接ChatAgent的耗时",
+    buckets=LATENCY_BUCKETS,
+)
+MEMORY_SEARCH_SECONDS = Histogram(
+    "memory_search_seconds",
+    "mem0记忆检索耗时",
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TTFT_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds",
+    "LLM首个token返回耗时",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "LLM调用消耗的token数",
+    ["model", "kind"],
+)
+LLM_RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "llm_rate_limit_wait_seconds",
+    "LLM请求在客户端限流队列中的等待时间",
+    ["priority"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_RATE_LIMITED = Counter(
+    "llm_rate_limited_total",
+    "LLM服务商返回429的次数",
+    ["model"],
+)
+LLM_ROUTING_DECISIONS = Counter(
+    "llm_routing_decisions_total",
+    "模型路由的决策次数（tool_call：采用小模型的工具调用，其余为改用主模型的原因）",
+    ["outcome"],
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second",
+    "LLM流式输出速率（增量块/秒）",
+    ["model"],
+    buckets=(1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400),
+)
+TOOL_CALL_SECONDS = Histogram(
+    "mcp_tool_call_seconds",
+    "MCP工具调用耗时",
+    ["server", "tool", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+TOOL_CALL_BATCH_SIZE = Histogram(
+    "mcp_tool_batch_size",
+    "一次并发执行的同一服务器工具调用数（batch：批量调用扩展，pipeline：会话内流水线）",
+    ["server", "mode"],
+    buckets=(1, 2, 3, 4, 6, 8, 16, 32),
+)
+TOOL_PREFETCHES = Counter(
+    "mcp_tool_prefetch_total",
+    "工具预取次数（hit：模型发起了匹配的调用，unused：本轮结束时取消）",
+    ["tool", "outcome"],
+)
+HISTORY_COMPACTIONS = Counter(
+    "chat_history_compactions_total",
+    "对话历史压缩次数",
+    ["status"],
+)
+ANSWER_CACHE_LOOKUPS = Counter(
+    "chat_answer_cache_lookups_total",
+    "回答缓存查询次数",
+    ["tier", "result"],
+)
+TOOL_ROUNDS_PER_TURN = Histogram(
+    "chat_tool_rounds_per_turn",
+    "每轮对话中的工具调用轮数",
+    buckets=(0, 1, 2, 3, 4, 5, 10),
+)
+DUPLICATE_SUBMISSIONS = Counter(
+    "chat_duplicate_submissions_total",
+    "重复提交同一条消息的次数（running：轮次进行中，finished：回放已结束的轮次）",
+    ["state"],
+)
+SSE_BYTES_SENT = Counter(
+    "chat_sse_bytes_sent_total",
+    "通过SSE发送给客户端的字节数",
+)
+SSE_WIRE_BYTES = Counter(
+    "chat_sse_wire_bytes_total",
+    "SSE实际发送的字节数（压缩后，含心跳）",
+)
+SSE_BYTES_PER_TURN = Histogram(
+    "chat_sse_bytes_per_turn",
+    "每轮对话通过SSE发送的字节数",
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+HEALTH_PROBE_UP = Gauge(
+    "health_probe_up",
+    "依赖探测是否成功（1成功，0失败或未知）",
+    ["probe"],
+)
+HEALTH_PROBE_SECONDS = Gauge(
+    "health_probe_seconds",
+    "最近一次依赖探测的耗时，LLM为首token耗时",
+    ["probe"],
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "事件循环调度延迟",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+OFFLOAD_TASKS = Counter(
+    "offload_tasks_total",
+    "卸载到线程池或进程池执行的任务数",
+    ["pool"],
+)
+EVENT_LOOP_STALLS = Counter(
+    "event_loop_stalls_total",
+    "事件循环阻塞超过阈值的次数",
+)
+
+
+@contextmanager
+def generator_span(name: str, attributes: Optional[dict[str, Any]] = None) -> Iterator[Span]:
+    """在异步生成器中使用的span。
+
+    流式生成器可能在另一个上下文中被关闭，此时无法还原当前span，
+    因此这里只创建并结束span，不将其设为当前span。
+
+    Args:
+        name: span名称
+        attributes: span属性
+
+    Yields:
+        创建的span
+    """
+    span = tracer.start_span(name, attributes=attributes)
+    try:
+        yield span
+    except Exception as e:
+        span.record_exception(e)
+        span.set_status(Status(StatusCode.ERROR, str(e)))
+        raise
+    finally:
+        span.end()
+
+
+def setup_tracing(endpoint: Optional[str], service_name: str) -> None:
+    """配置OpenTelemetry链路导出。
+
+    未设置endpoint时保持空操作追踪器，不产生任何开销。
+
+    Args:
+        endpoint: OTLP/HTTP采集器地址，例如 http://localhost:4318
+        service_name: 上报的服务名称
+    """
+    if not endpoint:
+        return
+
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+        OTLPSpanExporter,
+    )
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(
+        BatchSpanProcessor(
+            OTLPSpanExporter(endpoint=f"{endpoint.rstrip('/')}/v1/traces")
+        )
+    )
+    trace.set_tracer_provider(provider)
+    logger.info(f"OpenTelemetry链路导出已启用: {endpoint}")
+
+
+def shutdown_tracing() -> None:
+    """导出剩余的span并关闭链路导出，未启用时为空操作。"""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """导出Prometheus文本格式的指标。
+
+    Returns:
+        指标内容与对应的Content-Type
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,288 @@
+"""智能体热路径微基准。
+
+覆盖每个 token、每轮对话都会执行的CPU路径：
+- sse_frames：ChatAgent.ask 中由LLM增量生成SSE帧（按每个token折算）；
+- message_chunk / stream_chunk：每个增量构造 MessageChunk 与轻量 StreamChunk；
+- llm_stream：LLMClient.get_response（typed）与 stream_response（raw）解析流式响应（按每个token折算）；
+- convert_tools：convert_mcp_to_openai_tools 处理大规模工具目录；
+- history：对话历史截断与深拷贝；
+- request_parse：聊天接口宽松解析携带长 messages 数组的请求体（完整协议），
+  与 request_parse_model（逐条校验全部历史的旧实现）、request_parse_delta（增量协议）对比。
+
+结果包含当前提交号，可用 ``--compare`` 与之前保存的结果比较。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_hotpaths [--only sse_frames] [--output path.json] [--compare old.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from typing import Any, Callable, Dict
+
+import httpx
+from openai import AsyncOpenAI
+
+# 基准不访问外部服务，仅需满足配置校验
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+os.environ.setdefault("LLM_MODEL", "benchmark-model")
+os.environ.setdefault("MEM0_API_KEY", "benchmark")
+
+from loguru import logger  # noqa: E402
+from mcp import Tool  # noqa: E402
+
+from app.api.chat import RequestBody, parse_request_body  # noqa: E402
+from app.core.agent import ChatAgent  # noqa: E402
+from app.services.llm_client import (  # noqa: E402
+    LLMClient,
+    MessageChunk,
+    StreamChunk,
+    UsageCallback,
+)
+from benchmarks.common import (  # noqa: E402
+    measure,
+    print_comparison,
+    print_table,
+    save_results,
+)
+from benchmarks.loadtest.fake_mem0 import FakeMemoryClient  # noqa: E402
+
+
+class ScriptedLLMClient:
+    """按脚本返回固定增量的LLM客户端替身。"""
+
+    def __init__(self, tokens: int) -> None:
+        self.chunks = [StreamChunk("message", f"token{i} ") for i in range(tokens)]
+        self.usage = {"prompt_tokens": 10, "completion_tokens": tokens, "total_tokens": tokens + 10}
+
+    async def stream_response(
+        self,
+        messages: list[dict[str, Any]],
+        model: str | None = None,
+        on_usage: UsageCallback | None = None,
+        user_id: str = "",
+        priority: str = "interactive",
+    ):
+        for chunk in self.chunks:
+            yield chunk
+        # 与 LLMClient 一致，流结束后上报一次用量
+        if on_usage is not None:
+            on_usage(model or "benchmark-model", self.usage)
+
+    async def route_response(
+        self,
+        messages: list[dict[str, Any]],
+        model: str | None = None,
+        on_usage: UsageCallback | None = None,
+        user_id: str = "",
+    ):
+        # 替身没有工具，与未配置 LLM_TOOL_MODEL 时一样直接使用主模型
+        async for chunk in self.stream_response(messages, model, on_usage, user_id):
+            yield chunk
+
+
+class StaticToolServer:
+    """返回固定工具列表的MCP服务替身。"""
+
+    def __init__(self, name: str, tools: list[Tool]) -> None:
+        self.name = name
+        self.tools = tools
+
+    async def list_tools(self) -> list[Tool]:
+        return self.tools
+
+
+def make_tools(count: int) -> list[Tool]:
+    return [
+        Tool(
+            name=f"tool_{i}",
+            description=f"第{i}个工具的描述" * 4,
+            inputSchema={
+                "type": "object",
+                "required": ["query", "mode"],
+                "properties": {
+                    "query": {"type": "string", "description": "查询内容"},
+                    "mode": {"type": "string", "enum": ["fast", "full"], "description": "模式"},
+                    "limit": {"type": "integer", "description": "返回条数"},
+                },
+            },
+        )
+        for i in range(count)
+    ]
+
+
+def make_history(count: int) -> list[dict[str, str]]:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": "历史消息内容" * 40}
+        for i in range(count)
+    ]
+
+
+def make_request_body(count: int, protocol: str = "full") -> bytes:
+    messages = [
+        {
+            "id": f"msg-{i}",
+            "role": "user" if i % 2 == 0 else "assistant",
+            "parts": [{"type": "text", "text": "消息内容" * 50}],
+        }
+        for i in range(count)
+    ]
+    if protocol == "delta":
+        body = {
+            "id": "chat-1",
+            "message": messages[-1],
+            "lastMessageId": messages[-2]["id"] if count > 1 else None,
+            "trigger": "submit-message",
+        }
+    else:
+        body = {"id": "chat-1", "messages": messages, "trigger": "submit-message"}
+    return json.dumps(body).encode("utf-8")
+
+
+def make_completion_stream(tokens: int) -> bytes:
+    """构造OpenAI格式的流式响应体。"""
+    frames = []
+    for i in range(tokens):
+        chunk = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "benchmark-model",
+            "choices": [{"index": 0, "delta": {"content": f"token{i} "}, "finish_reason": None}],
+        }
+        frames.append(f"data: {json.dumps(chunk)}\n\n")
+    frames.append("data: [DONE]\n\n")
+    return "".join(frames).encode("utf-8")
+
+
+def bench_llm_stream(
+    loop: asyncio.AbstractEventLoop, tokens: int, method: str
+) -> Callable[[], None]:
+    body = make_completion_stream(tokens)
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(
+            200, headers={"content-type": "text/event-stream"}, content=body
+        )
+    )
+    client = LLMClient([])
+    client.openai_client = AsyncOpenAI(
+        api_key="benchmark",
+        base_url="http://llm.benchmark/v1",
+        http_client=httpx.AsyncClient(transport=transport),
+    )
+    messages = [{"role": "user", "content": "你好"}]
+
+    async def consume() -> None:
+        async for _ in getattr(client, method)(messages):
+            pass
+
+    return lambda: loop.run_until_complete(consume())
+
+
+def bench_sse_frames(loop: asyncio.AbstractEventLoop, tokens: int) -> Callable[[], None]:
+    agent = ChatAgent(user_id="bench", chat_id="bench", system_prompt="你是一个AI助手")
+    agent.llm_client = ScriptedLLMClient(tokens)
+    agent.mem0_client = FakeMemoryClient(latency=0)
+
+    async def turn() -> None:
+        async for _ in await agent.ask("你好"):
+            pass
+
+    return lambda: loop.run_until_complete(turn())
+
+
+def bench_message_chunk() -> Callable[[], None]:
+    MessageChunk.ensure_built()
+    return lambda: MessageChunk(type="message", data="token ")
+
+
+def bench_convert_tools(loop: asyncio.AbstractEventLoop, count: int) -> Callable[[], None]:
+    client = LLMClient([StaticToolServer("bench", make_tools(count))])
+    return lambda: loop.run_until_complete(client.convert_mcp_to_openai_tools())
+
+
+def bench_history(size: int) -> Callable[[], None]:
+    agent = ChatAgent(user_id="bench", chat_id="bench", system_prompt="", max_history=size)
+    history = make_history(size * 2)
+
+    def snapshot() -> None:
+        agent.user_messages = history
+        agent.history_snapshot()
+
+    return snapshot
+
+
+def bench_request_parse(count: int, protocol: str = "full") -> Callable[[], None]:
+    body = make_request_body(count, protocol)
+    return lambda: parse_request_body(body)
+
+
+def bench_request_parse_model(count: int) -> Callable[[], None]:
+    body = make_request_body(count)
+    return lambda: RequestBody.model_validate_json(body)
+
+
+def run(only: str | None, repeat: int) -> Dict[str, Dict[str, float]]:
+    # 基准期间关闭日志输出，避免干扰计时
+    logger.remove()
+    loop = asyncio.new_event_loop()
+    tokens = 200
+
+    cases: Dict[str, tuple[Callable[[], None], int, int]] = {
+        # 名称: (被测函数, 每轮次数, 结果折算除数)
+        f"sse_frames_per_token[{tokens}]": (bench_sse_frames(loop, tokens), 20, tokens),
+        "message_chunk": (bench_message_chunk(), 20000, 1),
+        "stream_chunk": (lambda: StreamChunk("message", "token "), 20000, 1),
+        f"llm_stream_typed_per_token[{tokens}]": (
+            bench_llm_stream(loop, tokens, "get_response"), 20, tokens
+        ),
+        f"llm_stream_raw_per_token[{tokens}]": (
+            bench_llm_stream(loop, tokens, "stream_response"), 20, tokens
+        ),
+    }
+    for count in (100, 500):
+        cases[f"convert_tools[{count}]"] = (bench_convert_tools(loop, count), 20, 1)
+    for size in (20, 200, 2000):
+        cases[f"history[{size}]"] = (bench_history(size), max(10, 20000 // size), 1)
+    for count in (10, 100, 1000):
+        number = max(5, 5000 // count)
+        cases[f"request_parse[{count}]"] = (bench_request_parse(count), number, 1)
+        cases[f"request_parse_model[{count}]"] = (bench_request_parse_model(count), number, 1)
+        cases[f"request_parse_delta[{count}]"] = (bench_request_parse(count, "delta"), 5000, 1)
+
+    results = {}
+    for name, (func, number, divisor) in cases.items():
+        if only and not name.startswith(only):
+            continue
+        stats = measure(func, number=number, repeat=repeat)
+        if divisor > 1:
+            stats = {
+                key: value / divisor if key != "ops" else value * divisor
+                for key, value in stats.items()
+            }
+        results[name] = stats
+
+    loop.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=None, help="只运行名称以此开头的基准")
+    parser.add_argument("--repeat", type=int, default=5, help="轮数")
+    parser.add_argument("--output", default=None, help="结果JSON输出路径")
+    parser.add_argument("--compare", default=None, help="与之前保存的结果JSON比较")
+    args = parser.parse_args()
+
+    results = run(args.only, args.repeat)
+    print_table(results)
+    path = save_results("hotpaths", results, args.output)
+    print(f"结果已保存: {path}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""冷启动导入耗时报告。
+
+在全新的子进程中以 ``-X importtime`` 导入 ``app.main``，统计总耗时与累计耗时最高的模块，
+并检查重量级依赖没有在导入阶段被加载。总耗时中位数超过预算或加载了禁止的模块时以非零状态退出。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_import [--budget 1.5] [--top 15] [--output path.json] [--compare old.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.common import print_comparison, print_table, save_results, summarize
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# 默认的冷启动预算（秒）
+DEFAULT_BUDGET = 1.5
+# 应在首次使用或启动预热时才导入的模块
+FORBIDDEN_MODULES = ("mem0", "qdrant_client", "openai", "mcp", "yaml")
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# 子进程中执行的导入脚本：输出耗时与已加载的禁止模块
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+loaded = [m for m in {forbidden!r} if m in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "loaded": loaded}}))
+"""
+
+
+def run_probe(importtime: bool) -> tuple[Dict[str, Any], str]:
+    """在全新进程中导入应用。
+
+    Args:
+        importtime: 是否开启 ``-X importtime``
+
+    Returns:
+        探测结果与子进程的stderr
+    """
+    args = [sys.executable]
+    if importtime:
+        args += ["-X", "importtime"]
+    args += ["-c", PROBE.format(forbidden=FORBIDDEN_MODULES)]
+    # 导入阶段不应依赖配置，这里不提供任何必需的环境变量
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in ("OPENAI_API_KEY", "OPENAI_BASE_URL", "LLM_MODEL", "MEM0_API_KEY")
+    }
+    env["PYTHONPATH"] = str(BACKEND_DIR)
+    completed = subprocess.run(
+        args, cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def top_modules(stderr: str, top: int) -> List[Dict[str, Any]]:
+    """解析 ``-X importtime`` 输出，返回累计耗时最高的模块。
+
+    Args:
+        stderr: 子进程的stderr
+        top: 返回的模块数
+
+    Returns:
+        模块名、自身耗时与累计耗时（秒）
+    """
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append(
+                {
+                    "module": name,
+                    "depth": len(indent) // 2,
+                    "self": int(self_us) / 1e6,
+                    "cumulative": int(cumulative_us) / 1e6,
+                }
+            )
+    modules.sort(key=lambda m: m["cumulative"], reverse=True)
+    return modules[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="冷启动次数")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="导入耗时预算（秒）")
+    parser.add_argument("--top", type=int, default=15, help="报告中列出的模块数")
+    parser.add_argument("--output", default=None, help="结果JSON输出路径")
+    parser.add_argument("--compare", default=None, help="与之前保存的结果JSON比较")
+    args = parser.parse_args()
+
+    # 先运行一次填充字节码缓存，避免把编译时间计入冷启动
+    run_probe(importtime=False)
+    samples = []
+    loaded: List[str] = []
+    for _ in range(args.repeat):
+        probe, _ = run_probe(importtime=False)
+        samples.append(probe["elapsed"])
+        loaded = probe["loaded"]
+    probe, stderr = run_probe(importtime=True)
+    modules = top_modules(stderr, args.top)
+
+    results = {"import_app_main": summarize(samples)}
+    print_table(results)
+    print(f"\n累计耗时最高的 {args.top} 个模块（-X importtime）:")
+    for module in modules:
+        indent = "  " * module["depth"]
+        print(f"{module['cumulative'] * 1e3:>10.1f} ms  {indent}{module['module']}")
+
+    path = save_results(
+        "import", {**results, "top_modules": modules, "loaded_heavy_modules": loaded}, args.output
+    )
+    print(f"\n结果已保存: {path}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+    failures = []
+    median = results["import_app_main"]["median"]
+    if median > args.budget:
+        failures.append(f"导入耗时 {median:.3f}s 超过预算 {args.budget:.3f}s")
+    if loaded:
+        failures.append(f"导入阶段加载了重量级模块: {', '.join(loaded)}")
+    for failure in failures:
+        print(f"失败: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""标准库日志 → loguru 桥接吞吐量基准。
+
+对比旧版 InterceptHandler（每条记录查询级别、遍历调用栈）与当前实现，
+分别测量记录被转发与被级别过滤两种情况下的每秒记录数。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_intercept [--number 20000] [--output path.json]
+"""
+
+import argparse
+import logging
+
+from loguru import logger
+
+from app.utils.logging import InterceptHandler
+from benchmarks.common import measure, print_table, save_results
+
+
+class LegacyInterceptHandler(logging.Handler):
+    """优化前的桥接实现，仅用于对比。"""
+
+    def emit(self, record):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+
+        frame, depth = logging.currentframe(), 2
+        while frame and frame.f_back and depth > 0:
+            frame = frame.f_back
+            depth -= 1
+
+        extras = {}
+        if hasattr(record, "props"):
+            extras.update(record.props)
+
+        logger.opt(depth=6, exception=record.exc_info).log(
+            level, record.getMessage(), **extras
+        )
+
+
+def run(number: int, repeat: int) -> dict:
+    # 丢弃输出的sink，只测量桥接本身的开销
+    logger.remove()
+    logger.add(lambda message: None, level="INFO", format="{name}:{function}:{line} - {message}")
+
+    std_logger = logging.getLogger("benchmarks.intercept")
+    std_logger.propagate = False
+    std_logger.setLevel(logging.DEBUG)
+
+    handlers = {
+        "legacy": LegacyInterceptHandler(),
+        "introspect": InterceptHandler(level=logging.INFO, introspect=True),
+        "fast": InterceptHandler(level=logging.INFO),
+    }
+
+    results = {}
+    for name, handler in handlers.items():
+        std_logger.handlers = [handler]
+        results[f"{name}_forwarded"] = measure(
+            lambda: std_logger.info("HTTP Request: %s %s", "POST", "/v1/chat"),
+            number=number,
+            repeat=repeat,
+        )
+        results[f"{name}_filtered"] = measure(
+            lambda: std_logger.debug("receive_response_body.started %s", "request"),
+            number=number,
+            repeat=repeat,
+        )
+
+    logger.remove()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000, help="每轮记录数")
+    parser.add_argument("--repeat", type=int, default=5, help="轮数")
+    parser.add_argument("--output", default=None, help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    results = run(args.number, args.repeat)
+    print_table(results)
+    path = save_results("intercept", results, args.output)
+    print(f"结果已保存: {path}")
+
+
+if __name__ == "__main__":
+    main()
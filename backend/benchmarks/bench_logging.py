@@ -0,0 +1,108 @@
+"""日志管线开销基准。
+
+分别考察两个因素，每组只改变一个变量：
+- 格式化：同步写入文件时比较立即格式化（file_sync_eager）与 ``logger.opt(lazy=True)``
+  延迟格式化（file_sync）；
+- 写入方式：相同的延迟格式化下比较同步写入与队列写入（``QueuedSink``），
+  分别写入本地文件与偶尔阻塞的输出流（模拟管道写满、磁盘抖动），
+  并比较日志级别未生效时的开销。
+
+结果为调用方（事件循环线程）单次日志调用的耗时，队列写入的后台写出不计入。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_logging [--messages 200] [--output path.json]
+"""
+
+import argparse
+import contextlib
+import tempfile
+import time
+
+from loguru import logger
+
+from app.utils.logging import setup_logging, truncate
+from benchmarks.common import measure, print_table, save_results
+
+
+class StallingStream:
+    """每写入 every 条消息阻塞一次的输出流，模拟管道写满或磁盘抖动。"""
+
+    def __init__(self, every: int = 50, stall: float = 0.01) -> None:
+        self.every = every
+        self.stall = stall
+        self.count = 0
+
+    def write(self, message: str) -> None:
+        self.count += 1
+        if self.count % self.every == 0:
+            time.sleep(self.stall)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+def build_messages(count: int) -> list[dict[str, str]]:
+    """构造一段模拟的对话历史。"""
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": "消息内容" * 50}
+        for i in range(count)
+    ]
+
+
+def run(message_count: int, number: int, repeat: int) -> dict:
+    messages = build_messages(message_count)
+    results = {}
+
+    def eager_call():
+        logger.debug(messages)
+
+    def lazy_call():
+        logger.opt(lazy=True).debug("请求消息: {}", lambda: truncate(messages))
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        # (名称, 异步写入, 文件级别, 控制台级别, 调用)
+        scenarios = [
+            ("file_sync_eager", False, "DEBUG", "CRITICAL", eager_call),
+            ("file_sync", False, "DEBUG", "CRITICAL", lazy_call),
+            ("file_queued", True, "DEBUG", "CRITICAL", lazy_call),
+            ("stalling_stream_sync", False, "CRITICAL", "DEBUG", lazy_call),
+            ("stalling_stream_queued", True, "CRITICAL", "DEBUG", lazy_call),
+            ("level_off_sync", False, "INFO", "CRITICAL", lazy_call),
+            ("level_off_queued", True, "INFO", "CRITICAL", lazy_call),
+        ]
+        for name, enqueue, file_level, console_level, log_call in scenarios:
+            with contextlib.redirect_stderr(StallingStream()):
+                setup_logging(
+                    {
+                        "level": console_level,
+                        "file_level": file_level,
+                        "log_dir": log_dir,
+                        "enqueue": enqueue,
+                        "file_enqueue": enqueue,
+                    }
+                )
+                results[name] = measure(log_call, number=number, repeat=repeat)
+                # 移除处理器时队列sink会写出剩余消息，不影响下一组
+                logger.remove()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200, help="对话历史条数")
+    parser.add_argument("--number", type=int, default=200, help="每轮调用次数")
+    parser.add_argument("--repeat", type=int, default=5, help="轮数")
+    parser.add_argument("--output", default=None, help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    results = run(args.messages, args.number, args.repeat)
+    print_table(results)
+    path = save_results("logging", results, args.output)
+    print(f"结果已保存: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""CPU密集任务卸载基准：测量大负载处理期间事件循环的最长阻塞时间。
+
+对每个场景分别直接在事件循环中执行（inline）与交给 ``SizeAwareExecutor``（offload），
+处理期间由另一个协程以 1ms 间隔采样，统计最长阻塞（stall）与总耗时（total）：
+- tool_output[n]：序列化 n 字节工具结果的 SSE 帧（进程池）；
+- convert_tools[n]：转换 n 个工具的工具目录（线程池）。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_offload [--repeat 5] [--output path.json] [--compare old.json]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+# 基准不访问外部服务，仅需满足配置校验
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+os.environ.setdefault("LLM_MODEL", "benchmark-model")
+
+from loguru import logger  # noqa: E402
+
+from app.services.llm_client import convert_tools  # noqa: E402
+from app.utils.offload import SizeAwareExecutor, dumps  # noqa: E402
+from benchmarks.bench_hotpaths import make_tools  # noqa: E402
+from benchmarks.common import print_comparison, print_table, save_results, summarize  # noqa: E402
+
+TICK = 0.001
+
+
+async def measure_stall(func: Callable[[], Awaitable[Any]]) -> tuple[float, float]:
+    """执行一次任务，返回事件循环最长阻塞时间与任务总耗时（秒）。"""
+    loop = asyncio.get_running_loop()
+    stalls: List[float] = []
+    done = False
+
+    async def ticker() -> None:
+        while not done:
+            start = loop.time()
+            await asyncio.sleep(TICK)
+            stalls.append(loop.time() - start - TICK)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(TICK * 5)
+    start = time.perf_counter()
+    await func()
+    total = time.perf_counter() - start
+    done = True
+    await task
+    return max(stalls), total
+
+
+def make_tool_output(size: int) -> dict[str, Any]:
+    text = '工具输出 "quoted" text\n'
+    return {
+        "type": "tool-output-available",
+        "toolCallId": "call_bench",
+        "output": text * (size // len(text.encode())),
+    }
+
+
+async def run(repeat: int) -> Dict[str, Dict[str, float]]:
+    # 阈值为0，所有任务都会卸载；inline 场景直接调用函数
+    executor = SizeAwareExecutor(threshold=0, thread_workers=2, process_workers=2)
+    # 预先启动进程池，避免把子进程启动时间计入结果
+    await executor.run(1, len, "warmup", process=True)
+
+    cases: Dict[str, tuple[Callable[[], Any], Callable[[], Awaitable[Any]]]] = {}
+    for size in (1 << 20, 4 << 20, 10 << 20):
+        chunk = make_tool_output(size)
+        name = f"tool_output[{size >> 20}MB]"
+
+        async def inline(chunk: dict = chunk) -> str:
+            return dumps(chunk)
+
+        async def offload(chunk: dict = chunk) -> str:
+            return await executor.run(1, dumps, chunk, process=True)
+
+        cases[name] = (inline, offload)
+    for count in (2000, 10000):
+        tools = make_tools(count)
+
+        async def inline_tools(tools: list = tools) -> list:
+            return convert_tools(tools)
+
+        async def offload_tools(tools: list = tools) -> list:
+            return await executor.run(count, convert_tools, tools)
+
+        cases[f"convert_tools[{count}]"] = (inline_tools, offload_tools)
+
+    results = {}
+    for name, (inline, offload) in cases.items():
+        for mode, func in (("inline", inline), ("offload", offload)):
+            samples = [await measure_stall(func) for _ in range(repeat)]
+            results[f"{name}.{mode}.stall"] = summarize([s for s, _ in samples])
+            results[f"{name}.{mode}.total"] = summarize([t for _, t in samples])
+    executor.shutdown()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="每个场景的执行次数")
+    parser.add_argument("--output", default=None, help="结果JSON输出路径")
+    parser.add_argument("--compare", default=None, help="与之前保存的结果JSON比较")
+    args = parser.parse_args()
+
+    logger.remove()
+    results = asyncio.run(run(args.repeat))
+    print_table(results)
+    path = save_results("offload", results, args.output)
+    print(f"结果已保存: {path}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""基准测试通用工具：计时、统计与结果持久化。"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def measure(
+    func: Callable[[], Any], number: int = 1000, repeat: int = 5
+) -> Dict[str, float]:
+    """多轮执行函数并统计单次调用耗时。
+
+    Args:
+        func: 被测函数，无参数
+        number: 每轮执行次数
+        repeat: 轮数
+
+    Returns:
+        统计结果，单位为秒/次
+    """
+    # 预热
+    for _ in range(min(number, 100)):
+        func()
+
+    samples: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+
+    return summarize(samples)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """计算样本的统计值。
+
+    Args:
+        samples: 样本列表
+
+    Returns:
+        包含 min/median/mean/max/ops 的字典
+    """
+    median = statistics.median(samples)
+    return {
+        "min": min(samples),
+        "median": median,
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+        "ops": 1 / median if median > 0 else float("inf"),
+    }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数（最近秩法）。
+
+    Args:
+        values: 数据
+        pct: 百分位，0-100
+
+    Returns:
+        百分位数值，数据为空时返回0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def environment() -> Dict[str, Any]:
+    """收集运行环境信息，便于跨提交比较。"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=False,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def save_results(
+    name: str, results: Dict[str, Any], output: Optional[str] = None
+) -> Path:
+    """保存基准测试结果为JSON。
+
+    Args:
+        name: 基准名称，用作默认文件名
+        results: 测试结果
+        output: 输出文件路径，默认为 benchmarks/results/<name>.json
+
+    Returns:
+        输出文件路径
+    """
+    path = Path(output) if output else RESULTS_DIR / f"{name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {"name": name, "environment": environment(), "results": results}
+    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def print_table(results: Dict[str, Dict[str, float]]) -> None:
+    """以表格形式打印计时结果。
+
+    Args:
+        results: 名称到统计结果的映射
+    """
+    width = max((len(name) for name in results), default=10)
+    print(f"{'benchmark':<{width}}  {'median(us)':>12}  {'min(us)':>12}  {'ops/s':>12}")
+    for name, stats in results.items():
+        print(
+            f"{name:<{width}}  {stats['median'] * 1e6:>12.2f}  "
+            f"{stats['min'] * 1e6:>12.2f}  {stats['ops']:>12.0f}"
+        )
+
+
+def print_comparison(results: Dict[str, Dict[str, float]], previous_path: str) -> None:
+    """与之前保存的结果逐项比较中位数。
+
+    Args:
+        results: 本次结果
+        previous_path: 之前保存的JSON结果路径
+    """
+    previous_payload = json.loads(Path(previous_path).read_text(encoding="utf-8"))
+    previous = previous_payload["results"]
+    commit = previous_payload.get("environment", {}).get("commit", "?")
+    width = max((len(name) for name in results), default=10)
+    print(f"与 {previous_path}（提交 {commit}）比较:")
+    print(f"{'benchmark':<{width}}  {'before(us)':>12}  {'after(us)':>12}  {'change':>8}")
+    for name, stats in results.items():
+        if name not in previous:
+            continue
+        before = previous[name]["median"]
+        after = stats["median"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:<{width}}  {before * 1e6:>12.2f}  {after * 1e6:>12.2f}  {change:>+7.1f}%")
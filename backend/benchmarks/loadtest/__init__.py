@@ -0,0 +1 @@
+"""基于本地替身服务的端到端压测。"""
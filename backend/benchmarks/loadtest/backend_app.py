@@ -0,0 +1,24 @@
+"""压测用的后端入口：与 app.main 相同，但 mem0 替换为进程内替身。
+
+由 run.py 通过 ``uvicorn benchmarks.loadtest.backend_app:app`` 启动，
+OpenAI 地址与 MCP 配置通过环境变量指向本地替身服务。
+"""
+
+import os
+
+from app.core.agent import ChatAgent
+from benchmarks.loadtest.fake_mem0 import FakeMemoryClient
+
+
+async def _init_fake_mem0_client(self: ChatAgent) -> None:
+    self.mem0_client = FakeMemoryClient(
+        latency=float(os.getenv("LOADTEST_MEM0_LATENCY", "0.02")),
+        results=int(os.getenv("LOADTEST_MEM0_RESULTS", "3")),
+    )
+
+
+ChatAgent.init_mem0_client = _init_fake_mem0_client
+
+from app.main import app  # noqa: E402
+
+__all__ = ["app"]
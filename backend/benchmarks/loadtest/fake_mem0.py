@@ -0,0 +1,29 @@
+"""进程内的 mem0 替身客户端。"""
+
+import asyncio
+from typing import Any
+
+
+class FakeMemoryClient:
+    """模拟 ``mem0.AsyncMemoryClient`` 的检索与写入接口。"""
+
+    def __init__(self, latency: float = 0.02, results: int = 3, **_: Any) -> None:
+        """初始化替身客户端。
+
+        Args:
+            latency: 每次调用模拟的网络延迟（秒）
+            results: 每次检索返回的记忆条数
+        """
+        self.latency = latency
+        self.results = results
+
+    async def search(self, query: str, **_: Any) -> list[dict[str, Any]]:
+        await asyncio.sleep(self.latency)
+        return [
+            {"id": f"mem-{i}", "memory": f"关于「{query[:20]}」的历史记忆 {i}"}
+            for i in range(self.results)
+        ]
+
+    async def add(self, messages: Any, **_: Any) -> dict[str, Any]:
+        await asyncio.sleep(self.latency)
+        return {"results": []}
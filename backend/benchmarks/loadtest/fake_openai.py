@@ -0,0 +1,239 @@
+"""OpenAI 兼容的脚本化流式服务。
+
+沿用 demo_backend/main.py 中逐帧推送 + 固定间隔的脚本化流思路，但输出的是
+OpenAI ``chat.completion.chunk`` 格式，供后端的 LLMClient 直接调用：
+
+- 当前用户消息之后的工具结果数少于 ``tool_rounds`` 时，返回一次工具调用；
+- 否则逐 token 返回文本回答。
+
+设置 ``--rpm`` 时模拟服务商的速率限制：配额按令牌桶匀速补充，用尽后返回 429 与 Retry-After。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.loadtest.fake_openai --port 9100 --tokens 64 --tool-rounds 2
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, AsyncGenerator
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 默认调用 mcp_server 中的演示工具
+DEFAULT_TOOL = "start-notification-stream"
+
+
+def _chunk(model: str, delta: dict[str, Any], finish_reason: str | None = None) -> str:
+    payload = {
+        "id": "chatcmpl-loadtest",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> dict[str, int]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _prompt_tokens(messages: list[dict[str, Any]]) -> int:
+    """按字符数粗略估算输入token数。"""
+    return len(json.dumps(messages, ensure_ascii=False)) // 2
+
+
+def _usage_chunk(model: str, prompt_tokens: int, completion_tokens: int) -> str:
+    payload = {
+        "id": "chatcmpl-loadtest",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [],
+        "usage": _usage(prompt_tokens, completion_tokens),
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def _tool_rounds_done(messages: list[dict[str, Any]]) -> int:
+    """统计最后一条用户消息之后已经完成的工具调用轮数（带 tool_calls 的助手消息数）。"""
+    count = 0
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            break
+        if message.get("role") == "assistant" and message.get("tool_calls"):
+            count += 1
+    return count
+
+
+def create_app(
+    tokens: int = 64,
+    ttft: float = 0.2,
+    token_interval: float = 0.01,
+    tool_rounds: int = 1,
+    tool_name: str = DEFAULT_TOOL,
+    rpm: int = 0,
+    tool_count: int = 2,
+    tool_interval: float = 0.01,
+    tools_per_round: int = 1,
+) -> FastAPI:
+    """创建脚本化的 OpenAI 兼容应用。
+
+    Args:
+        tokens: 每次文本回答的 token 数
+        ttft: 首个 token 前的等待时间（秒）
+        token_interval: token 之间的间隔（秒）
+        tool_rounds: 每轮对话中先返回的工具调用次数
+        tool_name: 工具调用使用的工具名
+        rpm: 每分钟请求数上限，为0时不限制
+        tool_count: 演示工具发送的通知数
+        tool_interval: 演示工具通知之间的间隔（秒），与 tool_count 一起决定工具耗时
+        tools_per_round: 每轮同时返回的工具调用数（并行工具调用）
+
+    Returns:
+        FastAPI应用
+    """
+    app = FastAPI(title="Fake OpenAI")
+    # 模拟速率限制的令牌桶：[剩余请求数, 上次补充时间]
+    bucket = [float(rpm), time.monotonic()]
+
+    def rate_limited() -> JSONResponse | None:
+        if not rpm:
+            return None
+        now = time.monotonic()
+        bucket[0] = min(rpm, bucket[0] + (now - bucket[1]) * rpm / 60)
+        bucket[1] = now
+        if bucket[0] < 1:
+            retry_after = (1 - bucket[0]) * 60 / rpm
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after-ms": str(int(retry_after * 1000)), "retry-after": str(int(retry_after) + 1)},
+            )
+        bucket[0] -= 1
+        return None
+
+    async def stream_tool_call(model: str, usage: int | None) -> AsyncGenerator[str, None]:
+        await asyncio.sleep(ttft)
+        arguments = json.dumps({"interval": tool_interval, "count": tool_count, "caller": "loadtest"})
+        for index in range(tools_per_round):
+            call_id = f"call_{uuid.uuid4().hex[:24]}"
+            yield _chunk(
+                model,
+                {
+                    "role": "assistant",
+                    "tool_calls": [
+                        {
+                            "index": index,
+                            "id": call_id,
+                            "type": "function",
+                            "function": {"name": tool_name, "arguments": ""},
+                        }
+                    ],
+                },
+            )
+            # 参数分片返回，模拟模型逐字生成
+            for start in range(0, len(arguments), 16):
+                yield _chunk(
+                    model,
+                    {
+                        "tool_calls": [
+                            {"index": index, "function": {"arguments": arguments[start : start + 16]}}
+                        ]
+                    },
+                )
+                await asyncio.sleep(token_interval)
+        yield _chunk(model, {}, "tool_calls")
+        if usage is not None:
+            yield _usage_chunk(model, usage, tools_per_round * len(arguments) // 4)
+        yield "data: [DONE]\n\n"
+
+    async def stream_text(model: str, usage: int | None) -> AsyncGenerator[str, None]:
+        await asyncio.sleep(ttft)
+        yield _chunk(model, {"role": "assistant", "content": ""})
+        for i in range(tokens):
+            yield _chunk(model, {"content": f"token{i} "})
+            await asyncio.sleep(token_interval)
+        yield _chunk(model, {}, "stop")
+        if usage is not None:
+            yield _usage_chunk(model, usage, tokens)
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        limited = rate_limited()
+        if limited is not None:
+            return limited
+        body = await request.json()
+        model = body.get("model", "fake-model")
+        prompt_tokens = _prompt_tokens(body["messages"])
+        if not body.get("stream"):
+            # 非流式调用（如历史摘要）：返回固定长度的文本
+            await asyncio.sleep(ttft)
+            content = " ".join(f"summary{i}" for i in range(tokens))
+            return {
+                "id": "chatcmpl-loadtest",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": _usage(prompt_tokens, tokens),
+            }
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+        usage = prompt_tokens if include_usage else None
+        if body.get("tools") and _tool_rounds_done(body["messages"]) < tool_rounds:
+            generator = stream_tool_call(model, usage)
+        else:
+            generator = stream_text(model, usage)
+        return StreamingResponse(generator, media_type="text/event-stream")
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake-model", "object": "model"}]}
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--token-interval", type=float, default=0.01)
+    parser.add_argument("--tool-rounds", type=int, default=1)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--tool-count", type=int, default=2)
+    parser.add_argument("--tool-interval", type=float, default=0.01)
+    parser.add_argument("--tools-per-round", type=int, default=1)
+    args = parser.parse_args()
+
+    app = create_app(
+        tokens=args.tokens,
+        ttft=args.ttft,
+        token_interval=args.token_interval,
+        tool_rounds=args.tool_rounds,
+        rpm=args.rpm,
+        tool_count=args.tool_count,
+        tool_interval=args.tool_interval,
+        tools_per_round=args.tools_per_round,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""端到端压测：在本地替身服务上以给定并发运行多轮、多工具调用的对话。
+
+启动三个子进程：
+- benchmarks.loadtest.fake_openai：OpenAI 兼容的脚本化流式服务；
+- mcp_server（无状态 streamable-http MCP 服务）：工具后端；
+- benchmarks.loadtest.backend_app：被测后端，mem0 替换为进程内替身。
+
+随后对 ``/api/chat/`` 并发发起对话，统计首 token 时间（TTFT）p50/p95/p99、
+输出速率、每个对话占用的内存与文件描述符，以及MCP服务端的工具吞吐与排队情况，
+并将结果保存为JSON；
+指定 ``--baseline`` 时与基线比较，超出容忍度即以非零状态退出。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.loadtest.run --chats 50 --concurrency 10 --turns 3
+    python -m benchmarks.loadtest.run --chats 200 --concurrency 100 --mcp-workers 4 --tool-count 5 --tool-interval 0.1
+    python -m benchmarks.loadtest.run --save-baseline benchmarks/baselines/loadtest.json
+    python -m benchmarks.loadtest.run --baseline benchmarks/baselines/loadtest.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from benchmarks.common import percentile, save_results
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+MCP_SERVER_DIR = BACKEND_DIR.parent / "mcp_server"
+
+# 比较基线时检查的指标：(路径, 越大越差, 允许的绝对波动)
+BASELINE_CHECKS = [
+    (("ttft", "p95"), True, 0.0),
+    (("ttft", "p99"), True, 0.0),
+    (("tokens_per_sec", "p50"), False, 0.0),
+    (("memory_per_chat_kb",), True, 256.0),
+    (("fds_per_chat",), True, 1.0),
+]
+
+# 压测结果中汇总的MCP服务端指标
+MCP_METRICS = (
+    "mcp_tool_calls_total{",
+    "mcp_tool_queue_wait_seconds_total{",
+    "mcp_http_requests_total{",
+    "mcp_tool_max_concurrency{",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def proc_rss_kb(pid: int) -> int:
+    """读取进程常驻内存（KB），仅支持Linux。"""
+    with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def proc_fds(pid: int) -> int:
+    """读取进程打开的文件描述符数，仅支持Linux。"""
+    return len(os.listdir(f"/proc/{pid}/fd"))
+
+
+async def wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(url, timeout=1)
+                if response.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"服务未就绪: {url}")
+
+
+async def run_turn(
+    client: httpx.AsyncClient,
+    base_url: str,
+    user_id: str,
+    chat_id: str,
+    history: list[dict[str, Any]],
+    text: str,
+    protocol: str = "delta",
+) -> dict[str, Any]:
+    """发送一轮对话并统计时延。
+
+    protocol 为 delta 时只上传新消息，为 full 时上传完整历史。
+    """
+    message = {
+        "id": uuid.uuid4().hex,
+        "role": "user",
+        "parts": [{"type": "text", "text": text}],
+    }
+    if protocol == "delta":
+        body = {
+            "id": chat_id,
+            "message": message,
+            "lastMessageId": history[-1]["id"] if history else None,
+            "trigger": "submit-message",
+        }
+    else:
+        body = {"id": chat_id, "messages": [*history, message], "trigger": "submit-message"}
+    answer_id = uuid.uuid4().hex
+
+    start = time.perf_counter()
+    first_delta = last_delta = None
+    deltas = 0
+    tool_outputs = 0
+    answer = []
+    received = 0
+    async with client.stream(
+        "POST", f"{base_url}/api/chat/", params={"user_id": user_id}, json=body
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            received += len(line) + 1
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: ") :])
+            event_type = event.get("type")
+            if event_type in ("text-delta", "reasoning-delta"):
+                now = time.perf_counter()
+                if first_delta is None:
+                    first_delta = now
+                last_delta = now
+                deltas += 1
+                if event_type == "text-delta":
+                    answer.append(event.get("delta", ""))
+            elif event_type == "tool-output-available":
+                tool_outputs += 1
+            elif event_type == "start" and event.get("messageId"):
+                answer_id = event["messageId"]
+        # 压缩后实际传输的字节数
+        wire_bytes = response.num_bytes_downloaded
+
+    history.append(message)
+    history.append(
+        {
+            "id": answer_id,
+            "role": "assistant",
+            "parts": [{"type": "text", "text": "".join(answer)}],
+        }
+    )
+    elapsed = time.perf_counter() - start
+    streaming = (last_delta - first_delta) if first_delta and last_delta else 0
+    return {
+        "ttft": (first_delta - start) if first_delta else None,
+        "tokens_per_sec": deltas / streaming if streaming > 0 else None,
+        "latency": elapsed,
+        "tool_outputs": tool_outputs,
+        "bytes": received,
+        "wire_bytes": wire_bytes,
+    }
+
+
+async def run_chat(
+    client: httpx.AsyncClient, base_url: str, turns: int, index: int, protocol: str = "delta"
+) -> list[dict[str, Any]]:
+    user_id = f"loadtest-user-{index}"
+    chat_id = f"loadtest-chat-{index}-{uuid.uuid4().hex[:8]}"
+    history: list[dict[str, Any]] = []
+    results = []
+    for turn in range(turns):
+        try:
+            results.append(
+                await run_turn(
+                    client,
+                    base_url,
+                    user_id,
+                    chat_id,
+                    history,
+                    f"第{turn + 1}个问题：今天的新闻？",
+                    protocol,
+                )
+            )
+        except Exception as e:
+            results.append({"error": str(e)})
+    return results
+
+
+def stats(values: list[float]) -> dict[str, float]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "count": len(values),
+    }
+
+
+async def scrape_mcp(mcp_url: str, workers: int) -> dict[str, dict[str, float]]:
+    """读取MCP服务各工作进程的工具调用计数与排队时间。
+
+    指标按进程统计，每次新建连接读取 /metrics，直到见到所有工作进程或达到尝试次数。
+
+    Returns:
+        工作进程PID -> {状态: 调用数, "wait": 累计排队秒数}
+    """
+    totals: dict[str, dict[str, float]] = {}
+    for _ in range(workers * 20):
+        async with httpx.AsyncClient(timeout=5) as client:
+            text = (await client.get(f"{mcp_url}/metrics")).text
+        # 同一进程可能被多次读到，以最近一次的值为准
+        scraped: dict[str, dict[str, float]] = {}
+        for line in text.splitlines():
+            if not line.startswith(MCP_METRICS):
+                continue
+            name, _, value = line.rpartition(" ")
+            labels = dict(item.split("=", 1) for item in name[name.index("{") + 1 : -1].split(","))
+            worker = scraped.setdefault(labels["worker"].strip('"'), {})
+            if name.startswith("mcp_tool_max_concurrency"):
+                continue
+            if "method" in labels:
+                key = "http_" + labels["method"].strip('"')
+            else:
+                key = labels["status"].strip('"') if "status" in labels else "wait"
+            worker[key] = worker.get(key, 0.0) + float(value)
+        totals.update(scraped)
+        if len(totals) >= workers:
+            break
+    return totals
+
+
+def mcp_delta(
+    before: dict[str, dict[str, float]], after: dict[str, dict[str, float]], duration: float
+) -> dict[str, Any]:
+    """按工作进程汇总压测期间MCP服务端的调用数、吞吐与平均排队时间。"""
+    delta: dict[str, float] = {}
+    for worker, values in after.items():
+        for key, value in values.items():
+            delta[key] = delta.get(key, 0.0) + value - before.get(worker, {}).get(key, 0.0)
+    statuses = {key: value for key, value in delta.items() if key != "wait" and not key.startswith("http_")}
+    calls = sum(statuses.values())
+    return {
+        "workers_seen": len(after),
+        "calls": {key: int(value) for key, value in statuses.items()},
+        "http_requests": {key[len("http_") :]: int(value) for key, value in delta.items() if key.startswith("http_")},
+        "calls_per_sec": delta.get("ok", 0.0) / duration if duration else 0,
+        "queue_wait_avg": delta.get("wait", 0.0) / calls if calls else 0,
+    }
+
+
+async def drive(args: argparse.Namespace, backend_url: str, backend_pid: int, mcp_url: str) -> dict[str, Any]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+
+        async def limited(index: int) -> list[dict[str, Any]]:
+            async with semaphore:
+                return await run_chat(client, backend_url, args.turns, index, args.protocol)
+
+        # 预热一个对话，排除首次导入与连接建立的影响
+        await run_chat(client, backend_url, 1, -1, args.protocol)
+        rss_before = proc_rss_kb(backend_pid)
+        fds_before = proc_fds(backend_pid)
+        mcp_before = await scrape_mcp(mcp_url, args.mcp_workers)
+
+        start = time.perf_counter()
+        chats = await asyncio.gather(*(limited(i) for i in range(args.chats)))
+        duration = time.perf_counter() - start
+
+        rss_after = proc_rss_kb(backend_pid)
+        fds_after = proc_fds(backend_pid)
+        mcp_after = await scrape_mcp(mcp_url, args.mcp_workers)
+
+    turns = [turn for chat in chats for turn in chat]
+    ok = [turn for turn in turns if "error" not in turn]
+    return {
+        "config": {
+            "chats": args.chats,
+            "concurrency": args.concurrency,
+            "turns": args.turns,
+            "tokens": args.tokens,
+            "tool_rounds": args.tool_rounds,
+            "tools_per_round": args.tools_per_round,
+            "protocol": args.protocol,
+            "tool_count": args.tool_count,
+            "tool_interval": args.tool_interval,
+            "mcp_workers": args.mcp_workers,
+        },
+        "duration": duration,
+        "turns_per_sec": len(ok) / duration if duration else 0,
+        "errors": len(turns) - len(ok),
+        "ttft": stats([t["ttft"] for t in ok if t["ttft"] is not None]),
+        "tokens_per_sec": stats([t["tokens_per_sec"] for t in ok if t["tokens_per_sec"]]),
+        "turn_latency": stats([t["latency"] for t in ok]),
+        "tool_outputs": sum(t["tool_outputs"] for t in ok),
+        "sse_bytes_per_turn": (sum(t["bytes"] for t in ok) / len(ok)) if ok else 0,
+        "sse_wire_bytes_per_turn": (sum(t["wire_bytes"] for t in ok) / len(ok)) if ok else 0,
+        "memory_per_chat_kb": (rss_after - rss_before) / args.chats,
+        "fds_per_chat": (fds_after - fds_before) / args.chats,
+        "mcp": mcp_delta(mcp_before, mcp_after, duration),
+    }
+
+
+def compare(results: dict[str, Any], baseline_path: str, tolerance: float) -> list[str]:
+    """与基线比较，返回超出容忍度的指标说明。"""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))["results"]
+    regressions = []
+    for path, higher_is_worse, slack in BASELINE_CHECKS:
+        current, expected = results, baseline
+        for key in path:
+            current, expected = current[key], expected[key]
+        name = ".".join(path)
+        if higher_is_worse:
+            limit = max(expected * (1 + tolerance), expected + slack)
+            if current > limit:
+                regressions.append(f"{name}: {current:.4f} > 基线 {expected:.4f}")
+        elif current < expected * (1 - tolerance):
+            regressions.append(f"{name}: {current:.4f} < 基线 {expected:.4f}")
+    return regressions
+
+
+def start_services(args: argparse.Namespace, workdir: str) -> tuple[list[subprocess.Popen], str, int, str]:
+    """启动替身服务与被测后端，返回进程列表、后端地址、后端PID与MCP服务地址。"""
+    openai_port, mcp_port, backend_port = free_port(), free_port(), free_port()
+    python = sys.executable
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR)}
+
+    def output(name: str) -> dict[str, Any]:
+        # 子进程输出写入临时目录，--verbose 时直接输出到终端
+        if args.verbose:
+            return {}
+        log_file = open(Path(workdir) / f"{name}.log", "w", encoding="utf-8")
+        return {"stdout": log_file, "stderr": subprocess.STDOUT}
+
+    processes = [
+        subprocess.Popen(
+            [
+                python, "-m", "benchmarks.loadtest.fake_openai",
+                "--port", str(openai_port),
+                "--tokens", str(args.tokens),
+                "--ttft", str(args.llm_ttft),
+                "--token-interval", str(args.token_interval),
+                "--tool-rounds", str(args.tool_rounds),
+                "--rpm", str(args.llm_rpm),
+                "--tool-count", str(args.tool_count),
+                "--tool-interval", str(args.tool_interval),
+                "--tools-per-round", str(args.tools_per_round),
+            ],
+            cwd=BACKEND_DIR,
+            env=env,
+            **output("fake_openai"),
+        ),
+        subprocess.Popen(
+            [
+                python, "-m", "mcp_simple_streamablehttp_stateless",
+                "--port", str(mcp_port),
+                "--log-level", "WARNING",
+                "--workers", str(args.mcp_workers),
+                "--max-concurrency", str(args.mcp_max_concurrency),
+            ],
+            cwd=MCP_SERVER_DIR,
+            env=env,
+            **output("mcp_server"),
+        ),
+    ]
+
+    config_path = Path(workdir) / "servers_config.json"
+    config_path.write_text(
+        json.dumps(
+            {"mcpServers": {"loadtest": {"type": "streamable-http", "url": f"http://127.0.0.1:{mcp_port}/mcp"}}}
+        ),
+        encoding="utf-8",
+    )
+    backend_env = {
+        **env,
+        "OPENAI_API_KEY": "loadtest",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "LLM_MODEL": "fake-model",
+        "MEM0_API_KEY": "loadtest",
+        "MCP_CONFIG_PATH": str(config_path),
+    }
+    backend = subprocess.Popen(
+        [
+            python, "-m", "uvicorn", "benchmarks.loadtest.backend_app:app",
+            "--port", str(backend_port), "--log-level", "warning",
+        ],
+        # 在临时目录运行，日志文件不落入仓库
+        cwd=workdir,
+        env=backend_env,
+        **output("backend"),
+    )
+    processes.append(backend)
+    return processes, f"http://127.0.0.1:{backend_port}", backend.pid, f"http://127.0.0.1:{mcp_port}"
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    with tempfile.TemporaryDirectory() as workdir:
+        processes, backend_url, backend_pid, mcp_url = start_services(args, workdir)
+        try:
+            # 等待预热与首轮依赖探测完成，避免把启动阶段计入压测结果
+            await wait_ready(f"{backend_url}/ready")
+            results = await drive(args, backend_url, backend_pid, mcp_url)
+        except Exception:
+            backend_log = Path(workdir) / "backend.log"
+            if backend_log.exists():
+                print(backend_log.read_text(encoding="utf-8")[-4000:])
+            raise
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    path = save_results("loadtest", results, args.output)
+    print(f"结果已保存: {path}")
+    if args.save_baseline:
+        save_results("loadtest", results, args.save_baseline)
+        print(f"基线已保存: {args.save_baseline}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print("性能回退:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("未发现性能回退")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=20, help="对话总数")
+    parser.add_argument("--concurrency", type=int, default=5, help="并发对话数")
+    parser.add_argument("--turns", type=int, default=3, help="每个对话的轮数")
+    parser.add_argument("--tokens", type=int, default=64, help="每次回答的token数")
+    parser.add_argument("--tool-rounds", type=int, default=1, help="每轮对话的工具调用次数")
+    parser.add_argument("--tools-per-round", type=int, default=1, help="每次工具调用中并行调用的工具数")
+    parser.add_argument("--llm-ttft", type=float, default=0.2, help="替身LLM的首token延迟（秒）")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="替身LLM的token间隔（秒）")
+    parser.add_argument("--llm-rpm", type=int, default=0, help="替身LLM的每分钟请求数上限，0表示不限制")
+    parser.add_argument("--tool-count", type=int, default=2, help="每次工具调用发送的通知数")
+    parser.add_argument("--tool-interval", type=float, default=0.01, help="工具通知之间的间隔（秒）")
+    parser.add_argument("--mcp-workers", type=int, default=1, help="MCP服务的工作进程数")
+    parser.add_argument(
+        "--mcp-max-concurrency", type=int, default=100, help="MCP服务每个进程每个工具的并发上限，0表示不限制"
+    )
+    parser.add_argument(
+        "--protocol", choices=("delta", "full"), default="delta", help="请求协议：只上传新消息或上传完整历史"
+    )
+    parser.add_argument("--timeout", type=float, default=120, help="单轮请求超时（秒）")
+    parser.add_argument("--output", default=None, help="结果JSON输出路径")
+    parser.add_argument("--save-baseline", default=None, help="将本次结果保存为基线")
+    parser.add_argument("--baseline", default=None, help="与指定基线比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对回退比例")
+    parser.add_argument("--verbose", action="store_true", help="输出各服务的日志")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
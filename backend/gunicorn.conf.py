@@ -0,0 +1,22 @@
+"""多进程部署配置（需自行安装 gunicorn）。
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+preload_app 使主进程先导入应用，when_ready 在 fork worker 之前预热重量级依赖，
+各 worker 共享这些只读模块，启动更快、内存占用更低。
+线程不会随 fork 复制：日志的后台写入线程由 app.utils.logging 注册的 fork 钩子在每个 worker 中重新启动，
+其余后台任务都在 worker 的 lifespan 中启动。
+"""
+
+import os
+
+from app.utils.prewarm import preload_before_fork
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+
+def when_ready(server):
+    preload_before_fork()
@@ -0,0 +1,29 @@
+import { NextRequest } from "next/server";
+
+// Backend file API endpoint
+const backendUrl =
+  process.env.BACKENDURL?.replace(/\/chat\/?$/, "/files") ||
+  "http://127.0.0.1:8000/api/files";
+
+/**
+ * GET handler that streams a stored attachment from the backend.
+ * @param _req - Next.js request object
+ * @param context - Route params with the attachment id
+ * @returns Attachment content
+ */
+export async function GET(
+  _req: NextRequest,
+  context: { params: Promise<{ id: string }> },
+) {
+  const { id } = await context.params;
+  const backendResponse = await fetch(`${backendUrl}/${id}`);
+  return new Response(backendResponse.body, {
+    status: backendResponse.status,
+    headers: {
+      "Content-Type":
+        backendResponse.headers.get("Content-Type") ||
+        "application/octet-stream",
+      "Cache-Control": "public, max-age=31536000, immutable",
+    },
+  });
+}
@@ -0,0 +1,34 @@
+import { NextRequest } from "next/server";
+
+// Backend file API endpoint
+const backendUrl =
+  process.env.BACKENDURL?.replace(/\/chat\/?$/, "/files") ||
+  "http://127.0.0.1:8000/api/files";
+
+/**
+ * POST handler that streams an attachment upload to the backend blob store.
+ * The request body is forwarded as-is without buffering it in memory.
+ * @param req - Next.js request object
+ * @returns Attachment reference from backend
+ */
+export async function POST(req: NextRequest) {
+  try {
+    const backendResponse = await fetch(`${backendUrl}/${req.nextUrl.search}`, {
+      method: "POST",
+      headers: {
+        "Content-Type":
+          req.headers.get("Content-Type") || "application/octet-stream",
+      },
+      body: req.body,
+      // @ts-expect-error duplex is required for streaming request bodies
+      duplex: "half",
+    });
+    return new Response(backendResponse.body, {
+      status: backendResponse.status,
+      headers: { "Content-Type": "application/json" },
+    });
+  } catch (error) {
+    console.error("File upload error:", error);
+    return new Response("Internal server error", { status: 500 });
+  }
+}
@@ -31,6 +31,7 @@ import {
 import { Action, Actions } from "@/components/ai-elements/actions";
 import { Fragment, useState } from "react";
 import { useChat } from "@ai-sdk/react";
+import { DefaultChatTransport, type FileUIPart } from "ai";
 import { Response } from "@/components/ai-elements/response";
 import { CopyIcon, GlobeIcon, RefreshCcwIcon } from "lucide-react";
 import {
@@ -69,11 +70,48 @@ const models = [
     },
 ];
 
+// 附件先流式上传到后端，消息中只携带引用，避免在请求体中内联base64
+const uploadFile = async (file: FileUIPart): Promise<FileUIPart> => {
+    if (!file.url.startsWith("data:") && !file.url.startsWith("blob:")) {
+        return file;
+    }
+    const content = await (await fetch(file.url)).blob();
+    const params = new URLSearchParams(
+        file.filename ? { filename: file.filename } : {},
+    );
+    const response = await fetch(`/api/files?${params}`, {
+        method: "POST",
+        headers: { "Content-Type": file.mediaType },
+        body: content,
+    });
+    if (!response.ok) {
+        console.error("Failed to upload attachment:", await response.text());
+        return file;
+    }
+    const { url } = await response.json();
+    return { ...file, url };
+};
+
 const ChatBot = () => {
     const [input, setInput] = useState("");
     const [model, setModel] = useState<string>(models[0].value);
     const [webSearch, setWebSearch] = useState(false);
     const { messages, sendMessage, status, regenerate } = useChat({
+        // 只上传新消息，对话历史以服务端为准
+        transport: new DefaultChatTransport({
+            prepareSendMessagesRequest: ({ id, messages, trigger, body }) => ({
+                body: {
+                    ...body,
+                    id,
+                    trigger,
+                    message: messages[messages.length - 1],
+                    lastMessageId:
+                        messages.length > 1
+                            ? messages[messages.length - 2].id
+                            : null,
+                },
+            }),
+        }),
         onError: (err: Error) => {
             console.error("useChat encountered an error:", err);
         },
@@ -99,7 +137,7 @@ const ChatBot = () => {
         },
     });
 
-    const handleSubmit = (message: PromptInputMessage) => {
+    const handleSubmit = async (message: PromptInputMessage) => {
         const hasText = Boolean(message.text);
         const hasAttachments = Boolean(message.files?.length);
 
@@ -107,10 +145,14 @@ const ChatBot = () => {
             return;
         }
 
+        const files = message.files
+            ? await Promise.all(message.files.map(uploadFile))
+            : undefined;
+
         sendMessage(
             {
                 text: message.text || "Sent with attachments",
-                files: message.files,
+                files,
             },
             {
                 body: {
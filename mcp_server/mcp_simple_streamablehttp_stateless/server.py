@@ -1,70 +1,230 @@
 import contextlib
+import contextvars
+import json
 import logging
+import os
+import time
 from collections.abc import AsyncIterator
+from dataclasses import dataclass
 from typing import Any
 
 import anyio
 import click
+import jsonschema
 import mcp.types as types
-from mcp.server.lowlevel import Server
+from mcp.server.lowlevel import NotificationOptions, Server
+from mcp.server.models import InitializationOptions
 from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
 from starlette.applications import Starlette
 from starlette.middleware.cors import CORSMiddleware
-from starlette.routing import Mount
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
 from starlette.types import Receive, Scope, Send
 
 logger = logging.getLogger(__name__)
 
+# Worker processes are started by uvicorn from an import string, so the CLI
+# options are handed over through this environment variable.
+CONFIG_ENV = "MCP_STATELESS_SERVER_CONFIG"
 
-@click.command()
-@click.option("--port", default=3000, help="Port to listen on for HTTP")
-@click.option(
-    "--log-level",
-    default="INFO",
-    help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)",
+# Cancel scopes of the tool calls running for the current HTTP request. The
+# stateless session manager starts the server task from the request task, so
+# tool handlers inherit this context.
+request_scopes: contextvars.ContextVar[set[anyio.CancelScope]] = contextvars.ContextVar("request_scopes")
+
+
+@dataclass(frozen=True)
+class ServerConfig:
+    json_response: bool = False
+    debug: bool = False
+    max_concurrency: int = 100
+    max_queue: int = 0
+    max_batch: int = 32
+
+
+class ServerBusyError(Exception):
+    """Raised when a tool's wait queue is full."""
+
+
+class ToolLimiter:
+    """Bounds the number of concurrent calls per tool and records queue metrics.
+
+    Metrics are kept per worker process and exposed on ``/metrics`` in the
+    Prometheus text format with a ``worker`` label.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphores: dict[str, anyio.Semaphore] = {}
+        self.queued: dict[str, int] = {}
+        self.running: dict[str, int] = {}
+        self.wait_seconds: dict[str, float] = {}
+        self.calls: dict[tuple[str, str], int] = {}
+
+    def _count(self, tool: str, status: str) -> None:
+        self.calls[(tool, status)] = self.calls.get((tool, status), 0) + 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tool: str) -> AsyncIterator[None]:
+        """Wait for a free slot for ``tool`` and hold it while the call runs."""
+        if self.max_queue and self.queued.get(tool, 0) >= self.max_queue:
+            self._count(tool, "rejected")
+            raise ServerBusyError(f"Tool {tool} is busy, try again later")
+        semaphore = self._semaphores.get(tool)
+        if semaphore is None and self.max_concurrency:
+            semaphore = self._semaphores[tool] = anyio.Semaphore(self.max_concurrency)
+        start = time.monotonic()
+        self.queued[tool] = self.queued.get(tool, 0) + 1
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+        except BaseException:
+            self._count(tool, "cancelled")
+            raise
+        finally:
+            self.queued[tool] -= 1
+            self.wait_seconds[tool] = self.wait_seconds.get(tool, 0.0) + time.monotonic() - start
+        self.running[tool] = self.running.get(tool, 0) + 1
+        status = "ok"
+        try:
+            yield
+        except anyio.get_cancelled_exc_class():
+            status = "cancelled"
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.running[tool] -= 1
+            self._count(tool, status)
+            if semaphore is not None:
+                semaphore.release()
+
+    def render(self) -> str:
+        worker = os.getpid()
+        tools = sorted(set(self.queued) | set(self.running))
+        lines = [
+            "# HELP mcp_tool_queue_depth Tool calls waiting for a concurrency slot",
+            "# TYPE mcp_tool_queue_depth gauge",
+            *(f'mcp_tool_queue_depth{{worker="{worker}",tool="{t}"}} {self.queued.get(t, 0)}' for t in tools),
+            "# HELP mcp_tool_running Tool calls currently running",
+            "# TYPE mcp_tool_running gauge",
+            *(f'mcp_tool_running{{worker="{worker}",tool="{t}"}} {self.running.get(t, 0)}' for t in tools),
+            "# HELP mcp_tool_queue_wait_seconds_total Total time tool calls spent waiting for a slot",
+            "# TYPE mcp_tool_queue_wait_seconds_total counter",
+            *(
+                f'mcp_tool_queue_wait_seconds_total{{worker="{worker}",tool="{t}"}} {self.wait_seconds.get(t, 0.0)}'
+                for t in tools
+            ),
+            "# HELP mcp_tool_calls_total Finished tool calls by status (ok, error, cancelled, rejected)",
+            "# TYPE mcp_tool_calls_total counter",
+            *(
+                f'mcp_tool_calls_total{{worker="{worker}",tool="{t}",status="{s}"}} {n}'
+                for (t, s), n in sorted(self.calls.items())
+            ),
+            "# HELP mcp_tool_max_concurrency Concurrent calls allowed per tool (0 means unbounded)",
+            "# TYPE mcp_tool_max_concurrency gauge",
+            f'mcp_tool_max_concurrency{{worker="{worker}"}} {self.max_concurrency}',
+        ]
+        return "\n".join(lines) + "\n"
+
+
+NOTIFICATION_TOOL = types.Tool(
+    name="start-notification-stream",
+    description=("Sends a stream of notifications with configurable count and interval"),
+    inputSchema={
+        "type": "object",
+        "required": ["interval", "count", "caller"],
+        "properties": {
+            "interval": {
+                "type": "number",
+                "description": "Interval between notifications in seconds",
+            },
+            "count": {
+                "type": "number",
+                "description": "Number of notifications to send",
+            },
+            "caller": {
+                "type": "string",
+                "description": ("Identifier of the caller to include in notifications"),
+            },
+        },
+    },
 )
-@click.option(
-    "--json-response",
-    is_flag=True,
-    default=False,
-    help="Enable JSON responses instead of SSE streams",
+
+BATCH_TOOL = types.Tool(
+    name="batch-call-tools",
+    description=(
+        "Runs several tool calls concurrently in one request and returns their results in order. "
+        "Clients discover it through the experimental 'toolBatch' capability."
+    ),
+    inputSchema={
+        "type": "object",
+        "required": ["calls"],
+        "properties": {
+            "calls": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "required": ["name"],
+                    "properties": {
+                        "name": {"type": "string"},
+                        "arguments": {"type": "object"},
+                    },
+                },
+            },
+        },
+    },
 )
-def main(
-    port: int,
-    log_level: str,
-    json_response: bool,
-) -> int:
-    # Configure logging
-    logging.basicConfig(
-        level=getattr(logging, log_level.upper()),
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    )
 
-    app = Server("mcp-streamable-http-stateless-demo")
+# Experimental capability advertising the batched tool-call extension:
+# {"tool": <batch tool name>, "maxCalls": <max calls per batch>}
+BATCH_CAPABILITY = "toolBatch"
 
-    @app.call_tool()
-    async def call_tool(name: str, arguments: dict[str, Any]) -> list[types.ContentBlock]:
+
+class BatchingServer(Server):
+    """Low-level server that advertises the batched tool-call extension on initialize."""
+
+    def __init__(self, name: str, max_batch: int) -> None:
+        super().__init__(name)
+        self.max_batch = max_batch
+
+    def create_initialization_options(
+        self,
+        notification_options: NotificationOptions | None = None,
+        experimental_capabilities: dict[str, dict[str, Any]] | None = None,
+    ) -> InitializationOptions:
+        experimental = {BATCH_CAPABILITY: {"tool": BATCH_TOOL.name, "maxCalls": self.max_batch}}
+        return super().create_initialization_options(
+            notification_options, {**experimental, **(experimental_capabilities or {})}
+        )
+
+
+def create_app(config: ServerConfig) -> CORSMiddleware:
+    app = BatchingServer("mcp-streamable-http-stateless-demo", config.max_batch)
+    limiter = ToolLimiter(config.max_concurrency, config.max_queue)
+    tools = {tool.name: tool for tool in (NOTIFICATION_TOOL,)}
+    http_requests: dict[str, int] = {}
+
+    async def notification_stream(name: str, arguments: dict[str, Any]) -> list[types.ContentBlock]:
         ctx = app.request_context
         interval = arguments.get("interval", 1.0)
         count = arguments.get("count", 5)
         caller = arguments.get("caller", "unknown")
 
-        # Send the specified number of notifications with the given interval
-        for i in range(count):
-            # await ctx.session.send_progress_notification(
-            #     progress_token=f"文本{i}",
-            #     progress=i / count,
-            #     total=count,
-            #     message=f"Notification {i + 1}/{count} from caller: {caller}",
-            # )
-            await ctx.session.send_log_message(
-                level="info",
-                data=f"Notification {i + 1}/{count} from caller: {caller}",
-                logger="notification_stream",
-                related_request_id=ctx.request_id,
-            )
-            if i < count - 1:  # Don't wait after the last notification
-                await anyio.sleep(interval)
+        async with limiter.slot(name):
+            # Send the specified number of notifications with the given interval
+            for i in range(count):
+                await ctx.session.send_log_message(
+                    level="info",
+                    data=f"Notification {i + 1}/{count} from caller: {caller}",
+                    logger="notification_stream",
+                    related_request_id=ctx.request_id,
+                )
+                if i < count - 1:  # Don't wait after the last notification
+                    await anyio.sleep(interval)
 
         return [
             types.TextContent(
@@ -73,43 +233,86 @@ def main(
             )
         ]
 
+    async def batch(calls: list[dict[str, Any]]) -> dict[str, Any]:
+        """Run the calls of a batch concurrently; a failing call becomes an error result."""
+        if len(calls) > config.max_batch:
+            raise ValueError(f"Batch has {len(calls)} calls, at most {config.max_batch} are allowed")
+        results: list[dict[str, Any]] = [{} for _ in calls]
+
+        async def run(index: int, call: dict[str, Any]) -> None:
+            name, arguments = call["name"], call.get("arguments") or {}
+            try:
+                tool = tools.get(name)
+                if tool is None:
+                    raise ValueError(f"Unknown tool: {name}")
+                jsonschema.validate(instance=arguments, schema=tool.inputSchema)
+                content = await notification_stream(name, arguments)
+                results[index] = types.CallToolResult(content=content).model_dump(mode="json", exclude_none=True)
+            except Exception as e:
+                error = types.CallToolResult(content=[types.TextContent(type="text", text=str(e))], isError=True)
+                results[index] = error.model_dump(mode="json", exclude_none=True)
+
+        async with anyio.create_task_group() as tg:
+            for index, call in enumerate(calls):
+                tg.start_soon(run, index, call)
+        return {"results": results}
+
+    @app.call_tool()
+    async def call_tool(name: str, arguments: dict[str, Any]) -> Any:
+        scopes = request_scopes.get(None)
+        with anyio.CancelScope() as scope:
+            if scopes is not None:
+                scopes.add(scope)
+            try:
+                if name == BATCH_TOOL.name:
+                    # Structured content only, without the SDK's JSON text copy of it
+                    return [], await batch(arguments["calls"])
+                if name not in tools:
+                    raise ValueError(f"Unknown tool: {name}")
+                return await notification_stream(name, arguments)
+            finally:
+                if scopes is not None:
+                    scopes.discard(scope)
+        # Only reached when the scope was cancelled
+        logger.debug("Client disconnected, cancelled call to %s", name)
+        # The SDK drops the response of a cancelled request instead of writing to the closed stream
+        raise anyio.get_cancelled_exc_class()()
+
     @app.list_tools()
     async def list_tools() -> list[types.Tool]:
-        return [
-            types.Tool(
-                name="start-notification-stream",
-                description=("Sends a stream of notifications with configurable count and interval"),
-                inputSchema={
-                    "type": "object",
-                    "required": ["interval", "count", "caller"],
-                    "properties": {
-                        "interval": {
-                            "type": "number",
-                            "description": "Interval between notifications in seconds",
-                        },
-                        "count": {
-                            "type": "number",
-                            "description": "Number of notifications to send",
-                        },
-                        "caller": {
-                            "type": "string",
-                            "description": ("Identifier of the caller to include in notifications"),
-                        },
-                    },
-                },
-            )
-        ]
+        return [*tools.values(), BATCH_TOOL]
 
     # Create the session manager with true stateless mode
     session_manager = StreamableHTTPSessionManager(
         app=app,
         event_store=None,
-        json_response=json_response,
+        json_response=config.json_response,
         stateless=True,
     )
 
     async def handle_streamable_http(scope: Scope, receive: Receive, send: Send) -> None:
-        await session_manager.handle_request(scope, receive, send)
+        http_requests[scope["method"]] = http_requests.get(scope["method"], 0) + 1
+        scopes: set[anyio.CancelScope] = set()
+        token = request_scopes.set(scopes)
+        try:
+            await session_manager.handle_request(scope, receive, send)
+        finally:
+            request_scopes.reset(token)
+            # The response has ended; tool calls still running lost their client
+            for tool_scope in list(scopes):
+                tool_scope.cancel()
+
+    async def metrics(request: Request) -> PlainTextResponse:
+        worker = os.getpid()
+        lines = [
+            "# HELP mcp_http_requests_total HTTP requests to the MCP endpoint by method",
+            "# TYPE mcp_http_requests_total counter",
+            *(
+                f'mcp_http_requests_total{{worker="{worker}",method="{m}"}} {n}'
+                for m, n in sorted(http_requests.items())
+            ),
+        ]
+        return PlainTextResponse(limiter.render() + "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
     @contextlib.asynccontextmanager
     async def lifespan(app: Starlette) -> AsyncIterator[None]:
@@ -123,24 +326,95 @@ def main(
 
     # Create an ASGI application using the transport
     starlette_app = Starlette(
-        debug=True,
+        debug=config.debug,
         routes=[
             Mount("/mcp", app=handle_streamable_http),
+            Route("/metrics", endpoint=metrics),
         ],
         lifespan=lifespan,
     )
 
     # Wrap ASGI application with CORS middleware to expose Mcp-Session-Id header
     # for browser-based clients (ensures 500 errors get proper CORS headers)
-    starlette_app = CORSMiddleware(
+    return CORSMiddleware(
         starlette_app,
         allow_origins=["*"],  # Allow all origins - adjust as needed for production
         allow_methods=["GET", "POST", "DELETE"],  # MCP streamable HTTP methods
         expose_headers=["Mcp-Session-Id"],
     )
 
+
+def app_from_env() -> CORSMiddleware:
+    """Application factory used by uvicorn in each worker process."""
+    return create_app(ServerConfig(**json.loads(os.environ.get(CONFIG_ENV, "{}"))))
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Host to bind to (use 0.0.0.0 to accept remote connections)")
+@click.option("--port", default=3000, help="Port to listen on for HTTP")
+@click.option(
+    "--workers",
+    default=1,
+    help="Number of worker processes; the server is stateless, so any worker can serve any request",
+)
+@click.option(
+    "--log-level",
+    default="INFO",
+    help="Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)",
+)
+@click.option(
+    "--json-response",
+    is_flag=True,
+    default=False,
+    help="Enable JSON responses instead of SSE streams",
+)
+@click.option("--debug", is_flag=True, default=False, help="Enable Starlette debug tracebacks")
+@click.option(
+    "--max-concurrency",
+    default=100,
+    help="Concurrent calls per tool in each worker; further calls wait in a queue (0 means unbounded)",
+)
+@click.option(
+    "--max-queue",
+    default=0,
+    help="Calls allowed to wait per tool in each worker before new calls are rejected (0 means unbounded)",
+)
+@click.option("--max-batch", default=32, help="Maximum number of calls in one batched tool call")
+def main(
+    host: str,
+    port: int,
+    workers: int,
+    log_level: str,
+    json_response: bool,
+    debug: bool,
+    max_concurrency: int,
+    max_queue: int,
+    max_batch: int,
+) -> int:
+    # Configure logging
+    logging.basicConfig(
+        level=getattr(logging, log_level.upper()),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    config = ServerConfig(
+        json_response=json_response,
+        debug=debug,
+        max_concurrency=max_concurrency,
+        max_queue=max_queue,
+        max_batch=max_batch,
+    )
+    os.environ[CONFIG_ENV] = json.dumps(config.__dict__)
+
     import uvicorn
 
-    uvicorn.run(starlette_app, host="127.0.0.1", port=port)
+    uvicorn.run(
+        "mcp_simple_streamablehttp_stateless.server:app_from_env",
+        factory=True,
+        host=host,
+        port=port,
+        workers=workers,
+        log_level=log_level.lower(),
+    )
 
-    return 0
\ No newline at end of file
+    return 0